@@ -0,0 +1,83 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+"""
+Compare the file size and the load time of the storage formats.
+
+Usage: python -m benchmarks.storage [--items N] [--runs N]
+"""
+from __future__ import annotations
+import argparse
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from ya3_collect import dataframe, storage
+
+
+DAY = date(2022, 1, 1)
+
+
+def _make_runs(n_items: int, n_runs: int) -> list[dataframe.DataFrame]:
+    start = datetime.combine(DAY, datetime.min.time())
+    return [
+        dataframe.DataFrame.new().add_records(
+            dataframe.Record(
+                aID=f"x{1000000000 + i}",
+                title=f"出品中の商品のタイトル {i} " * 3,
+                datetime=start + timedelta(minutes=5 * run),
+                access=run * 3 + i,
+                watch=run // 10 + i % 7,
+                bid=run // 50,
+            )
+            for i in range(n_items)
+        )
+        for run in range(n_runs)
+    ]
+
+
+def _size(path: Path) -> int:
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    return path.stat().st_size
+
+
+def _measure(func: object, repeat: int = 5) -> float:
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()  # type: ignore
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=300, help="number of selling items")
+    parser.add_argument("--runs", type=int, default=288, help="number of runs in a day")
+    args = parser.parse_args()
+    runs = _make_runs(args.items, args.runs)
+    print(f"{args.items} items x {args.runs} runs = {args.items * args.runs} rows")
+    whole = dataframe.DataFrame(pd.concat(runs, ignore_index=True))
+    start = datetime.combine(DAY, datetime.min.time()) + timedelta(hours=12)
+    print(f"{'format':<10}{'write':<8}{'size [KiB]':>12}{'load [s]':>12}{'2 columns, 1 hour [s]':>24}")
+    for format in storage.FORMATS:
+        for mode in ("append", "write"):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                store = storage.get_storage(format, Path(tmpdir))
+                if mode == "append":
+                    for df in runs:
+                        path = store.append(df, DAY)
+                else:
+                    path = store.write(whole, DAY)
+                load = _measure(lambda: store.read(DAY))
+                partial = _measure(
+                    lambda: store.read(DAY, columns=["aID", "access"], start=start, end=start + timedelta(hours=1))
+                )
+                size = _size(path)
+            print(f"{format:<10}{mode:<8}{size / 1024:>12.1f}{load:>12.4f}{partial:>24.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+"""
+Measure the collector against a local stand-in of Yahoo! Auctions and compare the results with a baseline.
+
+Usage: python -m benchmarks.suite [--quick] [--latency SEC] [--error-rate P] [--tolerance R] [--update-baseline]
+"""
+from __future__ import annotations
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from datetime import datetime, timedelta
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any, Callable, Iterator
+from unittest import mock
+
+import bs4
+from click.testing import CliRunner
+
+from tests import server
+from ya3_collect import cli, dataframe, transport, yahoo_auction
+
+
+BASELINE = Path(__file__).with_name("baseline.json")
+GET_INFOS_ITEMS = (100, 1000, 10000)
+CLI_RUN_ITEMS = 1000
+
+
+def _serve(options: dict[str, Any], conn: Connection) -> None:
+    with server.StandInServer(**options) as standin:
+        conn.send(standin.selling_url)
+        conn.recv()
+
+
+@contextlib.contextmanager
+def _standin(**options: Any) -> Iterator[str]:
+    """
+    Run the stand-in server in another process, so that it does not compete with the collector for the GIL.
+    """
+    conn, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(options, child), daemon=True)
+    process.start()
+    try:
+        selling_url: str = conn.recv()
+        with mock.patch("ya3_collect.yahoo_auction.SELLING_URL", selling_url):
+            yield selling_url
+    finally:
+        conn.send(None)
+        process.join(10)
+
+
+def _best(func: Callable[[], object], repeat: int) -> float:
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def bench_get_infos(n_items: int, latency: float, error_rate: float, repeat: int) -> float:
+    with _standin(n_items=n_items, latency=latency, error_rate=error_rate):
+        def run() -> None:
+            with transport.Transport({}, backoff_factor=0.01) as client:
+                infos = yahoo_auction.get_infos({}, client=client)
+            assert len(infos) == n_items, f"{len(infos)} of {n_items} items are collected"
+        return _best(run, repeat)
+
+
+def bench_from_soup(repeat: int) -> float:
+    soup = bs4.BeautifulSoup(server.ITEM_PAGE, "lxml")
+    n = 100
+    return _best(lambda: [yahoo_auction.SellingItemInfo.from_soup(soup) for _ in range(n)], repeat) / n
+
+
+def bench_parse_item_page(repeat: int, fast: bool) -> float:
+    n = 100
+    return _best(lambda: [yahoo_auction.parse_item_page(server.ITEM_PAGE, fast) for _ in range(n)], repeat) / n
+
+
+def _records(n: int) -> list[dataframe.Record]:
+    start = datetime(2022, 1, 1)
+    return [
+        dataframe.Record(
+            aID=f"x{1000000000 + i % 1000}",
+            title=f"title {i % 1000}",
+            datetime=start + timedelta(minutes=5 * (i // 1000)),
+            access=i,
+            watch=i % 7,
+            bid=i % 3
+        )
+        for i in range(n)
+    ]
+
+
+def bench_add_record(n: int, repeat: int) -> float:
+    records = _records(n)
+
+    def run() -> None:
+        df = dataframe.DataFrame.new()
+        for record in records:
+            df = df.add_record(record)
+    return _best(run, repeat)
+
+
+def bench_add_records(n: int, repeat: int) -> float:
+    records = _records(n)
+    return _best(lambda: dataframe.DataFrame.new().add_records(records), repeat)
+
+
+def bench_record_batch(n: int, repeat: int) -> float:
+    start = datetime(2022, 1, 1)
+    infos = [
+        yahoo_auction.SellingItemInfo(
+            f"x{i}", f"title {i % 1000}", "seller", 1, start, start, False, 1000, 0, i % 3, i, i % 7
+        )
+        for i in range(n)
+    ]
+    return _best(lambda: dataframe.RecordBatch.from_infos(infos, start).to_frame(), repeat)
+
+
+def bench_cli_run(n_items: int, latency: float, error_rate: float, repeat: int, args: list[str]) -> float:
+    with _standin(n_items=n_items, latency=latency, error_rate=error_rate), tempfile.TemporaryDirectory() as tmpdir:
+        cookies = Path(tmpdir) / "cookies.json"
+        cookies.write_text("[]")
+
+        def run() -> None:
+            with mock.patch("ya3_collect.cli.COOKIES_FILE", str(cookies)):
+                result = CliRunner().invoke(cli.main, ["run", "--data-dir", tmpdir, *args], catch_exceptions=False)
+            assert result.exit_code == 0, result.output
+        return _best(run, repeat)
+
+
+def run_suite(quick: bool, latency: float, error_rate: float, repeat: int) -> dict[str, float]:
+    """
+    Run the benchmarks, returning the seconds of each case. Lower is better in every case.
+    """
+    results: dict[str, float] = {}
+    # The cases with the stand-in are named with the injected latency and errors, to be compared only to the same.
+    injected = f",latency={latency:g},error_rate={error_rate:g}" if latency or error_rate else ""
+    for n_items in GET_INFOS_ITEMS:
+        if quick and n_items > 1000:
+            continue
+        results[f"get_infos[{n_items}]{injected}"] = bench_get_infos(
+            n_items, latency, error_rate, 1 if n_items > 1000 else repeat
+        )
+    results["from_soup"] = bench_from_soup(repeat)
+    results["parse_item_page"] = bench_parse_item_page(repeat, False)
+    results["parse_item_page,fast"] = bench_parse_item_page(repeat, True)
+    results["add_record[1000]"] = bench_add_record(1000, 1)
+    results["add_records[100000]"] = bench_add_records(100000, repeat)
+    results["record_batch[100000]"] = bench_record_batch(100000, repeat)
+    for layout in ("wide", "normalized"):
+        results[f"cli_run[{CLI_RUN_ITEMS}],{layout}{injected}"] = bench_cli_run(
+            CLI_RUN_ITEMS, latency, error_rate, repeat, ["--layout", layout]
+        )
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    """
+    Names of the cases which are slower than `1 + tolerance` times the baseline.
+    """
+    return [
+        name for name, seconds in results.items()
+        if name in baseline and seconds > baseline[name] * (1 + tolerance)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--quick", action="store_true", help="skip the cases of 10k items")
+    parser.add_argument("--latency", type=float, default=0, help="latency of each response of the stand-in")
+    parser.add_argument("--error-rate", type=float, default=0, help="probability of a response to be 503")
+    parser.add_argument("--repeat", type=int, default=3, help="number of the runs of each case, the best is taken")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown from the baseline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE, help="JSON file of the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the baseline")
+    args = parser.parse_args()
+    results = run_suite(args.quick, args.latency, args.error_rate, args.repeat)
+    baseline: dict[str, float] = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    print(f"{'case':<56}{'result [s]':>14}{'baseline [s]':>14}{'ratio':>8}")
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        ratio = f"{seconds / base:>8.2f}" if base else f"{'-':>8}"
+        print(f"{name:<56}{seconds:>14.6f}{base or float('nan'):>14.6f}{ratio}")
+    if args.update_baseline:
+        updated = {**baseline, **{name: round(seconds, 6) for name, seconds in results.items()}}
+        args.baseline.write_text(json.dumps(updated, indent=2) + "\n")
+        print(f"The baseline is saved as {args.baseline}")
+        return
+    if regressed := compare(results, baseline, args.tolerance):
+        print(f"Regressed past the baseline by more than {args.tolerance:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from typing import TYPE_CHECKING
+from unittest import TestCase
+
+
+# Base of the mixins of the tests shared by several `TestCase`s, which are not collected as tests themselves.
+if TYPE_CHECKING:
+    TestMixin = TestCase
+else:
+    TestMixin = object
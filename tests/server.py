@@ -0,0 +1,145 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import time
+import random
+import hashlib
+import threading
+from http import server
+from types import TracebackType
+from typing import Optional
+from urllib import parse
+
+
+with open("tests/test_yahoo_auction.html", "rb") as f:
+    ITEM_PAGE = f.read()
+ITEM_PAGE_AID = "1000000000"
+
+
+class _Handler(server.BaseHTTPRequestHandler):
+    server: _Server
+
+    def do_GET(self) -> None:
+        standin = self.server.standin
+        standin.paths.append(self.path)
+        standin.cookies.append(self.headers.get("Cookie", ""))
+        if standin.latency > 0:
+            time.sleep(standin.latency)
+        url = parse.urlsplit(self.path)
+        if standin.inject_error():
+            self.send_response(standin.error_status)
+            if standin.retry_after:
+                self.send_header("Retry-After", str(standin.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif url.path == "/mystatus":
+            page = int(parse.parse_qs(url.query).get("apg", ["1"])[0])
+            self._send(self.server.standin.listing_page(page))
+        elif url.path.startswith("/item/"):
+            self._send(self.server.standin.item_page(url.path[len("/item/"):]))
+        else:
+            self.send_error(404)
+
+    def _send(self, content: bytes) -> None:
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+class _Server(server.ThreadingHTTPServer):
+    daemon_threads = True
+    standin: StandInServer
+
+
+class StandInServer:
+    """
+    Local stand-in of Yahoo! Auctions.
+
+    It serves `n_items` item pages generated from `tests/test_yahoo_auction.html`,
+    whose aIDs are `aids`, and the listing pages of them with `page_size` items per page.
+    The listing pages show the total number of the items if `show_total`.
+    Each response is delayed by `latency` seconds, and a request fails with `error_status` at the probability of
+    `error_rate`, drawn from a random generator seeded with `seed`.
+    The failed responses ask to retry after `retry_after` seconds if given.
+    The pages have an `ETag` of their content and are answered 304 to a request with the same `If-None-Match`.
+    The paths and the cookies of the requests are recorded in `paths` and `cookies`.
+    """
+
+    def __init__(
+        self,
+        n_items: int = 3,
+        page_size: int = 50,
+        show_total: bool = True,
+        latency: float = 0,
+        error_rate: float = 0,
+        seed: int = 0,
+        error_status: int = 503,
+        retry_after: int = 0
+    ) -> None:
+        self.n_items = n_items
+        self.page_size = page_size
+        self.show_total = show_total
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.paths: list[str] = []
+        self.cookies: list[str] = []
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.aids = [str(int(ITEM_PAGE_AID) + i) for i in range(n_items)]
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.standin = self
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self.selling_url = f"{self.url}/mystatus?select=selling"
+
+    def __enter__(self) -> StandInServer:
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def inject_error(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            if self._random.random() >= self.error_rate:
+                return False
+            self.errors += 1
+            return True
+
+    def item_page(self, aid: str) -> bytes:
+        return ITEM_PAGE.replace(ITEM_PAGE_AID.encode(), aid.encode())
+
+    def listing_page(self, page: int) -> bytes:
+        start = (page - 1) * self.page_size
+        links = [
+            f'<a href="{self.url}/item/{aid}" data-ylk="rsec:itm;slk:tc;pos:{i + 1}">{aid}</a>'
+            for i, aid in enumerate(self.aids[start:start + self.page_size])
+        ]
+        if self.show_total:
+            links.insert(0, f"<p>全{self.n_items:,}件</p>")
+        if start + self.page_size < self.n_items:
+            links.append(
+                f'<a href="{self.selling_url}&apg={page + 1}" data-ylk="rsec:pagination;slk:next;pos:1">next</a>'
+            )
+        return f"<html><body>{''.join(links)}</body></html>".encode()
@@ -0,0 +1,130 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import math
+import tempfile
+import importlib.util
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import TestCase, skipUnless
+
+import pandas as pd
+
+from tests import TestMixin
+from ya3_collect import analytics, compaction, dataframe, storage
+
+
+START = datetime(2022, 1, 1, 22, 0)
+RECORDS = [
+    dataframe.Record(
+        aID=f"x{i}",
+        title=f"title{i}",
+        datetime=START + timedelta(minutes=30 * k),
+        access=10 * k * (i + 1),
+        watch=k,
+        bid=i
+    )
+    for k in range(8) for i in range(3)
+]
+
+
+def _write(store: storage.Storage, records: list[dataframe.Record]) -> None:
+    df = dataframe.DataFrame.new().add_records(records)
+    for day, part in df.groupby(df["datetime"].dt.date):
+        store.append(dataframe.DataFrame(part.reset_index(drop=True)), day)
+
+
+class Test_deltas(TestCase):
+
+    def test_default(self) -> None:
+        snapshots = dataframe.DataFrame.new().add_records(reversed(RECORDS))[dataframe.SNAPSHOT_COLUMNS]
+        df = analytics.deltas(snapshots)
+        self.assertEqual(list(df["aID"]), [f"x{i}" for i in range(3) for _ in range(8)])
+        x1 = df[df["aID"] == "x1"]
+        self.assertTrue(math.isnan(x1["access_delta"].iloc[0]))
+        self.assertEqual(list(x1["access_delta"].iloc[1:]), [20] * 7)
+        self.assertEqual(list(x1["elapsed"].iloc[1:]), [1800] * 7)
+        self.assertEqual(list(x1["bid_delta"].iloc[1:]), [0] * 7)
+
+    def test_last(self) -> None:
+        snapshots = dataframe.DataFrame.new().add_records(RECORDS)[dataframe.SNAPSHOT_COLUMNS]
+        first, rest = snapshots.iloc[:3], snapshots.iloc[3:]
+        df = analytics.deltas(rest, last=first)
+        self.assertEqual(len(df), len(rest))
+        self.assertEqual(list(df[df["aID"] == "x0"]["access_delta"]), [10] * 7)
+
+
+class Test_rollup(TestCase):
+
+    def setUp(self) -> None:
+        snapshots = dataframe.DataFrame.new().add_records(RECORDS)[dataframe.SNAPSHOT_COLUMNS]
+        self.changes = analytics.deltas(snapshots)
+
+    def test_hourly(self) -> None:
+        df = analytics.rollup(self.changes, "hourly")
+        self.assertIsInstance(df, dataframe.RollupFrame)
+        self.assertEqual(len(df), 3 * 4)
+        x2 = df[df["aID"] == "x2"]
+        self.assertEqual(list(x2["count"]), [2] * 4)
+        self.assertEqual(list(x2["access"]), [30, 90, 150, 210])
+        self.assertEqual(list(x2["access_delta"]), [30, 60, 60, 60])
+
+    def test_daily(self) -> None:
+        df = analytics.rollup(self.changes, "daily")
+        self.assertEqual(list(df["datetime"].dt.day), [1, 2] * 3)
+        self.assertEqual(list(df[df["aID"] == "x0"]["access_delta"]), [30, 40])
+
+    def test_top_movers(self) -> None:
+        df = analytics.top_movers(analytics.rollup(self.changes, "hourly"), "access", 2)
+        self.assertEqual(list(df["aID"]), ["x2", "x1"])
+        self.assertEqual(list(df["increase"]), [210, 140])
+        self.assertEqual(list(df["latest"]), [210, 140])
+        self.assertEqual(list(df["snapshots"]), [8, 8])
+
+
+class _RollupsTests(TestMixin):
+    format: str
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.data_dir = Path(tmpdir.name)
+        self.store = storage.get_storage(self.format, self.data_dir)
+
+    def test_incremental(self) -> None:
+        rollups = analytics.Rollups(self.data_dir, self.format)
+        _write(self.store, RECORDS[:9])
+        self.assertEqual(rollups.update(), 9)
+        _write(self.store, RECORDS[9:])
+        self.assertEqual(rollups.update(), 15)
+        self.assertEqual(rollups.update(), 0)
+        hourly, daily = rollups.read("hourly"), rollups.read("daily")
+        self.assertEqual(rollups.rebuild(), 24)
+        pd.testing.assert_frame_equal(hourly, rollups.read("hourly"))
+        pd.testing.assert_frame_equal(daily, rollups.read("daily"))
+        self.assertEqual(len(rollups.read("hourly", start=datetime(2022, 1, 2))), 6)
+
+    def test_compacted(self) -> None:
+        _write(self.store, RECORDS)
+        rollups = analytics.Rollups(self.data_dir, self.format)
+        self.assertEqual(rollups.update(), 24)
+        hourly = rollups.read("hourly")
+        compaction.compact(self.store, remove=True)
+        self.assertEqual(self.store.days(), [])
+        self.assertEqual(rollups.rebuild(), 24)
+        pd.testing.assert_frame_equal(rollups.read("hourly"), hourly)
+
+    def test_normalized(self) -> None:
+        store = storage.get_storage(self.format, self.data_dir / storage.SNAPSHOTS, dataframe.SnapshotFrame)
+        df = dataframe.DataFrame.new().add_records(RECORDS)
+        store.append(dataframe.SnapshotFrame(df[dataframe.SNAPSHOT_COLUMNS]), START.date())
+        rollups = analytics.Rollups(self.data_dir, self.format, "normalized")
+        self.assertEqual(rollups.update(), 24)
+        self.assertEqual(len(rollups.read("daily")), 6)
+
+
+class TestRollups_csvgz(_RollupsTests, TestCase):
+    format = "csv.gz"
+
+
+@skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class TestRollups_parquet(_RollupsTests, TestCase):
+    format = "parquet"
@@ -0,0 +1,56 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import tempfile
+from datetime import date, datetime
+from pathlib import Path
+from unittest import TestCase
+
+from ya3_collect import archive
+
+
+STARTED = datetime(2021, 1, 1, 12, 0, 0)
+
+
+class TestWriter(TestCase):
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.archive_dir = Path(tmpdir.name)
+
+    def test_round_trip(self) -> None:
+        pages = {f"{10000000 + i}": f"<html>{i}</html>".encode() * 100 for i in range(3)}
+        with archive.Writer(self.archive_dir, STARTED) as writer:
+            for aID, content in pages.items():
+                writer.add(aID, f"https://example.com/{aID}", content, fetched=STARTED)
+        self.assertEqual(writer.path, self.archive_dir / "2021-01-01" / "2021-01-01T12-00-00.pages.gz")
+        self.assertLess(writer.path.stat().st_size, sum(len(content) for content in pages.values()))
+        reader = archive.Reader(writer.path)
+        self.assertEqual(reader.started, STARTED)
+        entries = list(reader.entries())
+        self.assertEqual([entry.aID for entry in entries], list(pages))
+        self.assertEqual(entries[0].url, "https://example.com/10000000")
+        self.assertEqual(entries[0].fetched, STARTED)
+        self.assertEqual({entry.aID: reader.read(entry) for entry in entries}, pages)
+
+    def test_append_only(self) -> None:
+        with archive.Writer(self.archive_dir, STARTED) as writer:
+            writer.add("1", "https://example.com/1", b"1")
+        content = writer.path.read_bytes()
+        with archive.Writer(self.archive_dir, STARTED) as writer:
+            writer.add("2", "https://example.com/2", b"2")
+        self.assertTrue(writer.path.read_bytes().startswith(content))
+        reader = archive.Reader(writer.path)
+        self.assertEqual([reader.read(entry) for entry in reader.entries()], [b"1", b"2"])
+
+
+class Test_paths(TestCase):
+
+    def test_days(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            runs = [datetime(2021, 1, 2), datetime(2021, 1, 1, 12), datetime(2021, 1, 1)]
+            for started in runs:
+                archive.Writer(Path(tmpdir), started).close()
+            self.assertEqual(
+                [archive.Reader(path).started for path in archive.paths(Path(tmpdir))], sorted(runs)
+            )
+            self.assertEqual(len(archive.paths(Path(tmpdir), [date(2021, 1, 1)])), 2)
@@ -0,0 +1,284 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import sys
+import json
+import tempfile
+import subprocess
+from datetime import date, datetime
+from pathlib import Path
+from unittest import TestCase, mock
+
+import click
+import pandas as pd
+from click.testing import CliRunner
+
+from tests import server
+from ya3_collect import cli, dataframe, delta, journal, storage, workqueue, yahoo_auction
+
+
+HEAVY_MODULES = ["pandas", "numpy", "bs4", "lxml", "requests", "asyncio"]
+IMPORT_TIME_BUDGET = 0.25  # seconds, importing pandas alone takes longer
+
+
+def _import_time(module: str) -> tuple[float, set[str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    cumulative = 0.0
+    imported: set[str] = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, us, name = line.split("|")
+        imported.add(name.strip())
+        if name.strip() == module:
+            cumulative = int(us) / 1e6
+    return cumulative, imported
+
+
+class TestImportTime(TestCase):
+
+    def test_heavy_modules(self) -> None:
+        _, imported = _import_time("ya3_collect.cli")
+        self.assertEqual([module for module in HEAVY_MODULES if module in imported], [])
+
+    def test_budget(self) -> None:
+        elapsed = min(_import_time("ya3_collect.cli")[0] for _ in range(3))
+        self.assertLess(elapsed, IMPORT_TIME_BUDGET)
+
+
+class Test_run(TestCase):
+
+    def test_append_csv(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=3) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                mock.patch("ya3_collect.cli.COOKIES_FILE", str(Path(tmpdir) / "cookies.json")):
+            with open(cli.COOKIES_FILE, "w") as f:
+                json.dump([{"name": "name", "value": "value"}], f)
+            for _ in range(2):
+                result = CliRunner().invoke(cli.main, ["run", "--data-dir", tmpdir], catch_exceptions=False)
+                self.assertEqual(result.exit_code, 0)
+            files = list(Path(tmpdir).glob("*.csv.gz"))
+            self.assertEqual(len(files), 1)
+            df = dataframe.DataFrame.read_csv(files[0])
+        self.assertEqual(sorted(df["aID"]), sorted(standin.aids * 2))
+
+    def test_delta(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=3) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                mock.patch("ya3_collect.cli.COOKIES_FILE", str(Path(tmpdir) / "cookies.json")):
+            with open(cli.COOKIES_FILE, "w") as f:
+                json.dump([{"name": "name", "value": "value"}], f)
+            for minutes in range(2):
+                with mock.patch.object(cli, "datetime", mock.Mock(now=lambda: datetime(2022, 1, 1, 0, minutes))):
+                    result = CliRunner().invoke(
+                        cli.main, ["run", "--data-dir", tmpdir, "--encoding", "delta"], catch_exceptions=False
+                    )
+                self.assertEqual(result.exit_code, 0)
+            store = storage.get_storage("csv.gz", Path(tmpdir))
+            day = store.days()[0]
+            self.assertEqual(len(store.read(day)), 3)
+            df = delta.read(store, day)
+        self.assertEqual(sorted(df["aID"]), sorted(standin.aids * 2))
+
+    def test_fast_parse(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=3) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                mock.patch("ya3_collect.cli.COOKIES_FILE", str(Path(tmpdir) / "cookies.json")):
+            with open(cli.COOKIES_FILE, "w") as f:
+                json.dump([{"name": "name", "value": "value"}], f)
+            result = CliRunner().invoke(
+                cli.main, ["run", "--data-dir", tmpdir, "--fast-parse", "--layout", "normalized"]
+            )
+            self.assertEqual(result.exit_code, 2)
+            result = CliRunner().invoke(
+                cli.main, ["run", "--data-dir", tmpdir, "--fast-parse", "--validate-fast-parse", "1"],
+                catch_exceptions=False
+            )
+            self.assertEqual(result.exit_code, 0)
+            df = dataframe.DataFrame.read_csv(next(Path(tmpdir).glob("*.csv.gz")))
+        self.assertEqual(sorted(df["aID"]), sorted(standin.aids))
+
+    def test_http_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=3) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                mock.patch("ya3_collect.cli.COOKIES_FILE", str(Path(tmpdir) / "cookies.json")):
+            with open(cli.COOKIES_FILE, "w") as f:
+                json.dump([{"name": "name", "value": "value"}], f)
+            cache_dir = str(Path(tmpdir) / "cache")
+            result = CliRunner().invoke(
+                cli.main, ["run", "--data-dir", tmpdir, "--http-cache", cache_dir, "--engine", "async"]
+            )
+            self.assertEqual(result.exit_code, 2)
+            for _ in range(2):
+                with self.assertLogs("ya3_collect", "INFO") as cm:
+                    result = CliRunner().invoke(
+                        cli.main, ["run", "--data-dir", tmpdir, "--http-cache", cache_dir], catch_exceptions=False
+                    )
+                self.assertEqual(result.exit_code, 0)
+            df = dataframe.DataFrame.read_csv(next(Path(tmpdir).glob("*.csv.gz")))
+        self.assertEqual(sorted(df["aID"]), sorted(standin.aids * 2))
+        self.assertIn("HTTP cache: hit rate 100.0% of 4 requests", "\n".join(cm.output))
+
+    def test_resume(self) -> None:
+        started = datetime(2022, 1, 1, 12, 0, 0)
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=3) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                mock.patch("ya3_collect.cli.COOKIES_FILE", str(Path(tmpdir) / "cookies.json")):
+            with open(cli.COOKIES_FILE, "w") as f:
+                json.dump([{"name": "name", "value": "value"}], f)
+            with journal.Journal(Path(tmpdir), started) as interrupted:
+                page = standin.item_page(standin.aids[0])
+                interrupted.add(f"{standin.url}/item/{standin.aids[0]}", yahoo_auction.parse_item_page(page))
+            result = CliRunner().invoke(cli.main, ["run", "--data-dir", tmpdir, "--resume"], catch_exceptions=False)
+            self.assertEqual(result.exit_code, 0)
+            self.assertFalse(journal.path(Path(tmpdir)).exists())
+            self.assertNotIn(f"/item/{standin.aids[0]}", standin.paths)
+            df = storage.get_storage("csv.gz", Path(tmpdir)).read(started.date())
+        self.assertEqual(sorted(df["aID"]), sorted(standin.aids))
+        self.assertEqual(set(df["datetime"]), {started})
+
+    def test_interrupted(self) -> None:
+        started = datetime(2022, 1, 1, 12, 0, 0)
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=3) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                mock.patch("ya3_collect.cli.COOKIES_FILE", str(Path(tmpdir) / "cookies.json")):
+            with open(cli.COOKIES_FILE, "w") as f:
+                json.dump([{"name": "name", "value": "value"}], f)
+            with journal.Journal(Path(tmpdir), started) as interrupted:
+                interrupted.add(f"{standin.url}/item/x", yahoo_auction.parse_item_page(standin.item_page("x")))
+            result = CliRunner().invoke(cli.main, ["run", "--data-dir", tmpdir], catch_exceptions=False)
+            self.assertEqual(result.exit_code, 0)
+            store = storage.get_storage("csv.gz", Path(tmpdir))
+            self.assertEqual(list(store.read(started.date())["aID"]), ["x"])
+            self.assertEqual(len(store.days()), 2)
+
+    def test_accounts(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=3) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url):
+            accounts_dir = Path(tmpdir) / "accounts"
+            accounts_dir.mkdir()
+            for name in ["alice", "bob"]:
+                with open(accounts_dir / f"{name}.json", "w") as f:
+                    json.dump([{"name": "seller", "value": name}], f)
+            result = CliRunner().invoke(
+                cli.main,
+                ["run", "--data-dir", tmpdir, "--accounts", str(accounts_dir), "--rate-limit", "1000"],
+                catch_exceptions=False
+            )
+            self.assertEqual(result.exit_code, 0)
+            aids = {
+                name: sorted(dataframe.DataFrame.read_csv(file)["aID"])
+                for name in ["alice", "bob"] for file in (Path(tmpdir) / name).glob("*.csv.gz")
+            }
+        self.assertEqual(aids, {"alice": sorted(standin.aids), "bob": sorted(standin.aids)})
+        self.assertEqual(set(standin.cookies), {"seller=alice", "seller=bob"})
+
+    def test_accounts_manifest(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = Path(tmpdir) / "accounts.json"
+            manifest.write_text(json.dumps({"alice": "alice.json", "../bob": "/tmp/bob.json"}))
+            with self.assertRaises(click.BadParameter):
+                cli._read_accounts(manifest)
+            manifest.write_text(json.dumps({"alice": "alice.json", "bob": "/tmp/bob.json"}))
+            self.assertEqual(
+                cli._read_accounts(manifest), {"alice": Path(tmpdir) / "alice.json", "bob": Path("/tmp/bob.json")}
+            )
+
+
+class Test_analyze(TestCase):
+
+    def test_default(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = storage.get_storage("csv.gz", Path(tmpdir))
+            store.write(dataframe.DataFrame.new().add_records([
+                dataframe.Record(f"x{i}", "title", datetime(2022, 1, 1, k), 10 * k * i, k, 0)
+                for k in range(3) for i in range(3)
+            ]), date(2022, 1, 1))
+            output = Path(tmpdir) / "daily.csv"
+            result = CliRunner().invoke(
+                cli.main,
+                ["analyze", "--data-dir", tmpdir, "--top", "2", "--freq", "daily", "--output", str(output)],
+                catch_exceptions=False
+            )
+            self.assertEqual(result.exit_code, 0)
+            table = result.output[result.output.index("aID"):].split()
+            self.assertEqual(table[:9], ["aID", "increase", "latest", "snapshots", "x2", "40", "40", "3", "x1"])
+            self.assertEqual(len(pd.read_csv(output)), 3)
+
+
+class Test_compact(TestCase):
+
+    def test_default(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = storage.get_storage("csv.gz", Path(tmpdir))
+            store.write(dataframe.DataFrame.new().add_records([
+                dataframe.Record(f"x{i}", "title", datetime(2022, 1, 1, i), i, 0, 0) for i in range(3)
+            ]), date(2022, 1, 1))
+            result = CliRunner().invoke(
+                cli.main, ["compact", "--data-dir", tmpdir, "--month", "2022-01", "--remove-days"],
+                catch_exceptions=False
+            )
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(store.days(), [])
+            self.assertEqual(len(list((Path(tmpdir) / "compacted").glob("2022-01.*.csv.gz"))), 1)
+
+
+class Test_enqueue(TestCase):
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.data_dir = Path(tmpdir.name)
+        self.queue = str(self.data_dir / workqueue.QUEUE)
+        self.standin = server.StandInServer(n_items=3).__enter__()
+        self.addCleanup(self.standin.__exit__, None, None, None)
+        for patcher in [
+            mock.patch("ya3_collect.yahoo_auction.SELLING_URL", self.standin.selling_url),
+            mock.patch("ya3_collect.cli.COOKIES_FILE", str(self.data_dir / "cookies.json")),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with open(cli.COOKIES_FILE, "w") as f:
+            json.dump([{"name": "name", "value": "value"}], f)
+        self.started = [datetime(2022, 1, 1, hour) for hour in (12, 13, 14)]
+
+    def enqueue(self, *args: str) -> None:
+        result = CliRunner().invoke(cli.main, ["enqueue", "--data-dir", str(self.data_dir), *args])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+    def drain(self, *args: str) -> None:
+        for _ in range(2):
+            result = CliRunner().invoke(
+                cli.main, ["worker", "--queue", self.queue, "--batch-size", "2", "--exit-when-empty", *args]
+            )
+            self.assertEqual(result.exit_code, 0, result.output)
+
+    def test_no_wait(self) -> None:
+        with mock.patch("ya3_collect.cli.datetime", mock.Mock(now=mock.Mock(side_effect=self.started))):
+            self.enqueue("--no-wait")
+            self.assertEqual(list(self.data_dir.glob("*.csv.gz")), [])
+            self.drain()
+            # The finished run is saved by the next `enqueue`, which starts a run of its own.
+            self.enqueue("--no-wait")
+            self.drain()
+            with mock.patch("ya3_collect.cli.time.sleep", side_effect=lambda _: self.drain()):
+                self.enqueue("--poll-interval", "0.1")
+        with workqueue.WorkQueue(Path(self.queue)) as queue:
+            self.assertEqual(queue.runs(), [])
+        df = dataframe.DataFrame.read_csv(next(self.data_dir.glob("*.csv.gz")))
+        self.assertEqual(sorted(df["aID"]), sorted(self.standin.aids * 3))
+        self.assertEqual(sorted(set(df["datetime"])), self.started)
+        self.assertEqual(len([path for path in self.standin.paths if path.startswith("/item/")]), 9)
+
+    def test_worker_fast_parse(self) -> None:
+        # The layout is taken from the run, so the fast parse is not applied to a normalized run.
+        self.enqueue("--no-wait", "--layout", "normalized")
+        with self.assertLogs("ya3_collect.workqueue", "WARNING"):
+            self.drain("--fast-parse")
+        self.enqueue("--no-wait", "--layout", "normalized")
+        items = storage.get_storage("csv.gz", self.data_dir, dataframe.ItemFrame).read(storage.ITEMS)
+        self.assertEqual(sorted(items["aID"]), sorted(self.standin.aids))
+        self.assertEqual(set(items["seller_name"]), {"seller_name"})
+        result = CliRunner().invoke(cli.main, ["worker", "--fast-parse", "--layout", "normalized"])
+        self.assertEqual(result.exit_code, 2)
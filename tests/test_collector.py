@@ -0,0 +1,184 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import dataclasses
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import TestCase, mock
+
+from tests import server
+from ya3_collect import archive, collector, compaction, dataframe, delta, storage
+from ya3_collect.yahoo_auction import SellingItemInfo
+
+
+INFOS = [
+    SellingItemInfo(
+        aID=f"{10000000 + i}",
+        title=f"title{i}",
+        seller_name="seller",
+        stock=1,
+        start_datetime=datetime(2020, 12, 31, 0, 0, 0),
+        end_datetime=datetime(2021, 1, 7, 0, 0, 0),
+        refundable=True,
+        startprice=1000,
+        timeleft=3 * 86400,
+        count_bid=i,
+        count_access=10 + i,
+        count_watch=3 + i
+    )
+    for i in range(3)
+]
+NOW = datetime(2021, 1, 1, 12, 0, 0)
+
+
+class TestCollector(TestCase):
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.data_dir = Path(tmpdir.name)
+
+    def test_buffered_until_flush(self) -> None:
+        collect = collector.Collector(self.data_dir)
+        collect.add(INFOS, NOW)
+        collect.add(INFOS, NOW + timedelta(minutes=10))
+        self.assertEqual(collect.pending, 6)
+        self.assertFalse(collect.store.exists(NOW.date()))
+        self.assertEqual(collect.flush(), [collect.store.path(NOW.date())])
+        self.assertEqual(collect.pending, 0)
+        self.assertEqual(len(collect.store.read(NOW.date())), 6)
+
+    def test_day_rollover(self) -> None:
+        collect = collector.Collector(self.data_dir)
+        collect.add(INFOS, NOW)
+        collect.add(INFOS, NOW + timedelta(days=1))
+        self.assertEqual(collect.pending, 3)
+        self.assertEqual(len(collect.store.read(NOW.date())), 3)
+
+    def test_rewrite(self) -> None:
+        for i in range(2):
+            collect = collector.Collector(self.data_dir, write_mode="rewrite")
+            collect.add(INFOS, NOW + timedelta(minutes=i))
+            collect.flush()
+        collect.add(INFOS, NOW + timedelta(minutes=2))
+        collect.flush()
+        df = collect.store.read(NOW.date())
+        self.assertIsInstance(df, dataframe.DataFrame)
+        self.assertEqual(len(df), 9)
+
+    def test_normalized(self) -> None:
+        collect = collector.Collector(self.data_dir, layout="normalized")
+        collect.add(INFOS, NOW)
+        collect.add([dataclasses.replace(INFOS[0], title="renamed"), *INFOS[1:]], NOW + timedelta(minutes=10))
+        collect.flush()
+        self.assertIsNotNone(collect.item_store)
+        items = collect.item_store.read(storage.ITEMS)  # type: ignore
+        self.assertEqual(list(items["title"]), ["title0", "title1", "title2", "renamed"])
+        snapshots = collect.store.read(NOW.date())
+        self.assertIsInstance(snapshots, dataframe.SnapshotFrame)
+        self.assertEqual(list(snapshots.columns), dataframe.SNAPSHOT_COLUMNS)
+        joined = dataframe.join(snapshots, items)
+        self.assertEqual(list(joined["title"])[3:], ["renamed", "title1", "title2"])
+
+    def test_normalized_partial(self) -> None:
+        collect = collector.Collector(self.data_dir, layout="normalized")
+        partial = [dataclasses.replace(INFOS[2], seller_name="", stock=0, count_access=100)]
+        self.assertEqual(collect.add(INFOS[:2], NOW, partial), 3)
+        collect.flush()
+        self.assertEqual(list(collect.store.read(NOW.date())["access"]), [10, 11, 100])
+        items = collect.item_store.read(storage.ITEMS)  # type: ignore
+        self.assertEqual(list(items["aID"]), [INFOS[0].aID, INFOS[1].aID])
+
+    def test_normalized_existing_items(self) -> None:
+        collect = collector.Collector(self.data_dir, layout="normalized")
+        collect.add(INFOS, NOW)
+        collect.flush()
+        collect = collector.Collector(self.data_dir, layout="normalized")
+        collect.add(INFOS, NOW + timedelta(minutes=10))
+        self.assertEqual(collect.pending, 3)
+
+    def test_invalid_layout(self) -> None:
+        with self.assertRaises(ValueError):
+            collector.Collector(self.data_dir, layout="long")
+
+    def test_delta(self) -> None:
+        changed = [dataclasses.replace(INFOS[0], count_access=100), *INFOS[1:]]
+        collect = collector.Collector(self.data_dir, encoding="delta", keyframe_interval=timedelta(hours=1))
+        self.assertEqual(collect.add(INFOS, NOW), 3)
+        collect.flush()
+        for minutes in (10, 20):
+            collect = collector.Collector(self.data_dir, encoding="delta", keyframe_interval=timedelta(hours=1))
+            self.assertEqual(collect.add(changed, NOW + timedelta(minutes=minutes)), 3)
+            collect.flush()
+        self.assertEqual(len(collect.store.read(NOW.date())), 4)
+        self.assertEqual(len(delta.read_runs(collect.store, NOW.date())), 3)
+        df = delta.read(collect.store, NOW.date())
+        self.assertIsInstance(df, dataframe.DataFrame)
+        self.assertEqual(list(df["access"]), [10, 11, 12, 100, 11, 12, 100, 11, 12])
+
+    def test_delta_state(self) -> None:
+        changed = [dataclasses.replace(INFOS[0], count_access=100), *INFOS[1:]]
+        for minutes, infos in enumerate([INFOS, changed, INFOS, INFOS]):
+            collect = collector.Collector(self.data_dir, encoding="delta", keyframe_interval=timedelta(hours=1))
+            if minutes == 3:
+                collect.store.state_path(NOW.date()).unlink()
+            with mock.patch.object(collect.store, "read", wraps=collect.store.read) as read_mock:
+                collect.add(infos, NOW + timedelta(minutes=minutes))
+            self.assertEqual(read_mock.called, minutes == 3)
+            collect.flush()
+        self.assertTrue(collect.store.state_path(NOW.date()).exists())
+        df = delta.read(collect.store, NOW.date())
+        self.assertEqual(list(df["access"]), [10, 11, 12, 100, 11, 12] + [10, 11, 12] * 2)
+        self.assertEqual(len(collect.store.read(NOW.date())), 5)
+        collect.store.remove(NOW.date())
+        self.assertFalse(collect.store.state_path(NOW.date()).exists())
+
+    def test_invalid_encoding(self) -> None:
+        with self.assertRaises(ValueError):
+            collector.Collector(self.data_dir, encoding="sparse")
+
+    def test_day(self) -> None:
+        collect = collector.Collector(self.data_dir)
+        self.assertIsNone(collect.day)
+        collect.add(INFOS, NOW)
+        self.assertEqual(collect.day, date(2021, 1, 1))
+
+
+class Test_reparse(TestCase):
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.archive_dir = Path(tmpdir.name) / "archive"
+        self.data_dir = Path(tmpdir.name) / "data"
+        self.aids = [f"{10000000 + i}" for i in range(3)]
+        for minutes in (0, 10):
+            with archive.Writer(self.archive_dir, NOW + timedelta(minutes=minutes)) as writer:
+                for aid in self.aids:
+                    page = server.ITEM_PAGE.replace(server.ITEM_PAGE_AID.encode(), aid.encode())
+                    writer.add(aid, f"https://example.com/{aid}", page)
+
+    def test_wide(self) -> None:
+        collect = collector.Collector(self.data_dir)
+        collect.add(INFOS, NOW)
+        collect.flush()
+        count = collector.reparse(self.archive_dir, collector.Collector(self.data_dir), workers=2)
+        self.assertEqual(count, 6)
+        df = collect.store.read(NOW.date())
+        self.assertEqual(list(df["aID"]), self.aids * 2)
+        self.assertEqual(sorted(set(df["datetime"])), [NOW, NOW + timedelta(minutes=10)])
+
+    def test_compacted(self) -> None:
+        collect = collector.Collector(self.data_dir)
+        collect.add(INFOS, NOW)
+        collect.flush()
+        compaction.compact(collect.store, [NOW.date()], remove=True)
+        collector.reparse(self.archive_dir, collector.Collector(self.data_dir), workers=2)
+        self.assertEqual(compaction.indexes(collect.store), {})
+        df = compaction.load(collect.store)
+        self.assertEqual(sorted(set(df["datetime"])), [NOW, NOW + timedelta(minutes=10)])
+
+    def test_normalized(self) -> None:
+        collect = collector.Collector(self.data_dir, layout="normalized")
+        collector.reparse(self.archive_dir, collect, workers=2, days=[NOW.date()])
+        self.assertEqual(len(collect.store.read(NOW.date())), 6)
+        self.assertEqual(list(collect.item_store.read(storage.ITEMS)["aID"]), self.aids)  # type: ignore
@@ -0,0 +1,118 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import tempfile
+import importlib.util
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import TestCase, mock, skipUnless
+
+import pandas as pd
+
+from tests import TestMixin
+from ya3_collect import compaction, dataframe, storage
+
+
+START = datetime(2022, 1, 30, 12, 0)
+RECORDS = [
+    dataframe.Record(
+        aID=f"x{i}",
+        title=f"title{i}",
+        datetime=START + timedelta(hours=12 * k),
+        access=10 * k + i,
+        watch=k,
+        bid=i
+    )
+    for k in range(6) for i in range(5)
+]
+
+
+def _write(store: storage.Storage, records: list[dataframe.Record]) -> None:
+    df = dataframe.DataFrame.new().add_records(records)
+    for day, part in df.groupby(df["datetime"].dt.date):
+        store.append(dataframe.DataFrame(part.reset_index(drop=True)), day)
+
+
+class _CompactionTests(TestMixin):
+    format: str
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.store = storage.get_storage(self.format, Path(tmpdir.name))
+        _write(self.store, RECORDS)
+        self.expected = compaction.load(self.store)
+
+    def test_compact(self) -> None:
+        with mock.patch.object(compaction, "BLOCK_ROWS", 4):
+            paths = compaction.compact(self.store)
+        self.assertEqual([path.name[:7] for path in paths], ["2022-01", "2022-02"])
+        index = compaction.indexes(self.store)[date(2022, 1, 1)]
+        self.assertEqual(index.days, [date(2022, 1, 30), date(2022, 1, 31)])
+        self.assertEqual(len(index.locations), 3)
+        self.assertEqual(index.blocks(["x3"]), [1])
+        self.assertEqual(compaction.compact(self.store), [])
+        pd.testing.assert_frame_equal(compaction.load(self.store), self.expected)
+
+    def test_load(self) -> None:
+        compaction.compact(self.store, [date(2022, 1, 1)], remove=True)
+        self.assertEqual(self.store.days(), [date(2022, 2, 1), date(2022, 2, 2)])
+        df = compaction.load(self.store, aids=["x1", "x4"], start=datetime(2022, 1, 31), end=datetime(2022, 2, 2))
+        self.assertIsInstance(df, dataframe.DataFrame)
+        self.assertEqual(list(df["aID"]), ["x1"] * 4 + ["x4"] * 4)
+        self.assertEqual(list(df["access"]), [11, 21, 31, 41, 14, 24, 34, 44])
+        self.assertEqual(len(compaction.load(self.store, aids=["y"])), 0)
+
+    def test_recompact(self) -> None:
+        compaction.compact(self.store, [date(2022, 1, 1)])
+        old = compaction.indexes(self.store)[date(2022, 1, 1)].file
+        self.store.append(
+            dataframe.DataFrame.new().add_records([dataframe.Record("x9", "title9", datetime(2022, 1, 1), 1, 1, 1)]),
+            date(2022, 1, 1)
+        )
+        compaction.compact(self.store, [date(2022, 1, 1)])
+        index = compaction.indexes(self.store)[date(2022, 1, 1)]
+        self.assertEqual(index.days[0], date(2022, 1, 1))
+        self.assertFalse((self.store.data_dir / compaction.COMPACTED / old).exists())
+        self.assertEqual(len(compaction.load(self.store)), len(RECORDS) + 1)
+
+    def test_remove(self) -> None:
+        compaction.compact(self.store, remove=True)
+        compaction.remove(self.store, [date(2022, 1, 30), date(2022, 2, 1)])
+        self.assertEqual(compaction.indexes(self.store)[date(2022, 1, 1)].days, [date(2022, 1, 31)])
+        self.assertEqual(compaction.indexes(self.store)[date(2022, 2, 1)].days, [date(2022, 2, 2)])
+        removed = self.expected["datetime"].dt.normalize().isin([datetime(2022, 1, 30), datetime(2022, 2, 1)])
+        expected = self.store.frame(self.expected[~removed].reset_index(drop=True))
+        pd.testing.assert_frame_equal(compaction.load(self.store), expected)
+        compaction.remove(self.store, [date(2022, 1, 31)])
+        self.assertEqual(list(compaction.indexes(self.store)), [date(2022, 2, 1)])
+        self.assertEqual(len(list((self.store.data_dir / compaction.COMPACTED).iterdir())), 2)
+
+    def test_columns(self) -> None:
+        compaction.compact(self.store, [date(2022, 1, 1)], remove=True)
+        df = compaction.load(self.store, columns=["access"])
+        self.assertEqual(list(df.columns), ["access"])
+        self.assertEqual(list(df["access"]), list(self.expected["access"]))
+
+
+class TestCompaction_csvgz(_CompactionTests, TestCase):
+    format = "csv.gz"
+
+
+@skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class TestCompaction_parquet(_CompactionTests, TestCase):
+    format = "parquet"
+
+
+@skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class Test_convert(TestCase):
+
+    def test_default(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = storage.get_storage("csv.gz", Path(tmpdir))
+            dst = storage.get_storage("parquet", Path(tmpdir))
+            _write(src, RECORDS)
+            compaction.compact(src, [date(2022, 1, 1)], remove=True)
+            storage.convert(src, dst)
+            paths = compaction.convert(src, dst)
+            self.assertEqual([path.suffix for path in paths], [".parquet"])
+            pd.testing.assert_frame_equal(compaction.load(dst), compaction.load(src))
+            self.assertEqual(list(compaction.indexes(src)), [date(2022, 1, 1)])
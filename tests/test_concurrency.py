@@ -0,0 +1,80 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import time
+from unittest import TestCase
+
+from ya3_collect import concurrency
+
+
+class TestAIMDController(TestCase):
+
+    def run_window(self, controller: concurrency.AIMDController, latency: float) -> None:
+        n = int(controller.limit)
+        for _ in range(n):
+            controller.acquire()
+        for _ in range(n):
+            controller.release(latency)
+
+    def test_slow_start(self) -> None:
+        controller = concurrency.AIMDController(10)
+        limits = []
+        for _ in range(5):
+            self.run_window(controller, 0.1)
+            limits.append(controller.limit)
+        self.assertEqual(limits, [2, 4, 8, 10, 10])
+
+    def test_additive_increase(self) -> None:
+        controller = concurrency.AIMDController(16, initial=8)
+        controller.acquire()
+        controller.throttle("status 429")
+        controller.release()
+        self.assertEqual(controller.limit, 4)
+        self.assertFalse(controller.slow_start)
+        self.run_window(controller, 0.1)
+        self.assertEqual(controller.limit, 5)
+
+    def test_throttle_once(self) -> None:
+        controller = concurrency.AIMDController(16, initial=16)
+        for _ in range(3):
+            controller.acquire()
+        for _ in range(3):
+            controller.throttle("status 503")
+            controller.release()
+        self.assertEqual(controller.limit, 8)
+        controller.acquire()
+        controller.throttle("status 503")
+        controller.release()
+        self.assertEqual(controller.limit, 4)
+
+    def test_min_limit(self) -> None:
+        controller = concurrency.AIMDController(4, min_limit=2, initial=2)
+        controller.acquire()
+        controller.throttle("ConnectTimeoutError")
+        controller.release()
+        self.assertEqual(controller.limit, 2)
+
+    def test_latency(self) -> None:
+        controller = concurrency.AIMDController(16, initial=4)
+        self.run_window(controller, 0.1)
+        self.assertEqual(controller.limit, 8)
+        self.run_window(controller, 0.5)
+        self.assertEqual(controller.limit, 4)
+
+    def test_in_flight(self) -> None:
+        controller = concurrency.AIMDController(4, initial=2)
+        controller.acquire()
+        controller.acquire()
+        self.assertEqual(controller.in_flight, 2)
+        controller.release()
+        controller.acquire()
+        self.assertEqual(controller.in_flight, 2)
+
+    def test_pause(self) -> None:
+        controller = concurrency.AIMDController(4)
+        controller.pause(0.2)
+        start = time.monotonic()
+        controller.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(ValueError):
+            concurrency.AIMDController(2, min_limit=3)
@@ -0,0 +1,65 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import sys
+import tempfile
+import subprocess
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import TestCase
+
+from ya3_collect import csvgz, dataframe
+
+
+RECORDS = [
+    dataframe.Record(
+        aID=f"{10000000 + i}",
+        title=f"title, \"{i}\"",
+        datetime=datetime(2021, 1, 1, 0, 0, 0) + timedelta(minutes=i),
+        access=10 + i,
+        watch=3 + i,
+        bid=i
+    )
+    for i in range(4)
+]
+
+
+class Test_append_rows(TestCase):
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.data_dir = Path(tmpdir.name)
+
+    def _rows(self, records: list[dataframe.Record]) -> list[tuple[object, ...]]:
+        return [
+            (record.aID, record.title, record.datetime, record.access, record.watch, record.bid)
+            for record in records
+        ]
+
+    def test_same_as_append_csv(self) -> None:
+        file = self.data_dir / "rows.csv.gz"
+        csvgz.append_rows(file, dataframe.COLUMNS, self._rows(RECORDS[:2]))
+        csvgz.append_rows(file, dataframe.COLUMNS, self._rows(RECORDS[2:]))
+        expected = self.data_dir / "frames.csv.gz"
+        dataframe.DataFrame.new().add_records(RECORDS[:2]).append_csv(expected)
+        dataframe.DataFrame.new().add_records(RECORDS[2:]).append_csv(expected)
+        self.assertEqual(file.read_bytes(), expected.read_bytes())
+
+    def test_mixed_with_append_csv(self) -> None:
+        file = self.data_dir / "data.csv.gz"
+        dataframe.DataFrame.new().add_records(RECORDS[:2]).append_csv(file)
+        csvgz.append_rows(file, dataframe.COLUMNS, self._rows(RECORDS[2:]))
+        expected = dataframe.DataFrame.new().add_records(RECORDS)
+        self.assertTrue(dataframe.DataFrame.read_csv(file).equals(expected))
+
+    def test_path(self) -> None:
+        self.assertEqual(csvgz.path(self.data_dir, date(2021, 1, 2)), self.data_dir / "2021-01-02.csv.gz")
+
+    def test_without_pandas(self) -> None:
+        code = (
+            "import sys, datetime\n"
+            "from ya3_collect import csvgz\n"
+            f"csvgz.append_rows({str(self.data_dir / 'data.csv.gz')!r}, ['aID', 'datetime'], "
+            "[('1', datetime.datetime(2021, 1, 1))])\n"
+            "assert 'pandas' not in sys.modules\n"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True)
@@ -1,6 +1,13 @@
 # Copyright (c) 2022 Shuhei Nitta. All rights reserved.
-from unittest import TestCase
-from datetime import datetime
+import gzip
+import tempfile
+import pickle
+import dataclasses
+from pathlib import Path
+from unittest import TestCase, mock
+from datetime import datetime, timedelta
+
+import pandas as pd
 
 from ya3_collect import dataframe, exceptions
 
@@ -116,4 +123,235 @@ class TestDataFrame_add_record(TestCase):
         self.assertEqual(df["bid"][0], self.record.bid)
 
 
-    
\ No newline at end of file
+class TestDataFrame_add_records(TestCase):
+
+    def setUp(self) -> None:
+        self.records = [
+            dataframe.Record(
+                aID=f"{10000000 + i}",
+                title=f"title{i}",
+                datetime=datetime(2021, 1, 1, 0, 0, 0) + timedelta(minutes=i),
+                access=10 + i,
+                watch=3 + i,
+                bid=i
+            )
+            for i in range(3)
+        ]
+        self.df = dataframe.DataFrame.new()
+
+    def test_values(self) -> None:
+        df = self.df.add_records(self.records)
+        self.assertEqual(list(df["aID"]), [record.aID for record in self.records])
+        self.assertEqual(list(df["title"]), [record.title for record in self.records])
+        self.assertEqual(list(df["datetime"]), [record.datetime for record in self.records])
+        self.assertEqual(list(df["access"]), [record.access for record in self.records])
+        self.assertEqual(list(df["watch"]), [record.watch for record in self.records])
+        self.assertEqual(list(df["bid"]), [record.bid for record in self.records])
+
+    def test_dtypes(self) -> None:
+        df = self.df.add_records(self.records)
+        self.assertEqual(df.dtypes.astype(str).to_dict(), dataframe.DTYPES)
+
+    def test_existing(self) -> None:
+        df = self.df.add_record(self.records[0]).add_records(self.records[1:])
+        self.assertIsInstance(df, dataframe.DataFrame)
+        self.assertEqual(list(df["aID"]), [record.aID for record in self.records])
+        self.assertEqual(list(df["datetime"]), [record.datetime for record in self.records])
+
+    def test_check_format_once(self) -> None:
+        with mock.patch.object(dataframe.DataFrame, "check_format") as check_format_mock:
+            self.df.add_records(self.records)
+        check_format_mock.assert_called_once_with()
+
+    def test_concat_once(self) -> None:
+        # The timing is measured by `add_records[100000]` of benchmarks/suite.py.
+        df = self.df.add_record(self.records[0])
+        for n in (10, 1_000):
+            with mock.patch("ya3_collect.dataframe.pd.concat", wraps=pd.concat) as concat_mock:
+                self.assertEqual(len(df.add_records(self.records[i % 3] for i in range(n))), n + 1)
+            concat_mock.assert_called_once()
+
+
+class TestRecord(TestCase):
+
+    def test_slots(self) -> None:
+        record = dataframe.Record("10000000", "title", datetime(2021, 1, 1), 10, 3, 0)
+        self.assertFalse(hasattr(record, "__dict__"))
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            record.title = "renamed"  # type: ignore[misc]
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+
+
+class TestRecordBatch(TestCase):
+
+    def setUp(self) -> None:
+        self.now = datetime(2021, 1, 1, 0, 0, 0)
+        self.infos = [
+            mock.Mock(aID=f"{10000000 + i}", title=f"title{i}", count_access=10 + i, count_watch=3 + i, count_bid=i)
+            for i in range(3)
+        ]
+        self.batch = dataframe.RecordBatch.from_infos(self.infos, self.now)
+
+    def test_to_frame(self) -> None:
+        expected = dataframe.DataFrame.new().add_records(
+            dataframe.Record(info.aID, info.title, self.now, info.count_access, info.count_watch, info.count_bid)
+            for info in self.infos
+        )
+        self.assertEqual(len(self.batch), 3)
+        pd.testing.assert_frame_equal(self.batch.to_frame(), expected)
+
+    def test_to_snapshots(self) -> None:
+        snapshots = self.batch.to_snapshots()
+        self.assertEqual(snapshots.dtypes.astype(str).to_dict(), dataframe.SNAPSHOT_DTYPES)
+        self.assertEqual(list(snapshots["access"]), [10, 11, 12])
+        self.assertEqual(set(snapshots["datetime"]), {self.now})
+
+    def test_empty(self) -> None:
+        df = dataframe.RecordBatch.from_infos([], self.now).to_frame()
+        self.assertEqual(len(df), 0)
+        self.assertEqual(df.dtypes.astype(str).to_dict(), dataframe.DTYPES)
+
+
+class TestDataFrame_read_csv(TestCase):
+
+    def test_round_trip(self) -> None:
+        record = dataframe.Record(
+            aID="10000000",
+            title="title",
+            datetime=datetime(2021, 1, 1, 0, 0, 0),
+            access=10,
+            watch=3,
+            bid=1
+        )
+        df = dataframe.DataFrame.new().add_records([record])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            file = Path(tmpdir) / "data.csv.gz"
+            df.to_csv(file, compression="gzip", index=False, date_format=dataframe.DATETIME_FORMAT)
+            with gzip.open(file, "rt") as f:
+                self.assertIn("10000000,title,2021-01-01T00:00:00,10,3,1", f.read())
+            read = dataframe.DataFrame.read_csv(file)
+        self.assertIsInstance(read, dataframe.DataFrame)
+        self.assertTrue(read.equals(df))
+
+
+class TestDataFrame_append_csv(TestCase):
+
+    def setUp(self) -> None:
+        self.records = [
+            dataframe.Record(
+                aID=f"{10000000 + i}",
+                title=f"title{i}",
+                datetime=datetime(2021, 1, 1, 0, 0, 0) + timedelta(minutes=i),
+                access=10 + i,
+                watch=3 + i,
+                bid=i
+            )
+            for i in range(4)
+        ]
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.file = Path(tmpdir.name) / "data.csv.gz"
+
+    def test_same_as_rewrite(self) -> None:
+        dataframe.DataFrame.new().add_records(self.records[:2]).append_csv(self.file)
+        dataframe.DataFrame.new().add_records(self.records[2:]).append_csv(self.file)
+        expected = dataframe.DataFrame.new().add_records(self.records)
+        self.assertTrue(dataframe.DataFrame.read_csv(self.file).equals(expected))
+
+    def test_header_once(self) -> None:
+        dataframe.DataFrame.new().add_records(self.records[:2]).append_csv(self.file)
+        dataframe.DataFrame.new().add_records(self.records[2:]).append_csv(self.file)
+        with gzip.open(self.file, "rt") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], ",".join(dataframe.COLUMNS))
+        self.assertEqual(len(lines), 1 + len(self.records))
+
+    def test_existing_content_untouched(self) -> None:
+        dataframe.DataFrame.new().add_records(self.records[:2]).append_csv(self.file)
+        content = self.file.read_bytes()
+        dataframe.DataFrame.new().add_records(self.records[2:]).append_csv(self.file)
+        self.assertTrue(self.file.read_bytes().startswith(content))
+
+
+class TestItemFrame(TestCase):
+
+    def setUp(self) -> None:
+        self.records = [
+            dataframe.ItemRecord(
+                aID=f"{10000000 + i}",
+                datetime=datetime(2021, 1, 1, 0, 0, 0),
+                title=f"title{i}",
+                seller_name="seller",
+                stock=1,
+                start_datetime=datetime(2020, 12, 31, 0, 0, 0),
+                end_datetime=datetime(2021, 1, 7, 0, 0, 0),
+                refundable=True,
+                startprice=1000
+            )
+            for i in range(3)
+        ]
+        self.items = dataframe.ItemFrame.from_records(self.records)
+
+    def test_from_records(self) -> None:
+        self.assertEqual(list(self.items.columns), dataframe.ITEM_COLUMNS)
+        self.assertEqual({c: str(t) for c, t in self.items.dtypes.items()}, dataframe.ITEM_DTYPES)
+
+    def test_check_format(self) -> None:
+        with self.assertRaises(exceptions.InvalidFormatError):
+            dataframe.ItemFrame(self.items[["datetime", "aID"]])
+
+    def test_changed(self) -> None:
+        later = datetime(2021, 1, 1, 1, 0, 0)
+        self.records[1] = dataclasses.replace(self.records[1], title="renamed")
+        new = dataframe.ItemFrame.from_records([
+            *[dataclasses.replace(record, datetime=later) for record in self.records],
+            dataclasses.replace(self.records[0], aID="10000003", datetime=later),
+        ])
+        changed = self.items.changed(new)
+        self.assertEqual(list(changed["aID"]), ["10000001", "10000003"])
+        self.assertEqual(list(changed["title"]), ["renamed", "title0"])
+
+    def test_unchanged(self) -> None:
+        self.assertEqual(len(self.items.changed(self.items)), 0)
+
+    def test_latest(self) -> None:
+        renamed = dataclasses.replace(self.records[0], datetime=datetime(2021, 1, 2), title="renamed")
+        items = dataframe.ItemFrame.from_records([renamed, *self.records])
+        latest = items.latest().set_index("aID")
+        self.assertEqual(latest.loc["10000000", "title"], "renamed")
+        self.assertEqual(len(latest), 3)
+
+
+class Test_join(TestCase):
+
+    def test_round_trip(self) -> None:
+        records = [
+            dataframe.Record(
+                aID=f"{10000000 + i % 2}",
+                title="renamed" if i >= 4 and i % 2 == 0 else f"title{i % 2}",
+                datetime=datetime(2021, 1, 1, 0, 0, 0) + timedelta(hours=i // 2),
+                access=10 + i,
+                watch=3 + i,
+                bid=i
+            )
+            for i in range(6)
+        ]
+        df = dataframe.DataFrame.new().add_records(records)
+        items = dataframe.ItemFrame.from_records(
+            dataframe.ItemRecord(
+                aID=record.aID,
+                datetime=record.datetime,
+                title=record.title,
+                seller_name="seller",
+                stock=1,
+                start_datetime=datetime(2020, 12, 31, 0, 0, 0),
+                end_datetime=datetime(2021, 1, 7, 0, 0, 0),
+                refundable=True,
+                startprice=1000
+            )
+            for record in records[:2] + records[4:5]
+        )
+        snapshots = dataframe.SnapshotFrame(df[dataframe.SNAPSHOT_COLUMNS])
+        joined = dataframe.join(snapshots, items)
+        self.assertIsInstance(joined, dataframe.DataFrame)
+        self.assertTrue(joined.equals(df))
@@ -0,0 +1,93 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import TestCase
+
+import pandas as pd
+
+from ya3_collect import dataframe, delta, storage
+
+
+START = datetime(2022, 1, 1, 12, 0)
+
+
+def _run(k: int, n: int = 4) -> dataframe.DataFrame:
+    # Only the access of x0 changes at every run, and x3 is gone after the second run.
+    return dataframe.DataFrame.new().add_records(
+        dataframe.Record(f"x{i}", f"title{i}", START + timedelta(minutes=10 * k), k if i == 0 else i, 1, 0)
+        for i in range(n if k < 2 else n - 1)
+    )
+
+
+class TestDeltaEncoder(TestCase):
+
+    def test_encode(self) -> None:
+        encoder = delta.DeltaEncoder(timedelta(minutes=30))
+        encoded = [encoder.encode(_run(k), START + timedelta(minutes=10 * k)) for k in range(4)]
+        self.assertEqual([len(df) for df, _ in encoded], [4, 1, 1, 3])
+        self.assertEqual([run.keyframe for _, run in encoded], [True, False, False, True])
+        self.assertEqual(encoded[2][1].removed, ["x3"])
+
+    def test_decode(self) -> None:
+        encoder = delta.DeltaEncoder(timedelta(minutes=30))
+        dense = [_run(k) for k in range(5)]
+        encoded = [encoder.encode(df, START + timedelta(minutes=10 * k)) for k, df in enumerate(dense)]
+        df = dataframe.DataFrame(pd.concat([df for df, _ in encoded], ignore_index=True).astype(dataframe.DTYPES))
+        decoded = delta.decode(df, [run for _, run in encoded])
+        self.assertIsInstance(decoded, dataframe.DataFrame)
+        expected = pd.concat(dense, ignore_index=True).astype(dataframe.DTYPES)
+        pd.testing.assert_frame_equal(decoded, expected, check_categorical=False)
+
+    def test_restore(self) -> None:
+        encoder = delta.DeltaEncoder(timedelta(minutes=30))
+        encoded = [encoder.encode(_run(k), START + timedelta(minutes=10 * k)) for k in range(2)]
+        restored = delta.DeltaEncoder(timedelta(minutes=30))
+        restored.restore(pd.concat([df for df, _ in encoded], ignore_index=True), [run for _, run in encoded])
+        self.assertEqual(restored.keyframe_at, START)
+        df, run = restored.encode(_run(2), START + timedelta(minutes=20))
+        self.assertEqual(len(df), 1)
+        self.assertEqual(run.removed, ["x3"])
+
+    def test_save(self) -> None:
+        encoder = delta.DeltaEncoder(timedelta(minutes=30))
+        runs = [encoder.encode(_run(k), START + timedelta(minutes=10 * k))[1] for k in range(2)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "state.json"
+            encoder.save(path)
+            loaded = delta.DeltaEncoder(timedelta(minutes=30))
+            self.assertTrue(loaded.load(path, runs))
+            self.assertEqual(loaded.keyframe_at, START)
+            now = START + timedelta(minutes=20)
+            self.assertEqual(len(loaded.encode(_run(2), now)[0]), len(encoder.encode(_run(2), now)[0]))
+            self.assertFalse(loaded.load(path, runs[:1]))
+            self.assertIsNone(loaded.state)
+            self.assertFalse(loaded.load(Path(tmpdir) / "missing.json", runs))
+
+
+class Test_read(TestCase):
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.store = storage.get_storage("csv.gz", Path(tmpdir.name))
+
+    def test_dense(self) -> None:
+        self.store.write(_run(0), START.date())
+        self.assertEqual(delta.read_runs(self.store, START.date()), [])
+        self.assertEqual(len(delta.read(self.store, START.date())), 4)
+
+    def test_delta(self) -> None:
+        encoder = delta.DeltaEncoder()
+        self.store.append(_run(0), START.date())  # written densely before the delta encoding is enabled
+        encoder.restore(_run(0), [])
+        for k in range(1, 3):
+            df, run = encoder.encode(_run(k), START + timedelta(minutes=10 * k))
+            self.store.append(dataframe.DataFrame(df), START.date())
+            delta.append_runs(self.store, START.date(), [run])
+        self.assertEqual(len(self.store.read(START.date())), 6)
+        df = delta.read(self.store, START.date(), columns=["aID", "access"], start=START + timedelta(minutes=10))
+        self.assertEqual(list(df["aID"]), ["x0", "x1", "x2", "x3", "x0", "x1", "x2"])
+        self.assertEqual(list(df["access"]), [1, 1, 2, 3, 2, 1, 2])
+        self.assertTrue(self.store.remove(START.date()))
+        self.assertFalse(self.store.runs_path(START.date()).exists())
@@ -0,0 +1,97 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from ya3_collect import httpcache
+
+
+URL = "https://example.com/item/1"
+
+
+class TestHTTPCache(TestCase):
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.cache_dir = Path(tmpdir.name)
+
+    def test_put(self) -> None:
+        with httpcache.HTTPCache(self.cache_dir) as cache:
+            self.assertIsNone(cache.lookup(URL))
+            cache.put(URL, b"body" * 100, '"1"', None)
+            entry = cache.lookup(URL)
+            assert entry is not None
+            self.assertEqual(entry.validators(), {"If-None-Match": '"1"'})
+            self.assertEqual(cache.body(entry), b"body" * 100)
+            self.assertLess(cache.size, 400)
+            cache.put(URL, b"other", None, None)
+            self.assertIsNone(cache.lookup(URL))
+            self.assertEqual(cache.size, 0)
+
+    def test_parsed(self) -> None:
+        with httpcache.HTTPCache(self.cache_dir) as cache:
+            cache.set_parsed(URL, "full", {"aID": "1"})
+            self.assertIsNone(cache.parsed(URL, "full"))
+            cache.put(URL, b"body", '"1"', None)
+            cache.set_parsed(URL, "full", {"aID": "1"})
+            self.assertEqual(cache.parsed(URL, "full"), {"aID": "1"})
+            self.assertIsNone(cache.parsed(URL, "fast"))
+        with httpcache.HTTPCache(self.cache_dir) as cache:
+            self.assertEqual(cache.parsed(URL, "full"), {"aID": "1"})
+            cache.put(URL, b"changed", '"2"', None)
+            self.assertIsNone(cache.parsed(URL, "full"))
+
+    def test_account(self) -> None:
+        with httpcache.HTTPCache(self.cache_dir) as cache:
+            cache.put(URL, b"alice", '"1"', None, account="alice")
+            cache.set_parsed(URL, "full", {"aID": "1"}, account="alice")
+            self.assertIsNone(cache.lookup(URL))
+            self.assertIsNone(cache.lookup(URL, account="bob"))
+            self.assertIsNone(cache.parsed(URL, "full", account="bob"))
+        with httpcache.HTTPCache(self.cache_dir) as cache:
+            entry = cache.lookup(URL, account="alice")
+            assert entry is not None
+            self.assertEqual(cache.body(entry), b"alice")
+            self.assertEqual(cache.parsed(URL, "full", account="alice"), {"aID": "1"})
+        self.assertNotEqual(httpcache.account({"seller": "alice"}), httpcache.account({"seller": "bob"}))
+        self.assertEqual(httpcache.account({}), "")
+
+    def test_reload(self) -> None:
+        with httpcache.HTTPCache(self.cache_dir) as cache:
+            cache.put(URL, b"body", None, "Sat, 01 Jan 2022 00:00:00 GMT")
+            size = cache.size
+        (self.cache_dir / "orphan.gz").write_bytes(b"")
+        with httpcache.HTTPCache(self.cache_dir) as cache:
+            entry = cache.lookup(URL)
+            assert entry is not None
+            self.assertEqual(entry.validators(), {"If-Modified-Since": "Sat, 01 Jan 2022 00:00:00 GMT"})
+            self.assertEqual(cache.body(entry), b"body")
+            self.assertEqual(cache.size, size)
+        self.assertFalse((self.cache_dir / "orphan.gz").exists())
+
+    def test_evict(self) -> None:
+        with httpcache.HTTPCache(self.cache_dir) as cache:
+            cache.put(URL, b"body", '"1"', None)
+            size = cache.size
+        with httpcache.HTTPCache(self.cache_dir, max_bytes=2 * size) as cache:
+            for i in range(2):
+                cache.put(f"{URL}{i}", b"body", '"1"', None)
+                cache.lookup(URL)
+            self.assertEqual(len(cache), 2)
+            self.assertIsNotNone(cache.lookup(URL))
+            self.assertIsNone(cache.lookup(f"{URL}0"))
+            self.assertEqual(len(list(self.cache_dir.glob("*.gz"))), 2)
+
+    def test_evicted_body(self) -> None:
+        with httpcache.HTTPCache(self.cache_dir) as cache:
+            cache.put(URL, b"body", '"1"', None)
+            entry = cache.lookup(URL)
+            assert entry is not None
+            (self.cache_dir / entry.file).unlink()
+            self.assertIsNone(cache.body(entry))
+            self.assertIsNone(cache.lookup(URL))
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(ValueError):
+            httpcache.HTTPCache(self.cache_dir, max_bytes=0)
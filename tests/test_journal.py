@@ -0,0 +1,59 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import dataclasses
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from unittest import TestCase
+
+from ya3_collect import journal
+from tests.test_yahoo_auction import TEST_INFO
+
+
+STARTED = datetime(2022, 1, 1, 12, 0, 0)
+
+
+class TestJournal(TestCase):
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.data_dir = Path(tmpdir.name)
+
+    def test_load(self) -> None:
+        self.assertIsNone(journal.Journal.load(self.data_dir))
+        with journal.Journal(self.data_dir, STARTED) as run_journal:
+            run_journal.add("https://example.com/1", TEST_INFO)
+        loaded = journal.Journal.load(self.data_dir)
+        assert loaded is not None
+        self.assertEqual(loaded.started, STARTED)
+        self.assertEqual(loaded.infos, [TEST_INFO])
+        self.assertEqual(loaded.done, {"https://example.com/1"})
+        second = dataclasses.replace(TEST_INFO, aID="2")
+        with loaded:
+            loaded.add("https://example.com/2", second)
+        reloaded = journal.Journal.load(self.data_dir)
+        assert reloaded is not None
+        self.assertEqual(reloaded.infos, [TEST_INFO, second])
+        reloaded.remove()
+        self.assertFalse(journal.path(self.data_dir).exists())
+
+    def test_torn(self) -> None:
+        with journal.Journal(self.data_dir, STARTED) as run_journal:
+            run_journal.add("https://example.com/1", TEST_INFO)
+        with open(journal.path(self.data_dir), "a") as f:
+            f.write('{"url": "https://example.com/2", "in')
+        with self.assertLogs("ya3_collect.journal", "WARNING"):
+            loaded = journal.Journal.load(self.data_dir)
+        assert loaded is not None
+        with loaded:
+            loaded.add("https://example.com/3", TEST_INFO)
+        with self.assertLogs("ya3_collect.journal", "WARNING"):
+            reloaded = journal.Journal.load(self.data_dir)
+        assert reloaded is not None
+        self.assertEqual(reloaded.done, {"https://example.com/1", "https://example.com/3"})
+        reloaded.close()
+
+    def test_empty(self) -> None:
+        journal.path(self.data_dir).touch()
+        self.assertIsNone(journal.Journal.load(self.data_dir))
+        self.assertFalse(journal.path(self.data_dir).exists())
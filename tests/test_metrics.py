@@ -0,0 +1,76 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import json
+import math
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from ya3_collect import metrics
+
+
+class TestHistogram(TestCase):
+
+    def test_quantile(self) -> None:
+        hist = metrics.Histogram()
+        for value in range(1, 101):
+            hist.observe(value)
+        self.assertEqual(hist.quantile(0.5), 50)
+        self.assertEqual(hist.quantile(0.95), 95)
+        self.assertEqual(hist.quantile(0.99), 99)
+        self.assertEqual(hist.quantile(1), 100)
+
+    def test_empty(self) -> None:
+        hist = metrics.Histogram()
+        self.assertTrue(math.isnan(hist.quantile(0.5)))
+        self.assertEqual(hist.summary(), {"count": 0, "sum": 0})
+
+
+class TestRegistry(TestCase):
+
+    def setUp(self) -> None:
+        self.registry = metrics.Registry()
+        self.registry.inc("http_responses_total", status="200")
+        self.registry.inc("http_responses_total", status="200")
+        self.registry.inc("http_responses_total", status="503")
+        self.registry.inc("downloaded_bytes_total", 1024)
+        for value in (0.1, 0.2, 0.3):
+            self.registry.observe("item_fetch_seconds", value)
+        with self.registry.timer("storage_seconds", stage="write"):
+            pass
+
+    def test_summary(self) -> None:
+        summary = self.registry.summary()
+        self.assertEqual(summary["counters"]["http_responses_total"], {"status=200": 2, "status=503": 1})
+        self.assertEqual(summary["counters"]["downloaded_bytes_total"], 1024)
+        self.assertEqual(summary["histograms"]["item_fetch_seconds"]["p50"], 0.2)
+        self.assertEqual(summary["histograms"]["storage_seconds"]["stage=write"]["count"], 1)
+        self.assertGreater(summary["gauges"]["peak_rss_bytes"]["process=self"], 0)
+
+    def test_to_prometheus(self) -> None:
+        lines = self.registry.to_prometheus().splitlines()
+        self.assertIn("# TYPE ya3_collect_http_responses_total gauge", lines)
+        self.assertIn('ya3_collect_http_responses_total{status="200"} 2', lines)
+        self.assertIn("ya3_collect_downloaded_bytes_total 1024", lines)
+        self.assertIn('ya3_collect_item_fetch_seconds{quantile="0.99"} 0.3', lines)
+        self.assertIn("ya3_collect_item_fetch_seconds_count 3", lines)
+        self.assertIn('ya3_collect_storage_seconds_count{stage="write"} 1', lines)
+
+    def test_write(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.registry.write_json(Path(tmpdir) / "metrics.json")
+            self.registry.write_prometheus(Path(tmpdir) / "ya3_collect.prom")
+            with open(Path(tmpdir) / "metrics.json") as f:
+                self.assertEqual(json.load(f)["counters"]["downloaded_bytes_total"], 1024)
+            names = sorted(path.name for path in Path(tmpdir).iterdir())
+        self.assertEqual(names, ["metrics.json", "ya3_collect.prom"])
+
+
+class Test_reset(TestCase):
+
+    def test_default(self) -> None:
+        metrics.inc("errors_total")
+        registry = metrics.reset()
+        self.assertIs(metrics.REGISTRY, registry)
+        self.assertEqual(registry.counters, {})
+        metrics.inc("errors_total")
+        self.assertEqual(registry.counters, {("errors_total", ()): 1})
@@ -0,0 +1,45 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import time
+import threading
+from unittest import TestCase
+
+from ya3_collect import scheduler
+
+
+class Test_run_every(TestCase):
+
+    def test_cycles(self) -> None:
+        calls: list[float] = []
+        skipped = scheduler.run_every(lambda: calls.append(time.monotonic()), 0.02, max_cycles=3)
+        self.assertEqual(skipped, 0)
+        self.assertEqual(len(calls), 3)
+        self.assertGreaterEqual(calls[-1] - calls[0], 0.03)
+
+    def test_skip_running_cycle(self) -> None:
+        calls: list[float] = []
+
+        def cycle() -> None:
+            calls.append(time.monotonic())
+            time.sleep(0.05)
+
+        skipped = scheduler.run_every(cycle, 0.02, max_cycles=5)
+        self.assertGreater(skipped, 0)
+        self.assertEqual(len(calls) + skipped, 5)
+
+    def test_failed_cycle(self) -> None:
+        calls: list[int] = []
+
+        def cycle() -> None:
+            calls.append(0)
+            raise RuntimeError("failed")
+
+        with self.assertLogs("ya3_collect.scheduler", "ERROR"):
+            scheduler.run_every(cycle, 0.02, max_cycles=2)
+        self.assertEqual(len(calls), 2)
+
+    def test_stop(self) -> None:
+        stop = threading.Event()
+        threading.Timer(0.05, stop.set).start()
+        start = time.monotonic()
+        scheduler.run_every(lambda: None, 10, jitter=1, stop=stop)
+        self.assertLess(time.monotonic() - start, 5)
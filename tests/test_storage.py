@@ -0,0 +1,156 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import tempfile
+import importlib.util
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import TestCase, mock, skipUnless
+
+from tests import TestMixin
+from ya3_collect import dataframe, storage
+
+
+RECORDS = [
+    dataframe.Record(
+        aID=f"{10000000 + i % 3}",
+        title=f"title{i % 3}",
+        datetime=datetime(2021, 1, 1, 0, 0, 0) + timedelta(hours=i // 3),
+        access=10 + i,
+        watch=3 + i,
+        bid=i
+    )
+    for i in range(12)
+]
+ITEM_RECORDS = [
+    dataframe.ItemRecord(
+        aID=record.aID,
+        datetime=record.datetime,
+        title=record.title,
+        seller_name="seller",
+        stock=1,
+        start_datetime=datetime(2020, 12, 31, 0, 0, 0),
+        end_datetime=datetime(2021, 1, 7, 0, 0, 0),
+        refundable=bool(i % 2),
+        startprice=1000
+    )
+    for i, record in enumerate(RECORDS[:3])
+]
+DAY = date(2021, 1, 1)
+
+
+class _StorageTests(TestMixin):
+    format: str
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.store = storage.get_storage(self.format, Path(tmpdir.name))
+        self.df = dataframe.DataFrame.new().add_records(RECORDS)
+
+    def test_write(self) -> None:
+        self.store.write(self.df, DAY)
+        self.assertTrue(self.store.read(DAY).equals(self.df))
+
+    def test_rewrite(self) -> None:
+        self.store.write(self.df, DAY)
+        self.store.write(self.df, DAY)
+        self.assertTrue(self.store.read(DAY).equals(self.df))
+
+    def test_append(self) -> None:
+        self.store.append(dataframe.DataFrame(self.df.iloc[:5]), DAY)
+        self.store.append(dataframe.DataFrame(self.df.iloc[5:]), DAY)
+        read = self.store.read(DAY)
+        self.assertIsInstance(read, dataframe.DataFrame)
+        self.assertTrue(read.equals(self.df))
+
+    def test_columns_and_range(self) -> None:
+        self.store.write(self.df, DAY)
+        read = self.store.read(
+            DAY, columns=["aID", "access"], start=datetime(2021, 1, 1, 1), end=datetime(2021, 1, 1, 3)
+        )
+        self.assertEqual(list(read.columns), ["aID", "access"])
+        self.assertEqual(list(read["access"]), [record.access for record in RECORDS[3:9]])
+
+    def test_days(self) -> None:
+        self.store.write(self.df, DAY)
+        self.store.append(self.df, DAY + timedelta(days=1))
+        self.assertEqual(self.store.days(), [DAY, DAY + timedelta(days=1)])
+
+    def test_remove(self) -> None:
+        self.store.append(self.df, DAY)
+        self.assertTrue(self.store.remove(DAY))
+        self.assertFalse(self.store.exists(DAY))
+        self.assertFalse(self.store.remove(DAY))
+
+    def test_items(self) -> None:
+        store = storage.get_storage(self.format, self.store.data_dir, dataframe.ItemFrame)
+        items = dataframe.ItemFrame.from_records(ITEM_RECORDS)
+        store.append(dataframe.ItemFrame(items.iloc[:1]), storage.ITEMS)
+        store.append(dataframe.ItemFrame(items.iloc[1:]), storage.ITEMS)
+        read = store.read(storage.ITEMS)
+        self.assertIsInstance(read, dataframe.ItemFrame)
+        self.assertTrue(read.equals(items))
+        self.assertEqual(store.days(), [])
+
+    def test_legacy_items(self) -> None:
+        # The older versions saved the text of the price.
+        store = storage.get_storage(self.format, self.store.data_dir, dataframe.ItemFrame)
+        items = dataframe.ItemFrame.from_records(ITEM_RECORDS)
+        with mock.patch.dict(dataframe.ITEM_DTYPES, startprice="object"):
+            store.append(dataframe.ItemFrame(items.iloc[:2].assign(startprice=["1,000円", ""])), storage.ITEMS)
+        store.append(dataframe.ItemFrame(items.iloc[2:]), storage.ITEMS)
+        read = store.read(storage.ITEMS)
+        self.assertEqual(str(read["startprice"].dtype), "int64")
+        self.assertEqual(list(read["startprice"]), [1000, 0, 1000])
+
+    def test_snapshots(self) -> None:
+        store = storage.get_storage(self.format, self.store.data_dir / storage.SNAPSHOTS, dataframe.SnapshotFrame)
+        snapshots = dataframe.SnapshotFrame(self.df[dataframe.SNAPSHOT_COLUMNS])
+        store.append(snapshots, DAY)
+        read = store.read(DAY)
+        self.assertIsInstance(read, dataframe.SnapshotFrame)
+        self.assertTrue(read.equals(snapshots))
+
+    def test_blocks(self) -> None:
+        path = self.store.data_dir / f"blocks{self.store.suffix}"
+        blocks = [self.df.iloc[:3], self.df.iloc[3:4], self.df.iloc[4:]]
+        locations = self.store.write_blocks(blocks, path)
+        self.assertEqual(len(locations), 3)
+        self.assertTrue(self.store.read_blocks(path, locations).equals(self.df))
+        read = self.store.read_blocks(path, [locations[2], locations[0]], columns=["aID", "access"])
+        self.assertEqual(list(read["access"]), [record.access for record in RECORDS[:3] + RECORDS[4:]])
+        self.assertEqual(len(self.store.read_blocks(path, [])), 0)
+
+
+class TestCsvGzStorage(_StorageTests, TestCase):
+    format = "csv.gz"
+
+
+@skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class TestParquetStorage(_StorageTests, TestCase):
+    format = "parquet"
+
+    def test_dictionary_encoding(self) -> None:
+        import pyarrow.parquet as pq
+
+        path = self.store.write(self.df, DAY)
+        metadata = pq.ParquetDataset(path).fragments[0].metadata
+        schema = metadata.schema.to_arrow_schema()
+        self.assertEqual(str(schema.field("datetime").type), "timestamp[ms]")
+        self.assertEqual(str(schema.field("access").type), "int32")
+        column = metadata.row_group(0).column(0)
+        self.assertIn("RLE_DICTIONARY", column.encodings)
+        self.assertTrue(column.is_stats_set)
+
+
+@skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class Test_convert(TestCase):
+
+    def test_default(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = storage.CsvGzStorage(Path(tmpdir))
+            dst = storage.ParquetStorage(Path(tmpdir))
+            df = dataframe.DataFrame.new().add_records(RECORDS)
+            src.append(df, DAY)
+            paths = storage.convert(src, dst)
+            self.assertEqual(paths, [dst.path(DAY)])
+            self.assertTrue(dst.read(DAY).equals(src.read(DAY)))
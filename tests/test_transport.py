@@ -0,0 +1,150 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import time
+import tempfile
+import threading
+from http import server
+from pathlib import Path
+from unittest import TestCase
+
+import requests
+
+from tests.server import StandInServer
+from ya3_collect import concurrency, httpcache, metrics, transport
+
+
+class _Handler(server.BaseHTTPRequestHandler):
+    statuses: list[int] = []
+
+    def do_GET(self) -> None:
+        status = self.statuses.pop(0) if self.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+class TestTransport(TestCase):
+
+    def setUp(self) -> None:
+        self.server = server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        self.client = transport.Transport({"name": "value"}, pool_size=4, retries=2, backoff_factor=0)
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_pool_size(self) -> None:
+        adapter = self.client.session.get_adapter(self.url)
+        self.assertEqual(adapter._pool_maxsize, 4)  # type: ignore
+
+    def test_cookies(self) -> None:
+        self.assertEqual(self.client.session.cookies.get("name"), "value")
+
+    def test_retry(self) -> None:
+        _Handler.statuses = [503, 500]
+        response = self.client.get(self.url)
+        self.assertEqual(response.content, b"ok")
+
+    def test_controller(self) -> None:
+        controller = concurrency.AIMDController(8, initial=8)
+        client = transport.Transport({}, retries=2, backoff_factor=0, controller=controller)
+        _Handler.statuses = [429]
+        self.assertEqual(client.get(self.url).content, b"ok")
+        self.assertEqual((controller.limit, controller.in_flight), (4, 0))
+        _Handler.statuses = [503, 503, 503]
+        with self.assertRaises(requests.HTTPError) as cm:
+            client.get(self.url)
+        self.assertTrue(transport.is_transient(cm.exception))
+        self.assertEqual((controller.limit, controller.in_flight), (2, 0))
+
+    def test_retries_exhausted(self) -> None:
+        _Handler.statuses = [503, 503, 503]
+        with self.assertRaises(requests.HTTPError):
+            self.client.get(self.url)
+
+
+class TestTransport_standin(TestCase):
+
+    def test_error_injection(self) -> None:
+        with StandInServer(n_items=20, error_rate=0.3) as standin, \
+                transport.Transport({}, pool_size=4, retries=10, backoff_factor=0) as client:
+            contents = [client.get(f"{standin.url}/item/{aid}").content for aid in standin.aids]
+        self.assertGreater(standin.errors, 0)
+        self.assertEqual(len(standin.paths), len(contents) + standin.errors)
+        self.assertTrue(all(aid.encode() in content for aid, content in zip(standin.aids, contents)))
+
+    def test_with_cookies(self) -> None:
+        with StandInServer(n_items=1) as standin, transport.Transport({"name": "main"}) as client:
+            with client.with_cookies({"name": "other"}) as other:
+                other.get(standin.selling_url)
+                self.assertIs(other.session.get_adapter(standin.url), client.session.get_adapter(standin.url))
+            client.get(standin.selling_url)
+        self.assertEqual(standin.cookies, ["name=other", "name=main"])
+
+    def test_cache(self) -> None:
+        registry = metrics.reset()
+        with tempfile.TemporaryDirectory() as tmpdir, StandInServer(n_items=1) as standin, \
+                httpcache.HTTPCache(Path(tmpdir)) as cache, transport.Transport({}, cache=cache) as client:
+            url = f"{standin.url}/item/{standin.aids[0]}"
+            first = client.get(url).content
+            response = client.get(url)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, first)
+            entry = cache.lookup(url)
+            assert entry is not None
+            cache.discard(url)
+            cache.put(url, first, entry.etag, None)
+            (Path(tmpdir) / entry.file).unlink()  # evicted after the lookup
+            self.assertEqual(client.get(url).content, first)
+        self.assertEqual(registry.counters[("http_cache_total", (("result", "hit"),))], 1)
+        self.assertEqual(registry.counters[("http_cache_saved_bytes_total", ())], len(first))
+        self.assertEqual(registry.counters[("http_responses_total", (("status", "304"),))], 2)
+        self.assertEqual(standin.paths, [f"/item/{standin.aids[0]}"] * 4)
+
+    def test_cache_accounts(self) -> None:
+        # The listing page has the same URL and, in the stand-in server, the same ETag for every seller.
+        with tempfile.TemporaryDirectory() as tmpdir, StandInServer(n_items=1) as standin, \
+                httpcache.HTTPCache(Path(tmpdir)) as cache, transport.Transport({}, cache=cache) as client, \
+                client.with_cookies({"seller": "alice"}) as alice, client.with_cookies({"seller": "bob"}) as bob:
+            self.assertEqual(alice.get(standin.selling_url).status_code, 200)
+            self.assertEqual(bob.get(standin.selling_url).status_code, 200)
+            self.assertEqual(alice.get(standin.selling_url).status_code, 304)
+            self.assertEqual(len(cache), 2)
+
+
+class TestTokenBucket(TestCase):
+
+    def test_rate(self) -> None:
+        bucket = transport.TokenBucket(50, burst=5)
+        start = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+        for _ in range(10):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+    def test_shared(self) -> None:
+        bucket = transport.TokenBucket(100)
+        start = time.monotonic()
+
+        def acquire() -> None:
+            for _ in range(5):
+                bucket.acquire()
+
+        threads = [threading.Thread(target=acquire) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(ValueError):
+            transport.TokenBucket(0)
@@ -0,0 +1,119 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import dataclasses
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from unittest import TestCase
+
+from tests import server
+from tests.test_yahoo_auction import TEST_INFO
+from ya3_collect import transport, workqueue
+
+
+STARTED = datetime(2022, 1, 1, 12, 0, 0)
+URLS = [f"https://example.com/item/{i}" for i in range(3)]
+
+
+class TestWorkQueue(TestCase):
+
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.data_dir = Path(tmpdir.name)
+        self.queue = workqueue.WorkQueue(self.data_dir / workqueue.QUEUE, max_attempts=2)
+        self.addCleanup(self.queue.close)
+        self.run_ = self.queue.start("alice", self.data_dir / "alice", STARTED)
+
+    def test_start(self) -> None:
+        self.assertEqual(self.run_, workqueue.Run(self.run_.id, "alice", self.data_dir / "alice", STARTED))
+        bob = self.queue.start("bob", self.data_dir / "bob", STARTED, "normalized", "delta")
+        self.assertEqual(bob, workqueue.Run(bob.id, "bob", self.data_dir / "bob", STARTED, "normalized", "delta"))
+        later = self.queue.start("alice", self.data_dir / "alice", datetime.now())
+        self.assertNotEqual(later.id, self.run_.id)
+        self.assertEqual(self.queue.runs(), [self.run_, bob, later])
+        self.queue.finish(self.run_)
+        self.assertEqual(self.queue.runs(), [bob, later])
+
+    def test_claim(self) -> None:
+        self.assertEqual(self.queue.put(self.run_, URLS), 3)
+        self.assertEqual(self.queue.put(self.run_, URLS[:1]), 0)
+        tasks = self.queue.claim("w1", 2)
+        self.assertEqual([task.url for task in tasks], URLS[:2])
+        self.assertEqual({(task.attempts, task.layout) for task in tasks}, {(1, "wide")})
+        self.assertEqual([task.url for task in self.queue.claim("w2", 2)], URLS[2:])
+        self.assertEqual(self.queue.claim("w2", 2), [])
+        self.queue.complete({tasks[0].id: TEST_INFO})
+        self.queue.release(tasks[1:], "error", delay=0)
+        self.assertEqual(self.queue.progress(self.run_), {"queued": 1, "leased": 1, "done": 1, "failed": 0})
+        retried = self.queue.claim("w1", 2)
+        self.assertEqual([(task.url, task.attempts) for task in retried], [(URLS[1], 2)])
+        self.queue.release(retried, "error", delay=0)
+        self.assertEqual(self.queue.progress(self.run_)["failed"], 1)
+        self.assertEqual(self.queue.results(self.run_), [TEST_INFO])
+
+    def test_fast(self) -> None:
+        self.queue.put(self.run_, URLS[:2])
+        tasks = self.queue.claim("w1", 2)
+        self.queue.complete({tasks[0].id: TEST_INFO})
+        fast_info = dataclasses.replace(TEST_INFO, aID="2", seller_name="")
+        self.queue.complete({tasks[1].id: fast_info}, fast=True)
+        self.assertEqual(self.queue.results(self.run_), [TEST_INFO, fast_info])
+        self.assertEqual(self.queue.results(self.run_, fast=False), [TEST_INFO])
+        self.assertEqual(self.queue.results(self.run_, fast=True), [fast_info])
+
+    def test_lease_expired(self) -> None:
+        self.queue.put(self.run_, URLS[:1])
+        self.queue.claim("w1", 1, lease=0)
+        self.assertEqual([task.attempts for task in self.queue.claim("w2", 1, lease=0)], [2])
+        self.assertEqual(self.queue.claim("w3", 1), [])
+        self.assertEqual(self.queue.progress(self.run_)["failed"], 1)
+
+    def test_shared(self) -> None:
+        self.queue.put(self.run_, URLS)
+        with workqueue.WorkQueue(self.data_dir / workqueue.QUEUE) as other:
+            claimed = other.claim("w2", 2)
+        self.assertEqual([task.url for task in self.queue.claim("w1", 3)], URLS[2:])
+        self.assertEqual(len(claimed), 2)
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(ValueError):
+            workqueue.WorkQueue(self.data_dir / "other.sqlite3", max_attempts=0)
+
+
+class Test_work(TestCase):
+
+    def test_default(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=3) as standin, \
+                workqueue.WorkQueue(Path(tmpdir) / workqueue.QUEUE) as queue, transport.Transport({}) as client:
+            alice = queue.start("alice", Path(tmpdir), STARTED)
+            bob = queue.start("bob", Path(tmpdir), STARTED)
+            queue.put(alice, [f"{standin.url}/item/{aid}" for aid in standin.aids[:2]])
+            queue.put(alice, [f"{standin.url}/missing/{standin.aids[2]}"])
+            queue.put(bob, [f"{standin.url}/item/{standin.aids[2]}"])
+            tasks = queue.claim("w1", 10)
+            with self.assertLogs("ya3_collect", "WARNING"):
+                count = workqueue.work(queue, tasks, {"alice": {"seller": "alice"}}, client)
+            self.assertEqual(count, 2)
+            self.assertEqual(queue.progress(alice), {"queued": 1, "leased": 0, "done": 2, "failed": 0})
+            self.assertEqual(queue.progress(bob)["queued"], 1)
+            results = queue.results(alice)
+        self.assertEqual(sorted(info.aID for info in results), standin.aids[:2])
+        self.assertEqual(results[0], dataclasses.replace(TEST_INFO, aID=results[0].aID))
+        self.assertEqual(set(standin.cookies), {"seller=alice"})
+
+    def test_fast_layout(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=2) as standin, \
+                workqueue.WorkQueue(Path(tmpdir) / workqueue.QUEUE) as queue, transport.Transport({}) as client:
+            wide = queue.start("alice", Path(tmpdir), STARTED)
+            normalized = queue.start("alice", Path(tmpdir), STARTED, "normalized")
+            queue.put(wide, [f"{standin.url}/item/{standin.aids[0]}"])
+            queue.put(normalized, [f"{standin.url}/item/{standin.aids[1]}"])
+            tasks = queue.claim("w1", 10)
+            with self.assertLogs("ya3_collect.workqueue", "WARNING"):
+                count = workqueue.work(queue, tasks, {"alice": {}}, client, fast=True)
+            self.assertEqual(count, 2)
+            self.assertEqual([info.aID for info in queue.results(wide, fast=True)], standin.aids[:1])
+            self.assertEqual(queue.results(wide, fast=False), [])
+            self.assertEqual(
+                queue.results(normalized, fast=False), [dataclasses.replace(TEST_INFO, aID=standin.aids[1])]
+            )
@@ -1,14 +1,24 @@
 # Copyright (c) 2022 Shuhei Nitta. All rights reserved.
-from unittest import TestCase, mock
+import time
+import asyncio
+import threading
+import tempfile
+import dataclasses
+import importlib.util
+from unittest import TestCase, mock, skipUnless
 from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator
 
 import bs4
 import requests
 
-from ya3_collect import yahoo_auction
+from ya3_collect import httpcache, metrics, transport, yahoo_auction
+from tests import server
 
 
 TEST_RESPONSE = requests.Response()
+TEST_RESPONSE.status_code = 200
 with open("tests/test_yahoo_auction.html", "rb") as f:
     TEST_RESPONSE._content = f.read()
 TEST_INFO = yahoo_auction.SellingItemInfo(
@@ -19,8 +29,8 @@ TEST_INFO = yahoo_auction.SellingItemInfo(
     start_datetime=datetime(2021, 10, 12, 19, 54),
     end_datetime=datetime(2021, 10, 15, 19, 54),
     refundable=False,
-    startprice="10,000 円（税 0 円）",
-    timeleft="19時間",
+    startprice=10000,
+    timeleft=19 * 3600,
     count_bid=1,
     count_access=10,
     count_watch=10
@@ -35,29 +45,115 @@ class TestSellingItemInfo_from_soup(TestCase):
         info = yahoo_auction.SellingItemInfo.from_soup(self.soup)
         self.assertEqual(info, TEST_INFO)
 
+    def test_missing_fields(self) -> None:
+        soup = bs4.BeautifulSoup("<html><body><dl><dt>個数</dt></dl></body></html>", "lxml")
+        info = yahoo_auction.SellingItemInfo.from_soup(soup)
+        self.assertEqual(info.aID, "")
+        self.assertEqual(info.stock, 0)
+        self.assertEqual(info.start_datetime, datetime(2000, 1, 1))
+        self.assertEqual(info.count_watch, 0)
 
+    def test_seller_name(self) -> None:
+        # The `data-ylk` of the link is matched by its prefix, whatever follows it.
+        for ylk in ["rsec:seller;slk:slfinfo;", "rsec:seller;slk:slfinfo;pos:1", "rsec:seller;slk:slfinfo;x:1;pos:1"]:
+            soup = bs4.BeautifulSoup(f'<html><body><a data-ylk="{ylk}">name</a></body></html>', "lxml")
+            self.assertEqual(yahoo_auction.SellingItemInfo.from_soup(soup).seller_name, "name", ylk)
+        soup = bs4.BeautifulSoup('<html><body><a data-ylk="x;rsec:seller;slk:slfinfo;">name</a></body></html>', "lxml")
+        self.assertEqual(yahoo_auction.SellingItemInfo.from_soup(soup).seller_name, "")
 
-@mock.patch("requests.get", return_value=TEST_RESPONSE)
+
+class TestSellingItemInfo_to_dict(TestCase):
+
+    def test_default(self) -> None:
+        fields = TEST_INFO.to_dict()
+        self.assertEqual(fields["start_datetime"], "2021-10-12T19:54:00")
+        self.assertEqual(yahoo_auction.SellingItemInfo.from_dict(fields), TEST_INFO)
+
+
+class TestSellingItemInfo_slots(TestCase):
+
+    def test_default(self) -> None:
+        self.assertFalse(hasattr(TEST_INFO, "__dict__"))
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            TEST_INFO.count_access = 0  # type: ignore[misc]
+
+    def test_timeleft(self) -> None:
+        self.assertEqual(yahoo_auction._parse_timeleft("3日"), 3 * 86400)
+        self.assertEqual(yahoo_auction._parse_timeleft("1時間 25分"), 3600 + 25 * 60)
+        self.assertEqual(yahoo_auction._parse_timeleft("終了"), 0)
+
+    def test_startprice(self) -> None:
+        self.assertEqual(yahoo_auction._parse_price("：1,234,567 円（税 0 円）"), 1234567)
+        self.assertEqual(yahoo_auction._parse_price("-"), 0)
+        fields = TEST_INFO.to_dict() | {"startprice": "10,000 円（税 0 円）"}
+        self.assertEqual(yahoo_auction.SellingItemInfo.from_dict(fields), TEST_INFO)
+
+
+class Test_parse_item_page(TestCase):
+
+    def test_default(self) -> None:
+        with self.assertLogs("ya3_collect.yahoo_auction", "DEBUG") as cm:
+            info = yahoo_auction.parse_item_page(TEST_RESPONSE.content)
+        self.assertEqual(info, TEST_INFO)
+        self.assertRegex(cm.output[0], rf"parsed {TEST_INFO.aID}: .* \[sec\]")
+
+
+class Test_extract_counts(TestCase):
+
+    def test_default(self) -> None:
+        info = yahoo_auction.extract_counts(TEST_RESPONSE.content)
+        assert info is not None
+        for name in yahoo_auction.FAST_FIELDS:
+            with self.subTest(name=name):
+                self.assertEqual(getattr(info, name), getattr(TEST_INFO, name))
+        self.assertEqual(info.seller_name, "")
+
+    def test_not_found(self) -> None:
+        content = TEST_RESPONSE.content.replace(b"StatisticsInfo__data", b"StatisticsInfo__value")
+        self.assertIsNone(yahoo_auction.extract_counts(content))
+        with self.assertLogs("ya3_collect.yahoo_auction", "DEBUG"):
+            self.assertEqual(yahoo_auction.parse_item_page(content, fast=True).count_access, 0)
+
+    def test_fast(self) -> None:
+        metrics.reset()
+        parsed = yahoo_auction._parse_item_page_timed(TEST_RESPONSE.content, fast=True)
+        self.assertEqual(parsed.path, "fast")
+        self.assertEqual(yahoo_auction._observe_parse(parsed).count_watch, TEST_INFO.count_watch)
+        self.assertEqual(metrics.REGISTRY.counters[("fast_parse_total", (("path", "fast"),))], 1)
+
+    def test_validate(self) -> None:
+        metrics.reset()
+        wrong = dataclasses.replace(TEST_INFO, count_access=1)
+        with mock.patch("ya3_collect.yahoo_auction.extract_counts", return_value=wrong):
+            parsed = yahoo_auction._parse_item_page_timed(TEST_RESPONSE.content, fast=True, validate=1.0)
+        self.assertEqual(parsed.path, "validated")
+        self.assertEqual(parsed.mismatches, ["count_access: 1 != 10"])
+        with self.assertLogs("ya3_collect.yahoo_auction", "WARNING") as cm:
+            self.assertEqual(yahoo_auction._observe_parse(parsed), TEST_INFO)
+        self.assertIn("count_access: 1 != 10", cm.output[0])
+        self.assertEqual(metrics.REGISTRY.counters[("fast_parse_mismatches_total", ())], 1)
+
+
+@mock.patch("requests.Session.get", return_value=TEST_RESPONSE)
 class Test_get_infos(TestCase):
 
-    @mock.patch("ya3_collect.yahoo_auction.get_selling_urls")
+    @mock.patch("ya3_collect.yahoo_auction.iter_selling_urls")
     def test_no_selling_url(
         self,
-        get_selling_urls_mock: mock.Mock,
+        iter_selling_urls_mock: mock.Mock,
         get_mock: mock.Mock
     ) -> None:
-        get_selling_urls_mock.return_value = []
+        iter_selling_urls_mock.return_value = []
         infos = yahoo_auction.get_infos(dict())
         self.assertEqual(len(infos), 0)
 
-    
-    @mock.patch("ya3_collect.yahoo_auction.get_selling_urls")
+    @mock.patch("ya3_collect.yahoo_auction.iter_selling_urls")
     def test_3_selling_urls(
         self,
-        get_selling_urls_mock: mock.Mock,
+        iter_selling_urls_mock: mock.Mock,
         get_mock: mock.Mock
     ) -> None:
-        get_selling_urls_mock.return_value = [
+        iter_selling_urls_mock.return_value = [
             "http://example.com/1",
             "http://example.com/2",
             "http://example.com/3"
@@ -68,5 +164,369 @@ class Test_get_infos(TestCase):
         for i, info in enumerate(infos):
             with self.subTest(i=i):
                 self.assertEqual(info, TEST_INFO)
-        get_selling_urls_mock.assert_called_once_with(cookies, timeout=timeout)
-        self.assertEqual(len(get_mock.mock_calls), len(get_selling_urls_mock.return_value))
+        iter_selling_urls_mock.assert_called_once_with(cookies, timeout=timeout, client=mock.ANY)
+        self.assertEqual(len(get_mock.mock_calls), len(iter_selling_urls_mock.return_value))
+
+    @mock.patch("ya3_collect.yahoo_auction.iter_selling_urls")
+    def test_parse_workers(
+        self,
+        iter_selling_urls_mock: mock.Mock,
+        get_mock: mock.Mock
+    ) -> None:
+        iter_selling_urls_mock.return_value = [
+            "http://example.com/1",
+            "http://example.com/2",
+            "http://example.com/3"
+        ]
+        infos = yahoo_auction.get_infos(dict(), parse_workers=2)
+        self.assertEqual(infos, [TEST_INFO] * 3)
+        infos = yahoo_auction.get_infos(dict(), parse_workers=2, fast=True, validate=0.5)
+        self.assertEqual([info.count_access for info in infos], [TEST_INFO.count_access] * 3)
+
+
+@mock.patch("requests.Session.get", return_value=TEST_RESPONSE)
+class Test_iter_infos(TestCase):
+
+    @mock.patch("ya3_collect.yahoo_auction.iter_selling_urls")
+    def test_streaming(
+        self,
+        iter_selling_urls_mock: mock.Mock,
+        get_mock: mock.Mock
+    ) -> None:
+        iter_selling_urls_mock.return_value = [
+            "http://example.com/1",
+            "http://example.com/2"
+        ]
+        infos = yahoo_auction.iter_infos(dict())
+        self.assertEqual(next(infos), TEST_INFO)
+        self.assertEqual(list(infos), [TEST_INFO])
+
+    def test_overlap_listing(self, get_mock: mock.Mock) -> None:
+        consumed = threading.Event()
+        waited: list[bool] = []
+
+        def iter_selling_urls(*args: Any, **kwargs: Any) -> Iterator[str]:
+            yield "http://example.com/1"
+            waited.append(consumed.wait(10))
+            yield "http://example.com/2"
+
+        with mock.patch("ya3_collect.yahoo_auction.iter_selling_urls", side_effect=iter_selling_urls):
+            infos = yahoo_auction.iter_infos(dict())
+            self.assertEqual(next(infos), TEST_INFO)
+            consumed.set()
+            self.assertEqual(list(infos), [TEST_INFO])
+        self.assertEqual(waited, [True])
+
+    def test_urls_error(self, get_mock: mock.Mock) -> None:
+        def urls() -> Iterator[str]:
+            yield "http://example.com/1"
+            raise ValueError("broken")
+
+        infos = yahoo_auction.iter_infos(dict(), urls=urls())
+        self.assertEqual(next(infos), TEST_INFO)
+        with self.assertRaisesRegex(ValueError, "broken"):
+            next(infos)
+
+
+class Test_iter_infos_metrics(TestCase):
+
+    def test_stages(self) -> None:
+        registry = metrics.reset()
+        with server.StandInServer(n_items=5, page_size=2) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url):
+            infos = yahoo_auction.get_infos(dict(), parse_workers=2)
+        self.assertEqual(len(infos), 5)
+        self.assertEqual(registry.histograms[("listing_fetch_seconds", ())].count, 3)
+        self.assertEqual(registry.histograms[("item_fetch_seconds", ())].count, 5)
+        self.assertEqual(registry.histograms[("parse_seconds", ())].count, 5)
+        self.assertEqual(registry.counters[("http_responses_total", (("status", "200"),))], 8)
+        self.assertGreater(registry.counters[("downloaded_bytes_total", ())], 5 * len(TEST_RESPONSE.content))
+
+
+class Test_iter_infos_cache(TestCase):
+
+    def test_not_modified(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=3) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                httpcache.HTTPCache(Path(tmpdir)) as cache, transport.Transport({}, cache=cache) as client:
+            first = yahoo_auction.get_infos(dict(), client=client)
+            registry = metrics.reset()
+            second = yahoo_auction.get_infos(dict(), client=client)
+        self.assertEqual(sorted(first, key=lambda info: info.aID), sorted(second, key=lambda info: info.aID))
+        self.assertEqual(registry.counters[("http_responses_total", (("status", "304"),))], 4)
+        self.assertEqual(registry.counters[("http_cache_total", (("result", "hit"),))], 4)
+        self.assertEqual(registry.counters[("parse_reused_total", ())], 3)
+        self.assertNotIn(("parse_seconds", ()), registry.histograms)
+
+    def test_fast(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=1) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                httpcache.HTTPCache(Path(tmpdir)) as cache, transport.Transport({}, cache=cache) as client:
+            yahoo_auction.get_infos(dict(), client=client, fast=True)
+            registry = metrics.reset()
+            infos = yahoo_auction.get_infos(dict(), client=client)
+        self.assertEqual(infos[0], dataclasses.replace(TEST_INFO, title=infos[0].title))
+        self.assertNotIn(("parse_reused_total", ()), registry.counters)
+
+    def test_parser_version(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir, server.StandInServer(n_items=1) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                httpcache.HTTPCache(Path(tmpdir)) as cache, transport.Transport({}, cache=cache) as client:
+            yahoo_auction.get_infos(dict(), client=client)
+            with mock.patch("ya3_collect.yahoo_auction.PARSER_VERSION", yahoo_auction.PARSER_VERSION + 1):
+                registry = metrics.reset()
+                infos = yahoo_auction.get_infos(dict(), client=client)
+        self.assertEqual(infos[0], dataclasses.replace(TEST_INFO, title=infos[0].title))
+        self.assertNotIn(("parse_reused_total", ()), registry.counters)
+        self.assertEqual(registry.counters[("http_cache_total", (("result", "hit"),))], 2)
+
+
+class Test_iter_infos_requeue(TestCase):
+
+    def setUp(self) -> None:
+        self.failed: set[str] = set()
+        self.get_item_page = yahoo_auction._get_item_page
+
+    def fail_once(self, status: int, retry_after: str = "") -> Any:
+        def get_item_page(client: transport.Transport, url: str) -> tuple[str, bytes]:
+            if url not in self.failed:
+                self.failed.add(url)
+                response = requests.Response()
+                response.status_code = status
+                if retry_after:
+                    response.headers["Retry-After"] = retry_after
+                raise requests.HTTPError(response=response)
+            return self.get_item_page(client, url)
+        return get_item_page
+
+    @mock.patch("ya3_collect.yahoo_auction.REQUEUE_BACKOFF", 0)
+    def test_transient(self) -> None:
+        registry = metrics.reset()
+        with server.StandInServer(n_items=5) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                mock.patch("ya3_collect.yahoo_auction._get_item_page", self.fail_once(503)):
+            infos = yahoo_auction.get_infos(dict())
+        self.assertEqual(sorted(info.aID for info in infos), standin.aids)
+        self.assertEqual(registry.counters[("requeued_total", ())], 5)
+
+    def test_retry_after(self) -> None:
+        with server.StandInServer(n_items=1) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                mock.patch("ya3_collect.yahoo_auction._get_item_page", self.fail_once(429, "1")):
+            start = time.monotonic()
+            infos = yahoo_auction.get_infos(dict())
+            self.assertGreaterEqual(time.monotonic() - start, 1)
+            self.assertEqual(standin.paths[-1], f"/item/{standin.aids[0]}")
+        self.assertEqual(len(infos), 1)
+
+    def test_not_transient(self) -> None:
+        with server.StandInServer(n_items=2) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                mock.patch("ya3_collect.yahoo_auction._get_item_page", self.fail_once(404)):
+            infos = yahoo_auction.get_infos(dict())
+        self.assertEqual(infos, [])
+
+    @mock.patch("ya3_collect.yahoo_auction.REQUEUE_BACKOFF", 0)
+    def test_no_requeue(self) -> None:
+        with server.StandInServer(n_items=2) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url), \
+                mock.patch("ya3_collect.yahoo_auction._get_item_page", self.fail_once(503)):
+            infos = yahoo_auction.get_infos(dict(), requeue=0)
+        self.assertEqual(infos, [])
+
+
+@skipUnless(importlib.util.find_spec("aiohttp"), "aiohttp is not installed")
+class Test_get_infos_async(TestCase):
+
+    def setUp(self) -> None:
+        self.server = server.StandInServer(n_items=5, page_size=2).__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        patcher = mock.patch("ya3_collect.yahoo_auction.SELLING_URL", self.server.selling_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.expected = [dataclasses.replace(TEST_INFO, aID=aid) for aid in self.server.aids]
+
+    def test_default(self) -> None:
+        infos = asyncio.run(yahoo_auction.get_infos_async(dict()))
+        self.assertEqual(sorted(infos, key=lambda info: info.aID), self.expected)
+
+    def test_error(self) -> None:
+        registry = metrics.reset()
+        with mock.patch("ya3_collect.yahoo_auction._parse_item_page_timed", side_effect=ValueError), \
+                self.assertLogs("ya3_collect.yahoo_auction", "ERROR"):
+            infos = asyncio.run(yahoo_auction.get_infos_async(dict()))
+        self.assertEqual(infos, [])
+        self.assertEqual(registry.counters[("errors_total", (("stage", "fetch"),))], 5)
+
+    def fail_once(self, status: int, retry_after: str = "") -> Any:
+        import aiohttp
+        import multidict
+
+        failed: set[str] = set()
+        get = transport.AsyncTransport.get
+
+        async def get_once(client: transport.AsyncTransport, url: str) -> bytes:
+            if "/item/" in url and url not in failed:
+                failed.add(url)
+                headers = multidict.CIMultiDict({"Retry-After": retry_after} if retry_after else {})
+                raise aiohttp.ClientResponseError(mock.Mock(), (), status=status, headers=headers)
+            return await get(client, url)
+        return mock.patch("ya3_collect.transport.AsyncTransport.get", get_once)
+
+    @mock.patch("ya3_collect.yahoo_auction.REQUEUE_BACKOFF", 0)
+    def test_requeue(self) -> None:
+        registry = metrics.reset()
+        with self.fail_once(503):
+            infos = asyncio.run(yahoo_auction.get_infos_async(dict()))
+        self.assertEqual(sorted(infos, key=lambda info: info.aID), self.expected)
+        self.assertEqual(registry.counters[("requeued_total", ())], 5)
+
+    def test_retry_after(self) -> None:
+        with self.fail_once(429, "1"):
+            start = time.monotonic()
+            infos = asyncio.run(yahoo_auction.get_infos_async(dict()))
+            self.assertGreaterEqual(time.monotonic() - start, 1)
+        self.assertEqual(sorted(infos, key=lambda info: info.aID), self.expected)
+
+    @mock.patch("ya3_collect.yahoo_auction.REQUEUE_BACKOFF", 0)
+    def test_not_requeued(self) -> None:
+        with self.fail_once(404), self.assertLogs("ya3_collect.yahoo_auction", "ERROR"):
+            infos = asyncio.run(yahoo_auction.get_infos_async(dict()))
+        self.assertEqual(infos, [])
+        with self.fail_once(503), self.assertLogs("ya3_collect.yahoo_auction", "ERROR"):
+            infos = asyncio.run(yahoo_auction.get_infos_async(dict(), requeue=0))
+        self.assertEqual(infos, [])
+
+    def test_same_as_thread_engine(self) -> None:
+        infos = asyncio.run(yahoo_auction.get_infos_async(dict()))
+        thread_infos = yahoo_auction.get_infos(dict())
+        self.assertEqual(
+            sorted(infos, key=lambda info: info.aID),
+            sorted(thread_infos, key=lambda info: info.aID)
+        )
+
+    def test_client(self) -> None:
+        async def collect() -> list[yahoo_auction.SellingItemInfo]:
+            async with transport.AsyncTransport(dict(), pool_size=2, pool_size_per_host=1) as client:
+                return await yahoo_auction.get_infos_async(dict(), client=client)
+
+        infos = asyncio.run(collect())
+        self.assertEqual(sorted(infos, key=lambda info: info.aID), self.expected)
+
+
+class Test_iter_selling_urls(TestCase):
+
+    def test_pagination(self) -> None:
+        with server.StandInServer(n_items=5, page_size=2, show_total=False) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url):
+            urls = list(yahoo_auction.iter_selling_urls(dict()))
+        self.assertEqual(urls, [f"{standin.url}/item/{aid}" for aid in standin.aids])
+
+    def test_concurrent_pages(self) -> None:
+        with server.StandInServer(n_items=5, page_size=2) as standin, \
+                mock.patch("ya3_collect.yahoo_auction.SELLING_URL", standin.selling_url):
+            urls = list(yahoo_auction.iter_selling_urls(dict()))
+        self.assertEqual(sorted(urls), [f"{standin.url}/item/{aid}" for aid in standin.aids])
+        self.assertEqual(
+            sorted(standin.paths),
+            ["/mystatus?select=selling", "/mystatus?select=selling&apg=2", "/mystatus?select=selling&apg=3"]
+        )
+
+    @mock.patch("ya3_collect.yahoo_auction._parse_listing_page")
+    def test_deduplicate(self, parse_listing_page_mock: mock.Mock) -> None:
+        parse_listing_page_mock.side_effect = [
+            yahoo_auction._ListingPage(
+                ["http://example.com/jp/auction/1", "http://example.com/jp/auction/2"], "http://example.com/2", 0
+            ),
+            yahoo_auction._ListingPage(
+                ["http://example.com/jp/auction/2", "http://example.com/jp/auction/3"], "", 0
+            ),
+        ]
+        client = mock.Mock(transport.Transport)
+        urls = list(yahoo_auction.iter_selling_urls(dict(), client=client))
+        self.assertEqual(urls, [f"http://example.com/jp/auction/{i}" for i in range(1, 4)])
+        self.assertEqual(len(client.get.mock_calls), 2)
+
+    @mock.patch("ya3_collect.yahoo_auction._parse_listing_page")
+    def test_wrong_guess(self, parse_listing_page_mock: mock.Mock) -> None:
+        # `x=2` is taken for the page number, but the page it guesses repeats the first page.
+        first = yahoo_auction._ListingPage(
+            ["http://example.com/jp/auction/1", "http://example.com/jp/auction/2"],
+            f"{yahoo_auction.SELLING_URL}&x=2",
+            4
+        )
+        parse_listing_page_mock.side_effect = [
+            first,
+            first,
+            yahoo_auction._ListingPage(
+                ["http://example.com/jp/auction/3", "http://example.com/jp/auction/4"], "", 4
+            ),
+        ]
+        client = mock.Mock(transport.Transport, pool_size=1)
+        registry = metrics.reset()
+        with self.assertLogs("ya3_collect.yahoo_auction", "WARNING"):
+            urls = list(yahoo_auction.iter_selling_urls(dict(), client=client))
+        self.assertEqual(urls, [f"http://example.com/jp/auction/{i}" for i in range(1, 5)])
+        self.assertEqual(len(client.get.mock_calls), 3)
+        self.assertEqual(registry.counters[("listing_fallback_total", ())], 1)
+
+    @mock.patch("ya3_collect.yahoo_auction._parse_listing_page")
+    def test_wrong_guess_async(self, parse_listing_page_mock: mock.Mock) -> None:
+        first = yahoo_auction._ListingPage(
+            ["http://example.com/jp/auction/1", "http://example.com/jp/auction/2"],
+            f"{yahoo_auction.SELLING_URL}&x=2",
+            4
+        )
+        parse_listing_page_mock.side_effect = [
+            first,
+            first,
+            yahoo_auction._ListingPage(
+                ["http://example.com/jp/auction/3", "http://example.com/jp/auction/4"], "", 4
+            ),
+        ]
+        client = mock.Mock(transport.AsyncTransport)
+
+        async def collect() -> list[str]:
+            return [url async for url in yahoo_auction._iter_selling_urls_async(client)]
+
+        registry = metrics.reset()
+        with self.assertLogs("ya3_collect.yahoo_auction", "WARNING"):
+            urls = asyncio.run(collect())
+        self.assertEqual(urls, [f"http://example.com/jp/auction/{i}" for i in range(1, 5)])
+        self.assertEqual(len(client.get.mock_calls), 3)
+        self.assertEqual(registry.counters[("listing_fallback_total", ())], 1)
+
+
+class Test_get_page_urls(TestCase):
+
+    def setUp(self) -> None:
+        self.url = "http://example.com/mystatus?select=selling"
+
+    def test_page_number(self) -> None:
+        page = yahoo_auction._ListingPage(["a"] * 50, f"{self.url}&apg=2", 120)
+        self.assertEqual(
+            yahoo_auction._get_page_urls(self.url, page),
+            [f"{self.url}&apg=2", f"{self.url}&apg=3"]
+        )
+
+    def test_offset(self) -> None:
+        page = yahoo_auction._ListingPage(["a"] * 50, f"{self.url}&b=51&n=50", 151)
+        self.assertEqual(
+            yahoo_auction._get_page_urls(self.url, page),
+            [f"{self.url}&b=51&n=50", f"{self.url}&b=101&n=50", f"{self.url}&b=151&n=50"]
+        )
+
+    def test_unknown_total(self) -> None:
+        page = yahoo_auction._ListingPage(["a"] * 50, f"{self.url}&apg=2", 0)
+        self.assertEqual(yahoo_auction._get_page_urls(self.url, page), [])
+
+    def test_page_size_parameter(self) -> None:
+        page = yahoo_auction._ListingPage(["a"] * 50, f"{self.url}&n=50&b=51", 120)
+        self.assertEqual(
+            yahoo_auction._get_page_urls(self.url, page),
+            [f"{self.url}&n=50&b=51", f"{self.url}&n=50&b=101"]
+        )
+
+    def test_unknown_parameter(self) -> None:
+        page = yahoo_auction._ListingPage(["a"] * 50, f"{self.url}&token=12345", 120)
+        self.assertEqual(yahoo_auction._get_page_urls(self.url, page), [])
@@ -0,0 +1,276 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import shutil
+import logging
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from ya3_collect import compaction, constants, dataframe, storage
+
+
+COUNTERS = list(constants.COUNTERS)
+DELTAS = [f"{counter}_delta" for counter in COUNTERS]
+FREQUENCIES = {"hourly": "H", "daily": "D"}
+ROLLUPS = "rollups"
+LAST = "last"
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_storage(data_dir: Path, data_format: str = "csv.gz", layout: str = "wide") -> storage.Storage:
+    """
+    Storage of the data files which have the snapshots of the counters in `layout`.
+    """
+    if layout == "normalized":
+        return storage.get_storage(data_format, Path(data_dir) / storage.SNAPSHOTS, dataframe.SnapshotFrame)
+    return storage.get_storage(data_format, data_dir)
+
+
+def read_snapshots(
+    store: storage.Storage,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> dataframe.SnapshotFrame:
+    """
+    Read the snapshots from `start` to `end` by `compaction.load`, from the compacted partitions and the daily data
+    files of the days in the range only, forward-filling those written with the `delta` encoding.
+
+    Parameters
+    ----------
+    store : storage.Storage
+        Storage of the snapshots, whose frame has the columns of `dataframe.SnapshotFrame`.
+    start : datetime, optional
+        Only the snapshots at or after `start` are read if given.
+    end : datetime, optional
+        Only the snapshots before `end` are read if given.
+
+    Returns
+    -------
+    dataframe.SnapshotFrame
+        Snapshots sorted by aID and time.
+    """
+    df = compaction.load(store, start=start, end=end, columns=dataframe.SNAPSHOT_COLUMNS)
+    return dataframe.SnapshotFrame(df.astype(dataframe.SNAPSHOT_DTYPES))
+
+
+def deltas(snapshots: pd.DataFrame, last: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Increase of the counters of each item since its previous snapshot.
+
+    The snapshots are sorted by aID and time, and each row is subtracted by the row above it in NumPy arrays,
+    masked where the aID changes, so that the cost is that of a sort of the snapshots.
+
+    Parameters
+    ----------
+    snapshots : pd.DataFrame
+        Snapshots with the columns of `dataframe.SNAPSHOT_COLUMNS`.
+    last : pd.DataFrame, optional
+        Previous snapshot of the items, which the first snapshot of each item in `snapshots` is compared with.
+
+    Returns
+    -------
+    pd.DataFrame
+        The snapshots sorted by aID and time, with the seconds since the previous snapshot in `elapsed`
+        and the increases of the counters in `<counter>_delta`. They are NaN for the first snapshot of an item.
+    """
+    df = snapshots[dataframe.SNAPSHOT_COLUMNS]
+    n_last = 0
+    if last is not None and len(last) > 0:
+        n_last = len(last)
+        df = pd.concat([last[dataframe.SNAPSHOT_COLUMNS], df], ignore_index=True)
+    codes, _ = pd.factorize(df["aID"].astype("str"), sort=True)
+    times = df["datetime"].to_numpy(dtype="datetime64[ns]")
+    is_last = np.arange(len(df)) < n_last
+    order = np.lexsort((~is_last, times, codes))  # a snapshot at the same time as `last` comes after it
+    codes, times, is_last = codes[order], times[order], is_last[order]
+    same = np.zeros(len(df), dtype=bool)
+    same[1:] = codes[1:] == codes[:-1]
+    result = df.iloc[order].reset_index(drop=True)
+    elapsed = np.full(len(df), np.nan)
+    elapsed[1:] = (times[1:] - times[:-1]) / np.timedelta64(1, "s")
+    result["elapsed"] = np.where(same, elapsed, np.nan)
+    for counter, column in zip(COUNTERS, DELTAS):
+        values = result[counter].to_numpy(dtype="float64")
+        diff = np.full(len(df), np.nan)
+        diff[1:] = values[1:] - values[:-1]
+        result[column] = np.where(same, diff, np.nan)
+    result = result[~is_last].reset_index(drop=True)
+    return result.astype({"aID": "category"})
+
+
+def _combine(df: pd.DataFrame, freq: str) -> dataframe.RollupFrame:
+    # The rows of each item should be in time order, so that the last one has the latest counters.
+    grouped = df.assign(datetime=df["datetime"].dt.floor(FREQUENCIES[freq])).groupby(
+        ["aID", "datetime"], observed=True, sort=True
+    )
+    aggregations = {
+        "count": ("count", "sum"),
+        **{counter: (counter, "last") for counter in COUNTERS},
+        **{delta: (delta, "sum") for delta in DELTAS},
+    }
+    rolled = grouped.agg(**aggregations).reset_index()
+    return dataframe.RollupFrame(rolled[dataframe.ROLLUP_COLUMNS].astype(dataframe.ROLLUP_DTYPES))
+
+
+def rollup(changes: pd.DataFrame, freq: str = "hourly") -> dataframe.RollupFrame:
+    """
+    Aggregate the increases of the counters per item and period.
+
+    Parameters
+    ----------
+    changes : pd.DataFrame
+        Increases of the counters returned by `deltas`.
+    freq : str
+        One of `FREQUENCIES`.
+
+    Returns
+    -------
+    dataframe.RollupFrame
+        Rollups sorted by aID and period.
+    """
+    return _combine(changes.assign(count=1), freq)
+
+
+def top_movers(rollups: pd.DataFrame, counter: str = "access", n: int = 10) -> pd.DataFrame:
+    """
+    The `n` items whose `counter` increased the most in `rollups`.
+
+    Parameters
+    ----------
+    rollups : pd.DataFrame
+        Rollups in time order for each item.
+    counter : str
+        One of `COUNTERS`.
+    n : int
+        Number of the items.
+
+    Returns
+    -------
+    pd.DataFrame
+        aID, `increase` of the counter, its `latest` value and the number of the `snapshots` of the items,
+        in descending order of the increase.
+    """
+    grouped = rollups.groupby("aID", observed=True, sort=False).agg(
+        increase=(f"{counter}_delta", "sum"), latest=(counter, "last"), snapshots=("count", "sum")
+    )
+    return grouped.nlargest(n, "increase", keep="first").reset_index().astype({"aID": "str"})
+
+
+class Rollups:
+    """
+    Hourly and daily rollups of the snapshots under `<data_dir>/rollups`, which are updated incrementally.
+
+    The rollups are saved per day in the format of the data. The last snapshot of each item rolled up so far
+    is saved as `rollups/last`, so that an update reads only the snapshots newer than it,
+    and rewrites only the rollups of the days of the new snapshots.
+    The rollups should be rebuilt after snapshots older than the last update are added, e.g. by `reparse`.
+
+    Parameters
+    ----------
+    data_dir : Path
+        Directory where data is saved.
+    data_format : str
+        One of `storage.FORMATS`.
+    layout : str
+        Layout of the data, one of `constants.LAYOUTS`.
+    """
+
+    def __init__(self, data_dir: Path, data_format: str = "csv.gz", layout: str = "wide") -> None:
+        self.root = Path(data_dir) / ROLLUPS
+        self.snapshots = snapshot_storage(data_dir, data_format, layout)
+        self.stores = {
+            freq: storage.get_storage(data_format, self.root / freq, dataframe.RollupFrame) for freq in FREQUENCIES
+        }
+        self.state = storage.get_storage(data_format, self.root, dataframe.SnapshotFrame)
+
+    def last(self) -> Optional[dataframe.SnapshotFrame]:
+        """
+        The last snapshot of each item rolled up so far, or None if nothing is rolled up.
+        """
+        if not self.state.exists(LAST):
+            return None
+        return dataframe.SnapshotFrame(self.state.read(LAST))
+
+    def update(self) -> int:
+        """
+        Roll up the snapshots added since the last update.
+
+        Returns
+        -------
+        int
+            Number of the new snapshots.
+        """
+        last = self.last()
+        start: Optional[datetime] = None
+        if last is not None and len(last) > 0:
+            start = pd.Timestamp(last["datetime"].max()).to_pydatetime()
+        new = read_snapshots(self.snapshots, start=start)
+        if start is not None:
+            new = dataframe.SnapshotFrame(new[new["datetime"] > start].reset_index(drop=True))
+        if len(new) == 0:
+            return 0
+        hourly = rollup(deltas(new, last), "hourly")
+        for day, part in hourly.groupby(hourly["datetime"].dt.date, sort=True):
+            if self.stores["hourly"].exists(day):
+                existing = self.stores["hourly"].read(day)
+                part = _combine(pd.concat([existing, part], ignore_index=True), "hourly")
+            part = dataframe.RollupFrame(part.reset_index(drop=True))
+            self.stores["hourly"].write(part, day)
+            self.stores["daily"].write(_combine(part, "daily"), day)
+        latest = pd.concat([last, new], ignore_index=True) if last is not None else new
+        latest = latest.sort_values("datetime", kind="mergesort").drop_duplicates("aID", keep="last")
+        latest = latest.reset_index(drop=True).astype(dataframe.SNAPSHOT_DTYPES)
+        self.state.write(dataframe.SnapshotFrame(latest), LAST)
+        logger.debug(f"rolled up {len(new)} snapshots into {len(hourly)} hourly rows")
+        return len(new)
+
+    def rebuild(self) -> int:
+        """
+        Remove the rollups and roll up all the snapshots again.
+
+        Returns
+        -------
+        int
+            Number of the snapshots.
+        """
+        if self.root.exists():
+            shutil.rmtree(self.root)
+        return self.update()
+
+    def read(
+        self,
+        freq: str = "hourly",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> dataframe.RollupFrame:
+        """
+        Read the rollups of the periods from `start` to `end`.
+
+        Parameters
+        ----------
+        freq : str
+            One of `FREQUENCIES`.
+        start : datetime, optional
+            Only the periods starting at or after `start` are read if given.
+        end : datetime, optional
+            Only the periods starting before `end` are read if given.
+
+        Returns
+        -------
+        dataframe.RollupFrame
+            Rollups in the order of the days, sorted by aID and period in each day.
+        """
+        store = self.stores[freq]
+        days: list[date] = [
+            day for day in store.days()
+            if (start is None or day >= start.date()) and (end is None or day <= end.date())
+        ]
+        frames = [store.read(day, start=start, end=end) for day in days]
+        if not frames:
+            empty = pd.DataFrame(columns=dataframe.ROLLUP_COLUMNS)
+            return dataframe.RollupFrame(empty.astype(dataframe.ROLLUP_DTYPES))
+        return dataframe.RollupFrame(pd.concat(frames, ignore_index=True).astype(dataframe.ROLLUP_DTYPES))
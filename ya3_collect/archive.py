@@ -0,0 +1,167 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import csv
+import gzip
+import dataclasses
+from datetime import date, datetime
+from pathlib import Path
+from types import TracebackType
+from typing import Iterator, Optional, Sequence
+
+from ya3_collect import constants
+
+
+PAGES_SUFFIX = ".pages.gz"
+INDEX_SUFFIX = ".index.csv"
+RUN_FORMAT = "%Y-%m-%dT%H-%M-%S"
+INDEX_COLUMNS = ["aID", "fetched", "offset", "size", "url"]
+
+
+@dataclasses.dataclass(frozen=True)
+class Entry:
+    """
+    Index entry of an item page in an archive, whose compressed bytes are `size` bytes at `offset` of the pages.
+    """
+    aID: str
+    fetched: datetime
+    offset: int
+    size: int
+    url: str
+
+
+def path(archive_dir: Path, started: datetime) -> Path:
+    """
+    Path of the pages of the archive of the run started at `started`, `YYYY-MM-DD/YYYY-MM-DDTHH-MM-SS.pages.gz`.
+    """
+    name = f"{started.strftime(RUN_FORMAT)}{PAGES_SUFFIX}"
+    return Path(archive_dir) / started.strftime(constants.DATE_FORMAT) / name
+
+
+def paths(archive_dir: Path, days: Optional[Sequence[date]] = None) -> list[Path]:
+    """
+    Paths of the pages of the archives in `archive_dir` in the order of the runs.
+
+    Parameters
+    ----------
+    archive_dir : Path
+        Directory of the archives.
+    days : Sequence[date], optional
+        Days of the runs. The archives of all the days are listed if not given.
+
+    Returns
+    -------
+    list[Path]
+        Paths of the pages of the archives.
+    """
+    found = sorted(Path(archive_dir).glob(f"*/*{PAGES_SUFFIX}"), key=lambda path: path.name)
+    if days is not None:
+        found = [path for path in found if Reader(path).started.date() in days]
+    return found
+
+
+class Writer:
+    """
+    Append-only archive of the raw item pages fetched in a run.
+
+    Each page is compressed as a gzip member appended to the pages file, and then indexed by its aID and fetch time
+    in the index file next to it, so that an interrupted run leaves only the pages indexed so far.
+
+    Parameters
+    ----------
+    archive_dir : Path
+        Directory of the archives.
+    started : datetime
+        Start time of the run.
+    """
+
+    def __init__(self, archive_dir: Path, started: datetime) -> None:
+        self.path = path(archive_dir, started)
+        self.index_path = self.path.with_name(self.path.name[:-len(PAGES_SUFFIX)] + INDEX_SUFFIX)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        new = not self.index_path.exists()
+        self._pages = open(self.path, "ab")
+        self._index = open(self.index_path, "a", newline="")
+        self._writer = csv.writer(self._index, lineterminator="\n")
+        if new:
+            self._writer.writerow(INDEX_COLUMNS)
+        self.count = 0
+
+    def __enter__(self) -> Writer:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        self.close()
+
+    def add(self, aID: str, url: str, content: bytes, fetched: Optional[datetime] = None) -> Entry:
+        """
+        Append the raw bytes of an item page.
+
+        Parameters
+        ----------
+        aID : str
+            aID of the item.
+        url : str
+            URL of the page.
+        content : bytes
+            Body of the response of the page.
+        fetched : datetime, optional
+            Time when the page is fetched. Now if not given.
+
+        Returns
+        -------
+        Entry
+            Index entry of the page.
+        """
+        compressed = gzip.compress(content, compresslevel=6)
+        entry = Entry(aID, fetched or datetime.now(), self._pages.tell(), len(compressed), url)
+        self._pages.write(compressed)
+        self._pages.flush()
+        self._writer.writerow([
+            entry.aID, entry.fetched.isoformat(timespec="microseconds"), entry.offset, entry.size, entry.url
+        ])
+        self._index.flush()
+        self.count += 1
+        return entry
+
+    def close(self) -> None:
+        self._pages.close()
+        self._index.close()
+
+
+class Reader:
+    """
+    Reader of an archive written by `Writer`.
+
+    Parameters
+    ----------
+    path : Path
+        Path of the pages of the archive.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name[:-len(PAGES_SUFFIX)] + INDEX_SUFFIX)
+        self.started = datetime.strptime(self.path.name[:-len(PAGES_SUFFIX)], RUN_FORMAT)
+
+    def entries(self) -> Iterator[Entry]:
+        with open(self.index_path, newline="") as f:
+            for row in csv.DictReader(f):
+                fetched = datetime.fromisoformat(row["fetched"])
+                yield Entry(row["aID"], fetched, int(row["offset"]), int(row["size"]), row["url"])
+
+    def read(self, entry: Entry) -> bytes:
+        return read(self.path, entry.offset, entry.size)
+
+
+def read(path: Path, offset: int, size: int) -> bytes:
+    """
+    Raw bytes of the page of `size` compressed bytes at `offset` of the pages of an archive.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return gzip.decompress(f.read(size))
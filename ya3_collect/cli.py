@@ -1,16 +1,23 @@
 # Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+# The modules depending on pandas, requests or bs4 are imported in the commands which need them,
+# so that `--help` and the light commands start without loading them.
+from __future__ import annotations
+import time
 import logging
 import json
+import contextlib
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Sequence, TYPE_CHECKING
 
 import click
-import pandas as pd
 
-from ya3_collect import log, dataframe, yahoo_auction
+from ya3_collect import log, constants
+
+if TYPE_CHECKING:
+    from ya3_collect import archive, httpcache, journal, transport, workqueue, yahoo_auction
 
 
-DATAFILE_SUFFIX = ".csv.gz"
 COOKIES_FILE = "cookies.json"
 
 logger = logging.getLogger("ya3_collect")
@@ -44,42 +51,1093 @@ def logout() -> None:
     raise NotImplementedError("This feature will be implemented at v 0.1.0")
 
 
+def _storage_options(func: Callable[..., None]) -> Callable[..., None]:
+    options = [
+        click.option(
+            "--data-dir",
+            type=click.types.Path(path_type=Path),
+            default=Path("data"),
+            help="directory where data is saved",
+            show_default=True
+        ),
+        click.option(
+            "--format",
+            "data_format",
+            type=click.Choice(constants.DATA_FORMATS),
+            default="csv.gz",
+            help="format of data files (parquet requires pyarrow)",
+            show_default=True
+        ),
+        click.option(
+            "--layout",
+            type=click.Choice(constants.LAYOUTS),
+            default="wide",
+            help="save a row with the title per snapshot, or narrow snapshots and a table of items updated on change",
+            show_default=True
+        ),
+        click.option(
+            "--write-mode",
+            type=click.Choice(constants.WRITE_MODES),
+            default="append",
+            help="append only the new rows to the data file, or read and rewrite the whole file",
+            show_default=True
+        ),
+        click.option(
+            "--encoding",
+            type=click.Choice(constants.ENCODINGS),
+            default="dense",
+            help="write the snapshots of all the items at every run, or only those changed since the previous run "
+                 "with a periodic keyframe of all the items",
+            show_default=True
+        ),
+        click.option(
+            "--keyframe-interval",
+            type=click.FloatRange(min=0),
+            default=3600,
+            help="interval between the keyframes of the delta encoding in seconds (0 writes every run in full)",
+            show_default=True
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def _fetch_options(func: Callable[..., None]) -> Callable[..., None]:
+    options = [
+        click.option(
+            "--fast-parse",
+            is_flag=True,
+            default=False,
+            help="extract only the aID, the title and the counters from the raw item pages without building a DOM, "
+                 "parsing a page in full when they are not found (only with the wide layout, "
+                 "so a worker parses in full the pages of the runs enqueued in another)",
+        ),
+        click.option(
+            "--validate-fast-parse",
+            type=click.FloatRange(min=0, max=1),
+            default=0,
+            help="ratio of the pages extracted by --fast-parse which are also parsed in full to report any "
+                 "disagreement",
+            show_default=True
+        ),
+        click.option(
+            "--parse-workers",
+            type=click.IntRange(min=0),
+            default=0,
+            help="number of processes parsing item pages (0 parses them in the main process)",
+            show_default=True
+        ),
+        click.option(
+            "--pool-size",
+            type=click.IntRange(min=1),
+            default=constants.DEFAULT_POOL_SIZE,
+            help="number of kept-alive connections, which is also the number of concurrent requests",
+            show_default=True
+        ),
+        click.option(
+            "--adaptive-concurrency",
+            is_flag=True,
+            default=False,
+            help="adjust the number of concurrent requests up to --pool-size from the latency and the throttling "
+                 "of the responses, starting from one",
+        ),
+        click.option(
+            "--retries",
+            type=click.IntRange(min=0),
+            default=3,
+            help="number of retries of a request failed with a transient error",
+            show_default=True
+        ),
+        click.option(
+            "--connect-timeout",
+            type=click.FloatRange(min=0, min_open=True),
+            default=10,
+            help="timeout to connect to the server in seconds",
+            show_default=True
+        ),
+        click.option(
+            "--timeout",
+            type=click.FloatRange(min=0, min_open=True),
+            default=60,
+            help="timeout to read a response in seconds",
+            show_default=True
+        ),
+        click.option(
+            "--metrics-json",
+            type=click.types.Path(dir_okay=False, path_type=Path),
+            default=None,
+            help="file where the JSON summary of the metrics of each collection is written",
+        ),
+        click.option(
+            "--metrics-textfile",
+            type=click.types.Path(dir_okay=False, path_type=Path),
+            default=None,
+            help="file where the metrics are written for the textfile collector of the Prometheus node exporter",
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def _collect_options(func: Callable[..., None]) -> Callable[..., None]:
+    options = [
+        click.option(
+            "--archive-dir",
+            type=click.types.Path(file_okay=False, path_type=Path),
+            default=None,
+            help="directory where the raw item pages of each collection are archived for `reparse`",
+        ),
+        click.option(
+            "--http-cache",
+            "http_cache_dir",
+            type=click.types.Path(file_okay=False, path_type=Path),
+            default=None,
+            help="directory of the cache of the pages, which are requested with their validators and not parsed "
+                 "again when unchanged (thread engine only, since the async engine sends no validators)",
+        ),
+        click.option(
+            "--http-cache-size",
+            type=click.FloatRange(min=0, min_open=True),
+            default=256,
+            help="size of the cached pages kept at most in MiB, evicting the least recently used",
+            show_default=True
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return _storage_options(_fetch_options(func))
+
+
+def _read_cookies(path: Optional[Path] = None) -> dict[str, str]:
+    ###################### temporary implements ############################
+    with open(COOKIES_FILE if path is None else path) as f:
+        return {cookie["name"]:cookie["value"] for cookie in json.load(f)}
+    ########################################################################
+
+
+def _read_accounts(path: Path) -> dict[str, Path]:
+    """
+    Cookies files of the sellers by their names.
+
+    `path` is either a directory of a cookies file per seller, named by the seller as `<name>.json`,
+    or a JSON manifest of the paths of the cookies files by the names of the sellers, relative to the manifest.
+    """
+    if path.is_dir():
+        files = {file.stem: file for file in sorted(path.glob("*.json"))}
+    else:
+        with open(path) as f:
+            files = {str(name): path.parent / str(file) for name, file in json.load(f).items()}
+    if not files:
+        raise click.BadParameter(f"no cookies file is found in {path.as_posix()}", param_hint="--accounts")
+    for name in files:
+        if not name or name.startswith(".") or Path(name).name != name:
+            raise click.BadParameter(f"{name!r} is not a valid name of a seller", param_hint="--accounts")
+    return files
+
+
 @main.command()
+@_collect_options
 @click.option(
-    "--data-dir",
-    type=click.types.Path(),
-    default=Path("data"),
-    help="directory where data is saved",
+    "--engine",
+    type=click.Choice(["thread", "async"]),
+    default="thread",
+    help="engine fetching item pages (async requires aiohttp)",
+    show_default=True
+)
+@click.option(
+    "--pool-size-per-host",
+    type=click.IntRange(min=0),
+    default=0,
+    help="number of concurrent requests to the same host with the async engine (0 for no limit)",
     show_default=True
 )
+@click.option(
+    "--accounts",
+    "accounts_path",
+    type=click.types.Path(exists=True, path_type=Path),
+    default=None,
+    help="directory of `<seller>.json` cookies files, or JSON manifest of the cookies file of each seller, "
+         "to collect all the sellers at once into `<data-dir>/<seller>` instead of the seller of cookies.json",
+)
+@click.option(
+    "--rate-limit",
+    type=click.FloatRange(min=0),
+    default=0,
+    help="maximum number of requests per second, shared by all the sellers (0 for no limit)",
+    show_default=True
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="continue the interrupted run from its journal, fetching only the items missing from it, "
+         "instead of saving its items and starting a new run",
+)
 def run(
-    data_dir: Path
+    data_dir: Path,
+    data_format: str,
+    layout: str,
+    write_mode: str,
+    encoding: str,
+    keyframe_interval: float,
+    fast_parse: bool,
+    validate_fast_parse: float,
+    parse_workers: int,
+    pool_size: int,
+    adaptive_concurrency: bool,
+    retries: int,
+    connect_timeout: float,
+    timeout: float,
+    metrics_json: Optional[Path],
+    metrics_textfile: Optional[Path],
+    archive_dir: Optional[Path],
+    http_cache_dir: Optional[Path],
+    http_cache_size: float,
+    engine: str,
+    pool_size_per_host: int,
+    accounts_path: Optional[Path],
+    rate_limit: float,
+    resume: bool
 ) -> None:
-    ###################### temporary implements ############################
-    with open(COOKIES_FILE) as f:
-        cookies = {cookie["name"]:cookie["value"] for cookie in json.load(f)}
-    ########################################################################
+    from ya3_collect import archive, concurrency, metrics, transport, yahoo_auction
+
+    if accounts_path is not None and engine == "async":
+        raise click.UsageError("--accounts is supported only by the thread engine")
+    if adaptive_concurrency and engine == "async":
+        raise click.UsageError("--adaptive-concurrency is supported only by the thread engine")
+    if http_cache_dir is not None and engine == "async":
+        raise click.UsageError("--http-cache is supported only by the thread engine")
+    _check_fast_parse(fast_parse, layout)
+    metrics.reset()
     now = datetime.now()
-    with log.measure_time():
-        selling_infos = yahoo_auction.get_infos(cookies)
-    if not data_dir.exists():
-        data_dir.mkdir(parents=True)
-    file = (data_dir / datetime.now().strftime('%Y-%m-%d')).with_suffix(DATAFILE_SUFFIX)
-    if file.exists():
-        df = dataframe.DataFrame(pd.read_csv(file))
-    else:
-        df = dataframe.DataFrame.new()
-    for info in selling_infos:
-        df = df.add_record(
-            dataframe.Record(
-                aID=info.aID,
-                title=info.title,
-                datetime=now,
-                access=info.count_access,
-                watch=info.count_watch,
-                bid=info.count_bid
+    rate_limiter = transport.TokenBucket(rate_limit, burst=pool_size) if rate_limit > 0 else None
+    controller = concurrency.AIMDController(pool_size) if adaptive_concurrency else None
+
+    def save(selling_infos: list[yahoo_auction.SellingItemInfo], now: datetime, data_dir: Path) -> None:
+        _save(selling_infos, now, data_dir, data_format, layout, write_mode, encoding, keyframe_interval)
+
+    if accounts_path is not None:
+        accounts = {name: _read_cookies(file) for name, file in _read_accounts(accounts_path).items()}
+        journals = {name: _open_journal(data_dir / name, now, resume, save) for name in accounts}
+        with log.measure_time(), contextlib.ExitStack() as stack:
+            client = transport.Transport(
+                {},
+                pool_size=pool_size,
+                retries=retries,
+                connect_timeout=connect_timeout,
+                read_timeout=timeout,
+                rate_limiter=rate_limiter,
+                controller=controller,
+                cache=_open_http_cache(stack, http_cache_dir, http_cache_size)
+            )
+            infos_by_account = _get_infos_by_account(
+                accounts, parse_workers, client, archive_dir, journals, fast_parse, validate_fast_parse
+            )
+        for name in infos_by_account:
+            save(journals[name].infos, journals[name].started, data_dir / name)
+            journals[name].remove()
+        _write_metrics(metrics_json, metrics_textfile)
+        return
+    cookies = _read_cookies()
+    run_journal = _open_journal(data_dir, now, resume, save)
+    now = run_journal.started
+    with log.measure_time(), contextlib.ExitStack() as stack:
+        stack.enter_context(run_journal)
+        archive_writer = stack.enter_context(archive.Writer(archive_dir, now)) if archive_dir is not None else None
+        if engine == "async":
+            import asyncio
+
+            async_client = transport.AsyncTransport(
+                cookies,
+                pool_size=pool_size,
+                pool_size_per_host=pool_size_per_host,
+                retries=retries,
+                connect_timeout=connect_timeout,
+                read_timeout=timeout,
+                rate_limiter=rate_limiter
             )
+            asyncio.run(_get_infos_async(
+                cookies, parse_workers, async_client, archive_writer, fast_parse, validate_fast_parse, run_journal
+            ))
+        else:
+            with transport.Transport(
+                cookies,
+                pool_size=pool_size,
+                retries=retries,
+                connect_timeout=connect_timeout,
+                read_timeout=timeout,
+                rate_limiter=rate_limiter,
+                controller=controller,
+                cache=_open_http_cache(stack, http_cache_dir, http_cache_size)
+            ) as client:
+                yahoo_auction.get_infos(
+                    cookies,
+                    parse_workers=parse_workers,
+                    client=client,
+                    archive_writer=archive_writer,
+                    fast=fast_parse,
+                    validate=validate_fast_parse,
+                    journal=run_journal
+                )
+    save(run_journal.infos, now, data_dir)
+    run_journal.remove()
+    _write_metrics(metrics_json, metrics_textfile)
+
+
+def _open_journal(
+    data_dir: Path,
+    now: datetime,
+    resume: bool,
+    save: Callable[[list[yahoo_auction.SellingItemInfo], datetime, Path], None]
+) -> journal.Journal:
+    """
+    Journal of the run saving into `data_dir`.
+
+    The journal left by an interrupted run is continued if `resume`, whose start time is taken as the time
+    of the snapshots of the run. Otherwise its items are saved by `save` first and a new journal is started.
+    """
+    from ya3_collect import journal
+
+    previous = journal.Journal.load(data_dir)
+    if previous is None:
+        return journal.Journal(data_dir, now)
+    if resume:
+        logger.info(
+            f"Resuming the run started at {previous.started} with {len(previous.infos)} items "
+            f"in {previous.path.as_posix()}"
+        )
+        return previous
+    logger.warning(f"Saving {len(previous.infos)} items of the interrupted run started at {previous.started}")
+    save(previous.infos, previous.started, data_dir)
+    previous.remove()
+    return journal.Journal(data_dir, now)
+
+
+def _open_http_cache(
+    stack: contextlib.ExitStack,
+    http_cache_dir: Optional[Path],
+    http_cache_size: float
+) -> Optional[httpcache.HTTPCache]:
+    if http_cache_dir is None:
+        return None
+    from ya3_collect import httpcache
+
+    return stack.enter_context(httpcache.HTTPCache(http_cache_dir, int(http_cache_size * 2 ** 20)))
+
+
+def _check_fast_parse(fast_parse: bool, layout: str) -> None:
+    if fast_parse and layout not in constants.FAST_PARSE_LAYOUTS:
+        raise click.UsageError("--fast-parse is supported only by the wide layout")
+
+
+def _get_infos_by_account(
+    accounts: dict[str, dict[str, str]],
+    parse_workers: int,
+    client: transport.Transport,
+    archive_dir: Optional[Path],
+    journals: dict[str, journal.Journal],
+    fast_parse: bool = False,
+    validate_fast_parse: float = 0.0
+) -> dict[str, list[yahoo_auction.SellingItemInfo]]:
+    import concurrent.futures as cf
+    from ya3_collect import archive, yahoo_auction
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(client)
+        parser = stack.enter_context(cf.ProcessPoolExecutor(parse_workers)) if parse_workers > 0 else None
+        for account_journal in journals.values():
+            stack.enter_context(account_journal)
+        archive_writers = {
+            name: stack.enter_context(archive.Writer(archive_dir / name, journals[name].started)) for name in accounts
+        } if archive_dir is not None else {}
+        return yahoo_auction.get_infos_by_account(
+            accounts,
+            client,
+            parser=parser,
+            archive_writers=archive_writers,
+            fast=fast_parse,
+            validate=validate_fast_parse,
+            journals=journals
+        )
+
+
+def _save(
+    selling_infos: list[yahoo_auction.SellingItemInfo],
+    now: datetime,
+    data_dir: Path,
+    data_format: str,
+    layout: str,
+    write_mode: str,
+    encoding: str = "dense",
+    keyframe_interval: float = 3600,
+    partial: Sequence[yahoo_auction.SellingItemInfo] = ()
+) -> None:
+    # `partial` are the items extracted with the fast parse, whose counters only are saved.
+    from ya3_collect import metrics
+
+    if (layout, data_format, write_mode, encoding) == ("wide", "csv.gz", "append", "dense"):
+        with metrics.timer("storage_seconds", stage="write"):
+            files = [_append_csv([*selling_infos, *partial], now, data_dir)]
+    else:
+        from ya3_collect import collector
+
+        collect = collector.Collector(
+            data_dir, data_format, layout, write_mode, encoding, timedelta(seconds=keyframe_interval)
+        )
+        collect.add(selling_infos, now, partial)
+        files = collect.flush()
+    for file in files:
+        logger.info(f"Data is saved as {file.as_posix()}")
+
+
+def _write_metrics(metrics_json: Optional[Path], metrics_textfile: Optional[Path]) -> None:
+    from ya3_collect import metrics
+
+    fetch = metrics.REGISTRY.histograms.get(("item_fetch_seconds", ()))
+    if fetch is not None:
+        logger.info(
+            f"item fetch: p50 {fetch.quantile(0.5):.5g}, p95 {fetch.quantile(0.95):.5g}, "
+            f"p99 {fetch.quantile(0.99):.5g} [sec]"
+        )
+    hits = metrics.REGISTRY.counters.get(("http_cache_total", (("result", "hit"),)), 0)
+    misses = metrics.REGISTRY.counters.get(("http_cache_total", (("result", "miss"),)), 0)
+    if hits + misses > 0:
+        saved = metrics.REGISTRY.counters.get(("http_cache_saved_bytes_total", ()), 0)
+        reused = metrics.REGISTRY.counters.get(("parse_reused_total", ()), 0)
+        logger.info(
+            f"HTTP cache: hit rate {hits / (hits + misses):.1%} of {hits + misses:g} requests, "
+            f"{saved:,.0f} bytes saved, {reused:g} parses reused"
+        )
+    if metrics_json is not None:
+        metrics.REGISTRY.write_json(metrics_json)
+    if metrics_textfile is not None:
+        metrics.REGISTRY.write_prometheus(metrics_textfile)
+
+
+def _append_csv(selling_infos: list[yahoo_auction.SellingItemInfo], now: datetime, data_dir: Path) -> Path:
+    # Same rows as `Collector` writes in the wide layout, without importing pandas.
+    from ya3_collect import csvgz
+
+    file = csvgz.path(data_dir, now.date())
+    csvgz.append_rows(
+        file,
+        constants.COLUMNS,
+        (
+            (info.aID, info.title, now, info.count_access, info.count_watch, info.count_bid)
+            for info in selling_infos
         )
-    df.to_csv(file, compression="gzip", index=False)
-    logger.info(f"Data is saved as {file.as_posix()}")
+    )
+    return file
+
+
+@main.command()
+@_collect_options
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=600,
+    help="interval between the collections in seconds",
+    show_default=True
+)
+@click.option(
+    "--jitter",
+    type=click.FloatRange(min=0),
+    default=30,
+    help="maximum random delay of each collection in seconds",
+    show_default=True
+)
+@click.option(
+    "--flush-interval",
+    type=click.FloatRange(min=0),
+    default=3600,
+    help="interval between the writes of the collected data in seconds (0 writes after every collection)",
+    show_default=True
+)
+def watch(
+    data_dir: Path,
+    data_format: str,
+    layout: str,
+    write_mode: str,
+    encoding: str,
+    keyframe_interval: float,
+    fast_parse: bool,
+    validate_fast_parse: float,
+    parse_workers: int,
+    pool_size: int,
+    adaptive_concurrency: bool,
+    retries: int,
+    connect_timeout: float,
+    timeout: float,
+    metrics_json: Optional[Path],
+    metrics_textfile: Optional[Path],
+    archive_dir: Optional[Path],
+    http_cache_dir: Optional[Path],
+    http_cache_size: float,
+    interval: float,
+    jitter: float,
+    flush_interval: float
+) -> None:
+    import concurrent.futures as cf
+    from ya3_collect import archive, collector, concurrency, metrics, scheduler, transport, yahoo_auction
+
+    _check_fast_parse(fast_parse, layout)
+    cookies = _read_cookies()
+    collect = collector.Collector(
+        data_dir, data_format, layout, write_mode, encoding, timedelta(seconds=keyframe_interval)
+    )
+    last_flush = time.monotonic()
+
+    def flush() -> None:
+        nonlocal last_flush
+        for file in collect.flush():
+            logger.info(f"Data is saved as {file.as_posix()}")
+        last_flush = time.monotonic()
+
+    with contextlib.ExitStack() as stack:
+        client = stack.enter_context(transport.Transport(
+            cookies,
+            pool_size=pool_size,
+            retries=retries,
+            connect_timeout=connect_timeout,
+            read_timeout=timeout,
+            controller=concurrency.AIMDController(pool_size) if adaptive_concurrency else None,
+            cache=_open_http_cache(stack, http_cache_dir, http_cache_size)
+        ))
+        parser = stack.enter_context(cf.ProcessPoolExecutor(parse_workers)) if parse_workers > 0 else None
+
+        def cycle() -> None:
+            metrics.reset()
+            now = datetime.now()
+            with log.measure_time(), contextlib.ExitStack() as cycle_stack:
+                archive_writer = (
+                    cycle_stack.enter_context(archive.Writer(archive_dir, now)) if archive_dir is not None else None
+                )
+                selling_infos = yahoo_auction.get_infos(
+                    cookies,
+                    client=client,
+                    parser=parser,
+                    archive_writer=archive_writer,
+                    fast=fast_parse,
+                    validate=validate_fast_parse
+                )
+            if client.cache is not None:
+                client.cache.save()
+            day = collect.day
+            collect.add(selling_infos, now)
+            if day != now.date() or time.monotonic() - last_flush >= flush_interval:
+                flush()
+            _write_metrics(metrics_json, metrics_textfile)
+
+        logger.info(f"Collecting every {interval:g} [sec]")
+        try:
+            scheduler.run_every(cycle, interval, jitter=jitter)
+        except KeyboardInterrupt:
+            logger.info("Stopping")
+        finally:
+            flush()
+
+
+@main.command()
+@_storage_options
+@click.option(
+    "--queue",
+    "queue_path",
+    type=click.types.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help=f"SQLite database of the work queue shared with the workers  [default: <data-dir>/{constants.QUEUE}]",
+)
+@click.option(
+    "--accounts",
+    "accounts_path",
+    type=click.types.Path(exists=True, path_type=Path),
+    default=None,
+    help="directory of `<seller>.json` cookies files, or JSON manifest of the cookies file of each seller, "
+         "to queue all the sellers at once into `<data-dir>/<seller>` instead of the seller of cookies.json",
+)
+@click.option(
+    "--timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=60,
+    help="timeout to read a listing page in seconds",
+    show_default=True
+)
+@click.option(
+    "--wait/--no-wait",
+    default=True,
+    help="wait for the workers to finish the queued item pages and save all the items at once, "
+         "or exit once they are queued and leave the runs to be saved by the next `enqueue`",
+    show_default=True
+)
+@click.option(
+    "--poll-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=5,
+    help="interval between the checks of the progress of the workers in seconds",
+    show_default=True
+)
+def enqueue(
+    data_dir: Path,
+    data_format: str,
+    layout: str,
+    write_mode: str,
+    encoding: str,
+    keyframe_interval: float,
+    queue_path: Optional[Path],
+    accounts_path: Optional[Path],
+    timeout: float,
+    wait: bool,
+    poll_interval: float
+) -> None:
+    import itertools
+    from ya3_collect import transport, workqueue, yahoo_auction
+
+    now = datetime.now()
+    if accounts_path is not None:
+        accounts = {name: _read_cookies(file) for name, file in _read_accounts(accounts_path).items()}
+    else:
+        accounts = {"": _read_cookies()}
+    with workqueue.WorkQueue(queue_path or data_dir / workqueue.QUEUE) as queue, \
+            transport.Transport({}, read_timeout=timeout) as client:
+        # The runs left by the previous `enqueue` are saved first, so that each run is a snapshot of its own.
+        _merge_runs(queue, queue.runs(), poll_interval, data_format, write_mode, keyframe_interval, wait=False)
+        for name, cookies in accounts.items():
+            run = queue.start(name, data_dir / name, now, layout, encoding)
+            count = 0
+            with client.with_cookies(cookies) as seller_client:
+                urls = yahoo_auction.iter_selling_urls(cookies, client=seller_client)
+                while batch := list(itertools.islice(urls, 500)):
+                    count += queue.put(run, batch)
+            logger.info(f"{count} item pages of {name or 'the seller'} are queued")
+        if wait:
+            _merge_runs(queue, queue.runs(), poll_interval, data_format, write_mode, keyframe_interval)
+
+
+def _merge_runs(
+    queue: workqueue.WorkQueue,
+    runs: list[workqueue.Run],
+    poll_interval: float,
+    data_format: str,
+    write_mode: str,
+    keyframe_interval: float,
+    wait: bool = True
+) -> None:
+    """
+    Save the items of each run in one write as soon as all its tasks are finished, and remove it from `queue`.
+
+    The runs of a seller are saved in the order they are started, in the layout and the encoding of each run.
+    Returns once all the runs are saved, or once none of the others is finished unless `wait`.
+    """
+    runs = sorted(runs, key=lambda run: run.id)
+    while True:
+        unfinished: set[str] = set()
+        for run in list(runs):
+            progress = queue.progress(run)
+            if run.seller in unfinished or progress["queued"] + progress["leased"] > 0:
+                logger.debug(f"{progress['done']} of {sum(progress.values())} item pages of run {run.id} are done")
+                unfinished.add(run.seller)
+                continue
+            if progress["failed"] > 0:
+                logger.warning(f"{progress['failed']} item pages of {run.seller or 'the seller'} failed")
+            _save(
+                queue.results(run, fast=False), run.started, run.data_dir, data_format, run.layout, write_mode,
+                run.encoding, keyframe_interval, queue.results(run, fast=True)
+            )
+            queue.finish(run)
+            runs.remove(run)
+        if not runs or not wait:
+            return
+        time.sleep(poll_interval)
+
+
+@main.command()
+@_fetch_options
+@click.option(
+    "--queue",
+    "queue_path",
+    type=click.types.Path(dir_okay=False, path_type=Path),
+    default=Path("data") / constants.QUEUE,
+    help="SQLite database of the work queue filled by `enqueue`",
+    show_default=True
+)
+@click.option(
+    "--accounts",
+    "accounts_path",
+    type=click.types.Path(exists=True, path_type=Path),
+    default=None,
+    help="directory of `<seller>.json` cookies files, or JSON manifest of the cookies file of each seller, "
+         "given to `enqueue`, instead of cookies.json",
+)
+@click.option(
+    "--rate-limit",
+    type=click.FloatRange(min=0),
+    default=0,
+    help="maximum number of requests per second of this worker (0 for no limit)",
+    show_default=True
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=100,
+    help="number of the item pages claimed at once",
+    show_default=True
+)
+@click.option(
+    "--lease",
+    type=click.FloatRange(min=0, min_open=True),
+    default=300,
+    help="seconds before the claimed item pages are given to another worker unless they are finished",
+    show_default=True
+)
+@click.option(
+    "--poll-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=5,
+    help="interval between the claims while the queue is empty in seconds",
+    show_default=True
+)
+@click.option(
+    "--exit-when-empty",
+    is_flag=True,
+    default=False,
+    help="exit when no item page is left to claim instead of waiting for more",
+)
+def worker(
+    fast_parse: bool,
+    validate_fast_parse: float,
+    parse_workers: int,
+    pool_size: int,
+    adaptive_concurrency: bool,
+    retries: int,
+    connect_timeout: float,
+    timeout: float,
+    metrics_json: Optional[Path],
+    metrics_textfile: Optional[Path],
+    queue_path: Path,
+    accounts_path: Optional[Path],
+    rate_limit: float,
+    batch_size: int,
+    lease: float,
+    poll_interval: float,
+    exit_when_empty: bool
+) -> None:
+    import os
+    import socket
+    import concurrent.futures as cf
+    from ya3_collect import concurrency, metrics, transport, workqueue
+
+    if accounts_path is not None:
+        accounts = {name: _read_cookies(file) for name, file in _read_accounts(accounts_path).items()}
+    else:
+        accounts = {"": _read_cookies()}
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    with contextlib.ExitStack() as stack:
+        queue = stack.enter_context(workqueue.WorkQueue(queue_path))
+        client = stack.enter_context(transport.Transport(
+            {},
+            pool_size=pool_size,
+            retries=retries,
+            connect_timeout=connect_timeout,
+            read_timeout=timeout,
+            rate_limiter=transport.TokenBucket(rate_limit, burst=pool_size) if rate_limit > 0 else None,
+            controller=concurrency.AIMDController(pool_size) if adaptive_concurrency else None
+        ))
+        parser = stack.enter_context(cf.ProcessPoolExecutor(parse_workers)) if parse_workers > 0 else None
+        logger.info(f"Working on {queue_path.as_posix()} as {name}")
+        while True:
+            tasks = queue.claim(name, batch_size, lease)
+            if not tasks:
+                if exit_when_empty:
+                    return
+                time.sleep(poll_interval)
+                continue
+            metrics.reset()
+            with log.measure_time():
+                count = workqueue.work(queue, tasks, accounts, client, parser, fast_parse, validate_fast_parse)
+            logger.info(f"{count} of {len(tasks)} claimed item pages are done")
+            _write_metrics(metrics_json, metrics_textfile)
+
+
+@main.command()
+@click.option(
+    "--data-dir",
+    type=click.types.Path(path_type=Path),
+    default=Path("data"),
+    help="directory where data is saved",
+    show_default=True
+)
+@click.option(
+    "--from",
+    "src_format",
+    type=click.Choice(constants.DATA_FORMATS),
+    default="csv.gz",
+    help="format of the data files to convert",
+    show_default=True
+)
+@click.option(
+    "--to",
+    "dst_format",
+    type=click.Choice(constants.DATA_FORMATS),
+    default="parquet",
+    help="format to convert the data files into",
+    show_default=True
+)
+@click.option(
+    "--layout",
+    type=click.Choice(constants.LAYOUTS),
+    default="wide",
+    help="layout of the data files to convert",
+    show_default=True
+)
+def convert(
+    data_dir: Path,
+    src_format: str,
+    dst_format: str,
+    layout: str
+) -> None:
+    if src_format == dst_format:
+        raise click.BadParameter("should differ from --from", param_hint="--to")
+    from ya3_collect import compaction, dataframe, storage
+
+    if layout == "normalized":
+        stores: list[tuple[Path, type[dataframe.BaseFrame]]] = [
+            (data_dir / storage.SNAPSHOTS, dataframe.SnapshotFrame),
+            (data_dir, dataframe.ItemFrame),
+        ]
+    else:
+        stores = [(data_dir, dataframe.DataFrame)]
+    paths: list[Path] = []
+    for directory, frame in stores:
+        src = storage.get_storage(src_format, directory, frame)
+        dst = storage.get_storage(dst_format, directory, frame)
+        paths.extend(storage.convert(src, dst))
+        paths.extend(compaction.convert(src, dst))
+    logger.info(f"{len(paths)} data files are converted into {dst_format}")
+
+
+@main.command()
+@click.option(
+    "--archive-dir",
+    type=click.types.Path(file_okay=False, path_type=Path),
+    default=Path("archive"),
+    help="directory where the raw item pages are archived",
+    show_default=True
+)
+@click.option(
+    "--data-dir",
+    type=click.types.Path(path_type=Path),
+    default=Path("data"),
+    help="directory where the regenerated data is saved",
+    show_default=True
+)
+@click.option(
+    "--format",
+    "data_format",
+    type=click.Choice(constants.DATA_FORMATS),
+    default="csv.gz",
+    help="format of data files (parquet requires pyarrow)",
+    show_default=True
+)
+@click.option(
+    "--layout",
+    type=click.Choice(constants.LAYOUTS),
+    default="wide",
+    help="layout of the regenerated data files",
+    show_default=True
+)
+@click.option(
+    "--day",
+    "days",
+    type=click.DateTime(formats=[constants.DATE_FORMAT]),
+    multiple=True,
+    help="day to reparse, which can be repeated (all the archived days if not given)",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="number of processes parsing the pages  [default: number of CPUs]",
+)
+def reparse(
+    archive_dir: Path,
+    data_dir: Path,
+    data_format: str,
+    layout: str,
+    days: tuple[datetime, ...],
+    workers: Optional[int]
+) -> None:
+    from ya3_collect import collector
+
+    collect = collector.Collector(data_dir, data_format, layout)
+    with log.measure_time():
+        count = collector.reparse(archive_dir, collect, workers, [day.date() for day in days] or None)
+    logger.info(f"{count} archived pages are reparsed into {data_dir.as_posix()}")
 
+
+@main.command()
+@click.option(
+    "--data-dir",
+    type=click.types.Path(path_type=Path),
+    default=Path("data"),
+    help="directory where data is saved",
+    show_default=True
+)
+@click.option(
+    "--format",
+    "data_format",
+    type=click.Choice(constants.DATA_FORMATS),
+    default="csv.gz",
+    help="format of the data files, in which the rollups are also saved",
+    show_default=True
+)
+@click.option(
+    "--layout",
+    type=click.Choice(constants.LAYOUTS),
+    default="wide",
+    help="layout of the data files",
+    show_default=True
+)
+@click.option(
+    "--start",
+    type=click.DateTime(formats=[constants.DATE_FORMAT, constants.DATETIME_FORMAT]),
+    default=None,
+    help="start of the range to analyze  [default: the first snapshot]",
+)
+@click.option(
+    "--end",
+    type=click.DateTime(formats=[constants.DATE_FORMAT, constants.DATETIME_FORMAT]),
+    default=None,
+    help="end of the range to analyze, exclusive  [default: the last snapshot]",
+)
+@click.option(
+    "--freq",
+    type=click.Choice(constants.ROLLUP_FREQUENCIES),
+    default="hourly",
+    help="period of the rollups written to --output",
+    show_default=True
+)
+@click.option(
+    "--by",
+    type=click.Choice(constants.COUNTERS),
+    default="access",
+    help="counter whose increase ranks the top movers",
+    show_default=True
+)
+@click.option(
+    "--top",
+    type=click.IntRange(min=1),
+    default=10,
+    help="number of the top movers to show",
+    show_default=True
+)
+@click.option(
+    "--output",
+    type=click.types.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="CSV file where the rollups in the range are written",
+)
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    default=False,
+    help="roll up all the snapshots again, e.g. after `reparse`",
+)
+def analyze(
+    data_dir: Path,
+    data_format: str,
+    layout: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    freq: str,
+    by: str,
+    top: int,
+    output: Optional[Path],
+    rebuild: bool
+) -> None:
+    from ya3_collect import analytics
+
+    rollups = analytics.Rollups(data_dir, data_format, layout)
+    with log.measure_time():
+        count = rollups.rebuild() if rebuild else rollups.update()
+    logger.info(f"{count} new snapshots are rolled up into {rollups.root.as_posix()}")
+    df = rollups.read(freq, start, end)
+    if output is not None:
+        df.to_csv(output, index=False, date_format=constants.DATETIME_FORMAT)
+        logger.info(f"Rollups are saved as {output.as_posix()}")
+    click.echo(analytics.top_movers(df, by, top).to_string(index=False))
+
+
+@main.command()
+@click.option(
+    "--data-dir",
+    type=click.types.Path(path_type=Path),
+    default=Path("data"),
+    help="directory where data is saved",
+    show_default=True
+)
+@click.option(
+    "--format",
+    "data_format",
+    type=click.Choice(constants.DATA_FORMATS),
+    default="csv.gz",
+    help="format of the data files, in which the partitions are also saved",
+    show_default=True
+)
+@click.option(
+    "--layout",
+    type=click.Choice(constants.LAYOUTS),
+    default="wide",
+    help="layout of the data files",
+    show_default=True
+)
+@click.option(
+    "--month",
+    "months",
+    type=click.DateTime(formats=[constants.MONTH_FORMAT]),
+    multiple=True,
+    help="month to compact, which can be repeated  [default: the months before the current month]",
+)
+@click.option(
+    "--remove-days",
+    is_flag=True,
+    default=False,
+    help="remove the daily data files once they are compacted",
+)
+def compact(
+    data_dir: Path,
+    data_format: str,
+    layout: str,
+    months: tuple[datetime, ...],
+    remove_days: bool
+) -> None:
+    from ya3_collect import analytics, compaction
+
+    store = analytics.snapshot_storage(data_dir, data_format, layout)
+    with log.measure_time():
+        paths = compaction.compact(store, [month.date() for month in months] or None, remove_days)
+    compacted = store.data_dir / compaction.COMPACTED
+    logger.info(f"{len(paths)} monthly partitions are written into {compacted.as_posix()}")
+
+
+async def _get_infos_async(
+    cookies: dict[str, str],
+    parse_workers: int,
+    client: transport.AsyncTransport,
+    archive_writer: Optional[archive.Writer],
+    fast_parse: bool = False,
+    validate_fast_parse: float = 0.0,
+    run_journal: Optional[journal.Journal] = None
+) -> list[yahoo_auction.SellingItemInfo]:
+    from ya3_collect import yahoo_auction
+
+    async with client:
+        return await yahoo_auction.get_infos_async(
+            cookies,
+            parse_workers=parse_workers,
+            client=client,
+            archive_writer=archive_writer,
+            fast=fast_parse,
+            validate=validate_fast_parse,
+            journal=run_journal
+        )
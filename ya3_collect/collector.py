@@ -0,0 +1,285 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import os
+import logging
+import threading
+import itertools
+import concurrent.futures as cf
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, TypeVar
+
+import pandas as pd
+
+from ya3_collect import archive, compaction, constants, dataframe, delta, metrics, storage, yahoo_auction
+from ya3_collect.yahoo_auction import SellingItemInfo
+
+
+LAYOUTS = constants.LAYOUTS
+WRITE_MODES = constants.WRITE_MODES
+ENCODINGS = constants.ENCODINGS
+
+_F = TypeVar("_F", bound=dataframe.BaseFrame)
+
+logger = logging.getLogger(__name__)
+
+
+class Collector:
+    """
+    In-memory state of the collected data of the current day, which is flushed to the storage.
+
+    The rows added since the last flush are buffered, and with the `normalized` layout the latest version
+    of each item is kept so that the items table is read only once.
+    With the `rewrite` write mode the whole data of the day is kept and written at each flush.
+    The buffered rows are flushed before the rows of the next day are added.
+    With the `delta` encoding only the snapshots changed since the previous run are written, with a keyframe of all
+    the snapshots every `keyframe_interval`, and the runs are logged next to the data file so that
+    `delta.read` forward-fills them on load. The values of the items at the last run are saved next to it too,
+    so that the collector of the next run does not read and replay the data file of the day.
+
+    Parameters
+    ----------
+    data_dir : Path
+        Directory where data is saved.
+    data_format : str
+        One of `storage.FORMATS`.
+    layout : str
+        `wide` to save a row with the title per snapshot,
+        or `normalized` to save narrow snapshots and a table of the items updated on change.
+    write_mode : str
+        `append` to append only the new rows to the data file, or `rewrite` to rewrite the whole file.
+    encoding : str
+        `dense` to write the snapshots of all the items at every run, or `delta` to write the changed ones only.
+    keyframe_interval : timedelta
+        Interval between the keyframes with the `delta` encoding.
+    """
+
+    def __init__(
+        self,
+        data_dir: Path,
+        data_format: str = "csv.gz",
+        layout: str = "wide",
+        write_mode: str = "append",
+        encoding: str = "dense",
+        keyframe_interval: timedelta = delta.KEYFRAME_INTERVAL
+    ) -> None:
+        if layout not in LAYOUTS:
+            raise ValueError(f"layout should be one of {LAYOUTS}, got {layout}")
+        if write_mode not in WRITE_MODES:
+            raise ValueError(f"write_mode should be one of {WRITE_MODES}, got {write_mode}")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding should be one of {ENCODINGS}, got {encoding}")
+        self.layout = layout
+        self.write_mode = write_mode
+        if layout == "normalized":
+            self.store = storage.get_storage(data_format, Path(data_dir) / storage.SNAPSHOTS, dataframe.SnapshotFrame)
+            self.item_store: Optional[storage.Storage] = storage.get_storage(
+                data_format, data_dir, dataframe.ItemFrame
+            )
+        else:
+            self.store = storage.get_storage(data_format, data_dir)
+            self.item_store = None
+        self.day: Optional[date] = None
+        self._lock = threading.RLock()
+        self._frames: list[dataframe.BaseFrame] = []
+        self._day_frame: Optional[dataframe.BaseFrame] = None
+        self._items: list[dataframe.ItemFrame] = []
+        self._latest_items: Optional[dataframe.ItemFrame] = None
+        self._encoder = delta.DeltaEncoder(keyframe_interval) if encoding == "delta" else None
+        self._runs: list[delta.Run] = []
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of the rows not flushed yet.
+        """
+        with self._lock:
+            return sum(len(df) for df in self._frames) + sum(len(items) for items in self._items)
+
+    def add(self, infos: Iterable[SellingItemInfo], now: datetime, partial: Iterable[SellingItemInfo] = ()) -> int:
+        """
+        Add the item infos collected at `now`.
+
+        Parameters
+        ----------
+        infos : Iterable[SellingItemInfo]
+            Item infos to add.
+        now : datetime
+            Time when the infos are collected.
+        partial : Iterable[SellingItemInfo]
+            Item infos with only `yahoo_auction.FAST_FIELDS`, whose snapshots are added
+            while the items table of the `normalized` layout is left as it is.
+
+        Returns
+        -------
+        int
+            Number of the added snapshots.
+        """
+        infos = list(infos)
+        partial = list(partial)
+        with self._lock:
+            if self.day is not None and now.date() != self.day:
+                self.flush()
+                self._day_frame = None
+                if self._encoder is not None:
+                    self._encoder.reset()
+            if self._encoder is not None and self.day is None and self.store.exists(now.date()):
+                with metrics.timer("storage_seconds", stage="read"):
+                    runs = delta.read_runs(self.store, now.date())
+                    if not self._encoder.load(self.store.state_path(now.date()), runs):
+                        self._encoder.restore(self.store.read(now.date()), runs)
+            self.day = now.date()
+            if self.layout == "normalized":
+                self._add_items(infos, now)
+            with metrics.timer("storage_seconds", stage="merge"):
+                df = self._build(infos + partial, now)
+                count = len(df)
+                if self._encoder is not None:
+                    encoded, run = self._encoder.encode(df, now)
+                    df = self.store.frame(encoded)
+                    self._runs.append(run)
+            self._frames.append(df)
+            return count
+
+    def flush(self) -> list[Path]:
+        """
+        Save the rows added since the last flush.
+
+        Returns
+        -------
+        list[Path]
+            Paths of the written data files.
+        """
+        with self._lock:
+            files: list[Path] = []
+            if self._items and self.item_store is not None:
+                with metrics.timer("storage_seconds", stage="merge"):
+                    items = self._concat(dataframe.ItemFrame, self._items)
+                with metrics.timer("storage_seconds", stage="write"):
+                    files.append(self.item_store.append(items, storage.ITEMS))
+                self._items = []
+            if self._frames and self.day is not None:
+                with metrics.timer("storage_seconds", stage="merge"):
+                    df = self._concat(self.store.frame, self._frames)
+                if self.write_mode == "rewrite":
+                    if self._day_frame is None and self.store.exists(self.day):
+                        with metrics.timer("storage_seconds", stage="read"):
+                            self._day_frame = self.store.read(self.day)
+                    if self._day_frame is not None:
+                        with metrics.timer("storage_seconds", stage="merge"):
+                            df = self._concat(self.store.frame, [self._day_frame, df])
+                    self._day_frame = df
+                with metrics.timer("storage_seconds", stage="write"):
+                    if self.write_mode == "append":
+                        files.append(self.store.append(df, self.day))
+                    else:
+                        files.append(self.store.write(df, self.day))
+                self._frames = []
+            if self._runs and self.day is not None:
+                delta.append_runs(self.store, self.day, self._runs)
+                self._runs = []
+                if self._encoder is not None:
+                    self._encoder.save(self.store.state_path(self.day))
+            return files
+
+    def _build(self, infos: list[SellingItemInfo], now: datetime) -> dataframe.BaseFrame:
+        batch = dataframe.RecordBatch.from_infos(infos, now)
+        if self.layout == "normalized":
+            return batch.to_snapshots()
+        return batch.to_frame()
+
+    def _add_items(self, infos: list[SellingItemInfo], now: datetime) -> None:
+        assert self.item_store is not None
+        if self._latest_items is None and self.item_store.exists(storage.ITEMS):
+            with metrics.timer("storage_seconds", stage="read"):
+                self._latest_items = dataframe.ItemFrame(self.item_store.read(storage.ITEMS)).latest()
+        with metrics.timer("storage_seconds", stage="merge"):
+            items = dataframe.ItemFrame.from_records(
+                dataframe.ItemRecord(
+                    aID=info.aID,
+                    datetime=now,
+                    title=info.title,
+                    seller_name=info.seller_name,
+                    stock=info.stock,
+                    start_datetime=info.start_datetime,
+                    end_datetime=info.end_datetime,
+                    refundable=info.refundable,
+                    startprice=info.startprice
+                )
+                for info in infos
+            )
+            if self._latest_items is not None:
+                items = self._latest_items.changed(items)
+                self._latest_items = self._concat(dataframe.ItemFrame, [self._latest_items, items]).latest()
+            else:
+                self._latest_items = items.latest()
+        if len(items) > 0:
+            self._items.append(items)
+
+    @staticmethod
+    def _concat(frame: type[_F], frames: list[_F]) -> _F:
+        if len(frames) == 1:
+            return frames[0]
+        return frame(pd.concat(frames, ignore_index=True).astype(frame.DTYPES))
+
+
+def _parse_archived(path: Path, offset: int, size: int) -> SellingItemInfo:
+    return yahoo_auction.parse_item_page(archive.read(path, offset, size))
+
+
+def reparse(
+    archive_dir: Path,
+    collect: Collector,
+    workers: Optional[int] = None,
+    days: Optional[Sequence[date]] = None
+) -> int:
+    """
+    Extract the item infos again from the archived item pages and regenerate the data files of their days.
+
+    The data files of the days of the archives are removed first with their rows in the compacted partitions,
+    and so is the items table of the `normalized` layout when all the days are reparsed.
+    The pages are parsed in `workers` processes, and the snapshots of each archive are dated at the start of its run.
+
+    Parameters
+    ----------
+    archive_dir : Path
+        Directory of the archives.
+    collect : Collector
+        Collector saving the regenerated data.
+    workers : int, optional
+        Number of the processes parsing the pages. The number of the CPUs if not given.
+    days : Sequence[date], optional
+        Days to reparse. All the days of the archives are reparsed if not given.
+
+    Returns
+    -------
+    int
+        Number of the reparsed item pages.
+    """
+    paths = archive.paths(archive_dir, days)
+    reparsed = sorted({archive.Reader(path).started.date() for path in paths})
+    for day in reparsed:
+        collect.store.remove(day)
+    compaction.remove(collect.store, reparsed)
+    if days is None and collect.item_store is not None:
+        collect.item_store.remove(storage.ITEMS)
+    count = 0
+    with cf.ProcessPoolExecutor(workers) as executor:
+        for path in paths:
+            reader = archive.Reader(path)
+            entries = list(reader.entries())
+            infos = list(executor.map(
+                _parse_archived,
+                itertools.repeat(path),
+                [entry.offset for entry in entries],
+                [entry.size for entry in entries],
+                chunksize=max(1, len(entries) // (4 * (workers or os.cpu_count() or 1)))
+            ))
+            for entry, info in zip(entries, infos):
+                if not info.aID:
+                    logger.warning(f"No aID is found in {entry.url} archived in {path.as_posix()}")
+            collect.add([info for info in infos if info.aID], reader.started)
+            count += len(entries)
+            logger.info(f"Reparsed {len(entries)} pages archived in {path.as_posix()}")
+    collect.flush()
+    return count
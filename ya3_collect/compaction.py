@@ -0,0 +1,331 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import os
+import json
+import time
+import logging
+import dataclasses
+import concurrent.futures as cf
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ya3_collect import constants, delta, storage
+
+
+COMPACTED = "compacted"
+INDEX_SUFFIX = ".index.json"
+BLOCK_ROWS = 4096
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class Index:
+    """
+    Sidecar index of a monthly partition, which is written after the partition it points to.
+
+    Parameters
+    ----------
+    file : str
+        Name of the partition file in the same directory.
+    days : list[date]
+        Days of the daily data files compacted into the partition.
+    locations : list[tuple[int, int]]
+        Location of each block of the partition, returned by `storage.Storage.write_blocks`.
+    items : dict[str, tuple[int, datetime, datetime]]
+        Block of the rows of each aID with the time of the first and the last row.
+    """
+    file: str
+    days: list[date]
+    locations: list[tuple[int, int]]
+    items: dict[str, tuple[int, datetime, datetime]]
+
+    @staticmethod
+    def read(path: Path) -> Index:
+        with open(path) as f:
+            content = json.load(f)
+        return Index(
+            content["file"],
+            [date.fromisoformat(day) for day in content["days"]],
+            [(offset, size) for offset, size in content["locations"]],
+            {
+                aID: (block, datetime.fromisoformat(first), datetime.fromisoformat(last))
+                for aID, (block, first, last) in content["items"].items()
+            }
+        )
+
+    def write(self, path: Path) -> None:
+        content = {
+            "file": self.file,
+            "days": [day.isoformat() for day in self.days],
+            "locations": self.locations,
+            "items": {
+                aID: [block, first.isoformat(), last.isoformat()] for aID, (block, first, last) in self.items.items()
+            },
+        }
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(content, separators=(",", ":")))
+        os.replace(tmp, path)
+
+    def blocks(
+        self,
+        aids: Optional[Iterable[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> list[int]:
+        """
+        Blocks which may have the rows of `aids` from `start` to `end`.
+        """
+        items = self.items if aids is None else {aID: self.items[aID] for aID in aids if aID in self.items}
+        return sorted({
+            block for block, first, last in items.values()
+            if (start is None or last >= start) and (end is None or first < end)
+        })
+
+
+def _month(day: date) -> date:
+    return day.replace(day=1)
+
+
+def index_path(store: storage.Storage, month: date) -> Path:
+    """
+    Path of the index of the partition of `month` of `store`, `compacted/YYYY-MM<suffix>.index.json`,
+    which is named after the format so that the partitions of the formats of a directory are apart.
+    """
+    return store.data_dir / COMPACTED / f"{month.strftime(constants.MONTH_FORMAT)}{store.suffix}{INDEX_SUFFIX}"
+
+
+def indexes(store: storage.Storage) -> dict[date, Index]:
+    """
+    Indexes of the compacted partitions of `store` by their months.
+    """
+    found: dict[date, Index] = {}
+    suffix = f"{store.suffix}{INDEX_SUFFIX}"
+    for path in sorted((store.data_dir / COMPACTED).glob(f"*{suffix}")):
+        month = datetime.strptime(path.name[:-len(suffix)], constants.MONTH_FORMAT).date()
+        found[month] = Index.read(path)
+    return found
+
+
+def _blocks(df: pd.DataFrame) -> tuple[list[pd.DataFrame], dict[str, tuple[int, datetime, datetime]]]:
+    # Split the rows sorted by aID into blocks of about BLOCK_ROWS rows, each of which has all the rows of its aIDs.
+    aids = df["aID"].astype("str").to_numpy()
+    starts = np.flatnonzero(np.r_[True, aids[1:] != aids[:-1]])
+    ends = np.r_[starts[1:], len(df)]
+    times = df["datetime"]
+    blocks: list[pd.DataFrame] = []
+    items: dict[str, tuple[int, datetime, datetime]] = {}
+    block_start = 0
+    for start, end in zip(starts, ends):
+        items[aids[start]] = (len(blocks), times.iloc[start].to_pydatetime(), times.iloc[end - 1].to_pydatetime())
+        if end - block_start >= BLOCK_ROWS or end == len(df):
+            blocks.append(df.iloc[block_start:end])
+            block_start = end
+    return blocks, items
+
+
+def compact(
+    store: storage.Storage,
+    months: Optional[Sequence[date]] = None,
+    remove: bool = False
+) -> list[Path]:
+    """
+    Merge the daily data files into monthly partitions sorted by aID and time, with a sidecar index of the aIDs.
+
+    Each partition is split into blocks of about `BLOCK_ROWS` rows, each of which has all the rows of its aIDs
+    and is read alone: a gzip member of a csv.gz partition and a row group of a Parquet partition.
+    The index records the days compacted into the partition, so that a day added to the month later is merged
+    when the month is compacted again. The days written with the `delta` encoding are forward-filled into the
+    partition, whose blocks of the rows sorted by aID compress the repeated counters instead.
+    A new partition is written before its index, and the old one is removed after,
+    so that the readers of the index always find a complete partition.
+
+    Parameters
+    ----------
+    store : storage.Storage
+        Storage of the daily data files.
+    months : Sequence[date], optional
+        Months to compact, given by any day in them. The months before the current month are compacted if not given.
+    remove : bool
+        Whether to remove the daily data files once they are compacted.
+
+    Returns
+    -------
+    list[Path]
+        Paths of the written partitions.
+    """
+    current = indexes(store)
+    if months is not None:
+        targets = sorted({_month(month) for month in months})
+    else:
+        targets = sorted({_month(day) for day in store.days() if _month(day) < _month(date.today())})
+    paths: list[Path] = []
+    for month in targets:
+        index = current.get(month)
+        compacted = set(index.days) if index is not None else set()
+        days = [day for day in store.days() if _month(day) == month and day not in compacted]
+        if not days:
+            continue
+        frames = [delta.read(store, day) for day in days]
+        if index is not None:
+            frames.insert(0, store.read_blocks(store.data_dir / COMPACTED / index.file, index.locations))
+        df = pd.concat(frames, ignore_index=True)
+        path = _write_partition(store, month, df, compacted | set(days))
+        if remove:
+            for day in days:
+                store.remove(day)
+        paths.append(path)
+        logger.info(f"Compacted {len(days)} days of {len(df)} rows into {path.as_posix()}")
+    return paths
+
+
+def remove(store: storage.Storage, days: Iterable[date]) -> list[Path]:
+    """
+    Remove the rows of `days` from the compacted partitions, as `storage.Storage.remove` does with the daily
+    data files, so that the days written again are read from their daily data files.
+
+    Parameters
+    ----------
+    store : storage.Storage
+        Storage of the daily data files.
+    days : Iterable[date]
+        Days to remove.
+
+    Returns
+    -------
+    list[Path]
+        Paths of the partitions written without the days.
+    """
+    days = set(days)
+    paths: list[Path] = []
+    for month, index in indexes(store).items():
+        removed = days & set(index.days)
+        if not removed:
+            continue
+        path = store.data_dir / COMPACTED / index.file
+        df = store.read_blocks(path, index.locations)
+        df = df[~df["datetime"].dt.normalize().isin([pd.Timestamp(day) for day in removed])]
+        kept = set(index.days) - removed
+        if kept and len(df) > 0:
+            paths.append(_write_partition(store, month, df, kept))
+        else:
+            index_path(store, month).unlink()
+            path.unlink(missing_ok=True)
+        logger.info(f"Removed {len(removed)} days from the partition of {month.strftime(constants.MONTH_FORMAT)}")
+    return paths
+
+
+def convert(src: storage.Storage, dst: storage.Storage) -> list[Path]:
+    """
+    Convert the compacted partitions of `src` into the format of `dst`, as `storage.convert` does with the daily
+    data files.
+
+    Returns
+    -------
+    list[Path]
+        Paths of the converted partitions.
+    """
+    paths: list[Path] = []
+    for month, index in indexes(src).items():
+        df = src.read_blocks(src.data_dir / COMPACTED / index.file, index.locations)
+        paths.append(_write_partition(dst, month, df, index.days))
+        logger.info(f"Converted {index.file} into {paths[-1].as_posix()}")
+    return paths
+
+
+def _write_partition(store: storage.Storage, month: date, df: pd.DataFrame, days: Iterable[date]) -> Path:
+    # Write the rows of the days of `month` as a new partition and its index, replacing the old partition.
+    path = index_path(store, month)
+    old = Index.read(path).file if path.exists() else None
+    df = df.sort_values(
+        ["aID", "datetime"], key=lambda s: s.astype("str") if s.name == "aID" else s, kind="mergesort"
+    ).reset_index(drop=True)
+    blocks, items = _blocks(df)
+    name = f"{month.strftime(constants.MONTH_FORMAT)}.{time.time_ns()}{store.suffix}"
+    partition = store.data_dir / COMPACTED / name
+    locations = store.write_blocks(blocks, partition)
+    Index(name, sorted(days), locations, items).write(path)
+    if old is not None and old != name:
+        (store.data_dir / COMPACTED / old).unlink(missing_ok=True)
+    return partition
+
+
+def load(
+    store: storage.Storage,
+    aids: Optional[Iterable[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    workers: Optional[int] = None,
+    columns: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
+    """
+    Read the rows of `aids` from `start` to `end`, reading only their blocks of the compacted partitions.
+
+    The partitions and the daily data files not compacted yet are read concurrently in `workers` threads.
+
+    Parameters
+    ----------
+    store : storage.Storage
+        Storage of the daily data files.
+    aids : Iterable[str], optional
+        aIDs to read. All the items are read if not given.
+    start : datetime, optional
+        Only the rows at or after `start` are read if given.
+    end : datetime, optional
+        Only the rows before `end` are read if given.
+    workers : int, optional
+        Number of the threads reading the files.
+    columns : Sequence[str], optional
+        Columns to read. All the columns are read if not given.
+
+    Returns
+    -------
+    pd.DataFrame
+        Rows sorted by aID and time, which is a `store.frame` if all the columns are read.
+    """
+    wanted = set(aids) if aids is not None else None
+    read_columns = list(dict.fromkeys(["aID", "datetime", *columns])) if columns is not None else None
+    tasks: list[Callable[[], pd.DataFrame]] = []
+    compacted: set[date] = set()
+    for month, index in indexes(store).items():
+        compacted.update(index.days)
+        if (end is not None and month > end.date()) or (start is not None and month < _month(start.date())):
+            continue
+        locations = [index.locations[block] for block in index.blocks(wanted, start, end)]
+        if locations:
+            tasks.append(_reader(
+                store.read_blocks, store.data_dir / COMPACTED / index.file, locations, columns=read_columns
+            ))
+    for day in store.days():
+        in_range = (start is None or day >= start.date()) and (end is None or day <= end.date())
+        if day not in compacted and in_range:
+            tasks.append(_reader(delta.read, store, day, columns=read_columns, start=start, end=end))
+    with cf.ThreadPoolExecutor(workers) as executor:
+        frames = list(executor.map(lambda task: task(), tasks))
+    frames = [df for df in frames if len(df) > 0]
+    if not frames:
+        empty = pd.DataFrame(columns=store.frame.COLUMNS).astype(store.frame.DTYPES)
+        return store.frame(empty) if columns is None else empty[list(columns)]
+    df = pd.concat(frames, ignore_index=True)
+    mask = np.ones(len(df), dtype=bool)
+    if wanted is not None:
+        mask &= df["aID"].astype("str").isin(wanted).to_numpy()
+    if start is not None:
+        mask &= (df["datetime"] >= start).to_numpy()
+    if end is not None:
+        mask &= (df["datetime"] < end).to_numpy()
+    df = df[mask].sort_values(
+        ["aID", "datetime"], key=lambda s: s.astype("str") if s.name == "aID" else s, kind="mergesort"
+    )
+    if columns is not None:
+        dtypes = {column: store.frame.DTYPES[column] for column in columns}
+        return df[list(columns)].reset_index(drop=True).astype(dtypes)
+    return store.frame(df.reset_index(drop=True).astype(store.frame.DTYPES))
+
+
+def _reader(func: Callable[..., pd.DataFrame], *args: Any, **kwargs: Any) -> Callable[[], pd.DataFrame]:
+    return lambda: func(*args, **kwargs)
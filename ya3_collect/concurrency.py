@@ -0,0 +1,140 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import math
+import time
+import logging
+import threading
+from typing import Optional
+
+from ya3_collect import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class AIMDController:
+    """
+    Limit of the in-flight requests adjusted by additive increase and multiplicative decrease (AIMD)
+    from the latency and the throttling of the responses.
+
+    The limit grows as in TCP: it doubles after each window of `limit` requests succeeded at the first attempt
+    until it is decreased for the first time (slow start), and then grows by one per window.
+    It is multiplied by `backoff` when a request is throttled with 429 or 5xx or fails to connect, and when
+    the mean latency of a window exceeds `latency_tolerance` times the lowest latency seen.
+    The throttling of the requests sent before the last decrease is not counted again,
+    so that a burst of failures of the concurrent requests decreases the limit only once.
+    New requests are held while the server asks to retry later by `Retry-After`.
+    Every change of the limit is logged with its reason.
+
+    Parameters
+    ----------
+    max_limit : int
+        Maximum number of the in-flight requests.
+    min_limit : int
+        Minimum number of the in-flight requests.
+    initial : int, optional
+        Initial number of the in-flight requests. `min_limit` if not given.
+    backoff : float
+        Factor multiplied to the limit on a decrease.
+    latency_tolerance : float
+        Ratio of the mean latency of a window to the lowest latency, over which the limit is decreased.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        initial: Optional[int] = None,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0
+    ) -> None:
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError(f"invalid limits: min_limit={min_limit}, max_limit={max_limit}")
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(min(max_limit, max(min_limit, initial or min_limit)))
+        self.in_flight = 0
+        self.slow_start = True
+        self._base_latency = math.inf
+        self._window: list[float] = []
+        self._decreases = 0
+        self._resume_at = 0.0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        metrics.set_gauge("concurrency_limit", self.limit)
+
+    def acquire(self) -> None:
+        """
+        Wait until a request can be sent, and count it in flight.
+        """
+        with self._cond:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                self._cond.wait(wait if wait > 0 else None)
+            self.in_flight += 1
+            self._local.ticket = self._decreases
+
+    def release(self, latency: Optional[float] = None) -> None:
+        """
+        Count a request out of flight.
+
+        Parameters
+        ----------
+        latency : float, optional
+            Latency of the request in seconds if it succeeded at the first attempt.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None:
+                self._base_latency = min(self._base_latency, latency)
+                self._window.append(latency)
+                if len(self._window) >= int(self.limit):
+                    mean = math.fsum(self._window) / len(self._window)
+                    self._window.clear()
+                    if mean > self.latency_tolerance * self._base_latency:
+                        self._decrease(
+                            f"mean latency {mean:.3g} [sec] is over {self.latency_tolerance:g} times "
+                            f"the lowest {self._base_latency:.3g} [sec]"
+                        )
+                    elif self.slow_start:
+                        self._set(self.limit * 2, "slow start")
+                    else:
+                        self._set(self.limit + 1, "additive increase")
+            self._cond.notify_all()
+
+    def throttle(self, reason: str) -> None:
+        """
+        Decrease the limit since a request sent from this thread is throttled or fails to connect.
+        """
+        with self._cond:
+            if getattr(self._local, "ticket", self._decreases) == self._decreases:
+                self._decrease(reason)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold the new requests for `seconds` as asked by the server.
+        """
+        with self._cond:
+            resume_at = time.monotonic() + seconds
+            if resume_at > self._resume_at:
+                self._resume_at = resume_at
+                metrics.inc("concurrency_pauses_total")
+                logger.info(f"Holding new requests for {seconds:.3g} [sec] as asked by Retry-After")
+
+    def _decrease(self, reason: str) -> None:
+        self._decreases += 1
+        self.slow_start = False
+        self._window.clear()
+        self._set(self.limit * self.backoff, reason)
+
+    def _set(self, limit: float, reason: str) -> None:
+        old = int(self.limit)
+        self.limit = min(float(self.max_limit), max(float(self.min_limit), limit))
+        metrics.set_gauge("concurrency_limit", self.limit)
+        if int(self.limit) != old:
+            metrics.inc("concurrency_changes_total", direction="up" if int(self.limit) > old else "down")
+            logger.info(f"Concurrency {old} -> {int(self.limit)}: {reason}")
@@ -0,0 +1,17 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+import os
+
+
+COLUMNS = ["aID", "title", "datetime", "access", "watch", "bid"]
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+DATE_FORMAT = "%Y-%m-%d"
+MONTH_FORMAT = "%Y-%m"
+DATA_FORMATS = ("csv.gz", "parquet")
+LAYOUTS = ("wide", "normalized")
+FAST_PARSE_LAYOUTS = ("wide",)  # the normalized layout saves the static fields left out by the fast parse
+WRITE_MODES = ("append", "rewrite")
+ENCODINGS = ("dense", "delta")
+COUNTERS = ("access", "watch", "bid")
+ROLLUP_FREQUENCIES = ("hourly", "daily")
+QUEUE = "queue.sqlite3"
+DEFAULT_POOL_SIZE = min(32, (os.cpu_count() or 1) + 4)
@@ -0,0 +1,50 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import io
+import csv
+import gzip
+from datetime import date, datetime
+from pathlib import Path
+from typing import Iterable, Sequence, Union
+
+from ya3_collect import constants
+
+
+SUFFIX = ".csv.gz"
+
+
+def path(data_dir: Path, day: date) -> Path:
+    """
+    Path of the gzip-compressed CSV data file of `day`.
+    """
+    return (Path(data_dir) / day.strftime(constants.DATE_FORMAT)).with_suffix(SUFFIX)
+
+
+def append_rows(path: Union[str, Path], columns: Sequence[str], rows: Iterable[Sequence[object]]) -> None:
+    """
+    Append the rows to a gzip-compressed CSV data file as a new gzip member, without pandas.
+
+    The content is the same as `dataframe.BaseFrame.append_csv` writes, so that both can append to the same file:
+    the header is written only when the file is new and datetimes are formatted with `DATETIME_FORMAT`.
+
+    Parameters
+    ----------
+    path : str or Path
+        Path of the data file.
+    columns : Sequence[str]
+        Names of the columns.
+    rows : Iterable[Sequence[object]]
+        Values of the rows in the order of `columns`.
+    """
+    path = Path(path)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if not path.exists() or path.stat().st_size == 0:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow([
+            value.strftime(constants.DATETIME_FORMAT) if isinstance(value, datetime) else value for value in row
+        ])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(gzip.compress(buffer.getvalue().encode()))
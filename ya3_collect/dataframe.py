@@ -1,16 +1,74 @@
 # Copyright (c) 2022 Shuhei Nitta. All rights reserved.
 from __future__ import annotations
+import gzip
+import array
 import dataclasses
 from datetime import datetime
-from typing import Any
+from pathlib import Path
+from typing import Any, Iterable, Optional, Sequence, Union, TypeVar, TYPE_CHECKING
 
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 
-from ya3_collect import exceptions
+from ya3_collect import constants, exceptions, slotted
 
+if TYPE_CHECKING:
+    from ya3_collect.yahoo_auction import SellingItemInfo
 
-@dataclasses.dataclass
-class Record:
+
+COLUMNS = constants.COLUMNS
+DTYPES = {
+    "aID": "category",
+    "title": "object",
+    "datetime": "datetime64[ns]",
+    "access": "int32",
+    "watch": "int32",
+    "bid": "int32",
+}
+ITEM_COLUMNS = [
+    "aID", "datetime", "title", "seller_name", "stock", "start_datetime", "end_datetime", "refundable", "startprice"
+]
+ITEM_DTYPES = {
+    "aID": "category",
+    "datetime": "datetime64[ns]",
+    "title": "object",
+    "seller_name": "category",
+    "stock": "int32",
+    "start_datetime": "datetime64[ns]",
+    "end_datetime": "datetime64[ns]",
+    "refundable": "bool",
+    "startprice": "int64",
+}
+# Dtypes the columns of the files written by the older versions are read as, before `BaseFrame.upgrade`.
+ITEM_LEGACY_DTYPES = {
+    "startprice": "object",  # the text of the price, such as `1,000円`
+}
+SNAPSHOT_COLUMNS = ["aID", "datetime", "access", "watch", "bid"]
+SNAPSHOT_DTYPES = {column: DTYPES[column] for column in SNAPSHOT_COLUMNS}
+ROLLUP_COLUMNS = [
+    "aID", "datetime", "count", "access", "watch", "bid", "access_delta", "watch_delta", "bid_delta"
+]
+ROLLUP_DTYPES = {
+    "aID": "category",
+    "datetime": "datetime64[ns]",
+    "count": "int32",
+    "access": "int32",
+    "watch": "int32",
+    "bid": "int32",
+    "access_delta": "int32",
+    "watch_delta": "int32",
+    "bid_delta": "int32",
+}
+DATETIME_FORMAT = constants.DATETIME_FORMAT
+
+_F = TypeVar("_F", bound="BaseFrame")
+_Datetime = datetime  # the fields named `datetime` shadow the type in the records
+
+
+@dataclasses.dataclass(frozen=True)
+class Record(slotted.Slotted):
+    __slots__ = ("aID", "title", "datetime", "access", "watch", "bid")
     aID: str
     title: str
     datetime: datetime
@@ -19,19 +77,215 @@ class Record:
     bid: int
 
 
-class DataFrame(pd.DataFrame):  # type: ignore
+@dataclasses.dataclass(frozen=True)
+class ItemRecord(slotted.Slotted):
+    __slots__ = (
+        "aID", "datetime", "title", "seller_name", "stock", "start_datetime", "end_datetime", "refundable",
+        "startprice"
+    )
+    aID: str
+    datetime: datetime
+    title: str
+    seller_name: str
+    stock: int
+    start_datetime: _Datetime
+    end_datetime: _Datetime
+    refundable: bool
+    startprice: int
+
+
+@dataclasses.dataclass(frozen=True)
+class SnapshotRecord(slotted.Slotted):
+    __slots__ = ("aID", "datetime", "access", "watch", "bid")
+    aID: str
+    datetime: datetime
+    access: int
+    watch: int
+    bid: int
+
+
+class BaseFrame(pd.DataFrame):  # type: ignore
+    """
+    Dataframe whose columns should be `COLUMNS`, which is checked on construction.
+    """
+    COLUMNS: list[str] = []
+    DTYPES: dict[str, str] = {}
+    LEGACY_DTYPES: dict[str, str] = {}
 
-    def __new__(cls, *args: Any, **kwargs: Any) -> DataFrame:
-        self = super(DataFrame, cls).__new__(cls)
-        self.__init__(*args, **kwargs)
+    def __new__(cls: type[_F], *args: Any, **kwargs: Any) -> _F:
+        self: _F = super(BaseFrame, cls).__new__(cls)
+        self.__init__(*args, **kwargs)  # type: ignore[misc]
         self.check_format()
-        return self  # type: ignore
+        return self
+
+    @classmethod
+    def from_records(cls: type[_F], records: Iterable[Any]) -> _F:
+        """
+        Build a dataframe from the records whose fields are `COLUMNS`.
+
+        Parameters
+        ----------
+        records : Iterable
+            Records whose fields are `COLUMNS`.
+
+        Returns
+        -------
+        BaseFrame
+            Dataframe of the records, whose columns have the dtypes of `DTYPES`.
+        """
+        df = pd.DataFrame(
+            [tuple(getattr(record, column) for column in cls.COLUMNS) for record in records],
+            columns=cls.COLUMNS
+        )
+        return cls(df.astype(cls.DTYPES))
+
+    @classmethod
+    def upgrade(cls, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Convert the columns read from a data file into `DTYPES`, including those read as `LEGACY_DTYPES`.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Some of `COLUMNS` read from a data file.
+
+        Returns
+        -------
+        pd.DataFrame
+            The columns of `df` in `DTYPES`.
+        """
+        return df.astype({column: cls.DTYPES[column] for column in df.columns})
+
+    def check_format(self) -> None:
+        """
+        Check dataframe is valid format.
+
+        Raises
+        ------
+        InvalidFormatError
+            Raises when the format is invalid.
+        """
+        for i, column in enumerate(self.COLUMNS):
+            got = self.columns[i] if i < len(self.columns) else None
+            if got != column:
+                raise exceptions.InvalidFormatError(f"df.columns[{i}] should be `{column}`, got {got}")
+
+    def append_csv(self, path: Union[str, Path]) -> None:
+        """
+        Append the rows to a gzip-compressed data file as a new gzip member.
+
+        The existing content of the file is neither read nor rewritten, so the cost depends only on the new rows.
+        The header is written only when the file is new, and `read_csv` reads all the members as one table.
+
+        Parameters
+        ----------
+        path : str or Path
+            Path of the data file.
+        """
+        path = Path(path)
+        header = not path.exists() or path.stat().st_size == 0
+        content = self.to_csv(index=False, header=header, date_format=DATETIME_FORMAT)
+        with open(path, "ab") as f:
+            f.write(gzip.compress(content.encode()))
+
+
+class ItemFrame(BaseFrame):
+    """
+    Dimension table of the static fields of the items.
+
+    Each row is a version of the fields of an item, first seen at `datetime`.
+    """
+    COLUMNS = ITEM_COLUMNS
+    DTYPES = ITEM_DTYPES
+    LEGACY_DTYPES = ITEM_LEGACY_DTYPES
+
+    @classmethod
+    def upgrade(cls, df: pd.DataFrame) -> pd.DataFrame:
+        if "startprice" in df.columns and df["startprice"].dtype == "object":
+            df = df.assign(startprice=parse_yen(df["startprice"]))
+        return super().upgrade(df)
+
+    def latest(self) -> ItemFrame:
+        """
+        The latest version of each item.
+        """
+        return ItemFrame(self.sort_values("datetime", kind="mergesort").drop_duplicates("aID", keep="last"))
+
+    def changed(self, items: ItemFrame) -> ItemFrame:
+        """
+        The rows of `items` whose static fields differ from the latest version in this table.
+
+        Parameters
+        ----------
+        items : ItemFrame
+            New versions of the items.
+
+        Returns
+        -------
+        ItemFrame
+            Rows of `items` which are new or changed.
+        """
+        static = [column for column in ITEM_COLUMNS if column not in ("aID", "datetime")]
+        latest = self.latest()[["aID", *static]].astype({"aID": "str"})
+        merged = items.astype({"aID": "str"}).merge(
+            latest, on="aID", how="left", suffixes=("", "_latest"), indicator=True
+        )
+        changed = merged["_merge"] == "left_only"
+        for column in static:
+            changed |= merged[column].astype("object") != merged[f"{column}_latest"].astype("object")
+        return ItemFrame(items[changed.to_numpy()].reset_index(drop=True))
+
+
+class SnapshotFrame(BaseFrame):
+    """
+    Fact table of the counters of the items at each run.
+    """
+    COLUMNS = SNAPSHOT_COLUMNS
+    DTYPES = SNAPSHOT_DTYPES
+
+
+class RollupFrame(BaseFrame):
+    """
+    Counters of the items aggregated per period starting at `datetime`.
+
+    `count` is the number of the snapshots in the period, the counters are the values at the last snapshot,
+    and the deltas are their increases since the last snapshot before the period.
+    """
+    COLUMNS = ROLLUP_COLUMNS
+    DTYPES = ROLLUP_DTYPES
+
+
+class DataFrame(BaseFrame):
+    COLUMNS = COLUMNS
+    DTYPES = DTYPES
 
     @staticmethod
     def new() -> DataFrame:
-        df = DataFrame(columns=["aID", "title", "datetime", "access", "watch", "bid"])
+        df = DataFrame(columns=COLUMNS)
         return df
 
+    @staticmethod
+    def read_csv(path: Union[str, Path]) -> DataFrame:
+        """
+        Read a data file written by `to_csv` with the explicit dtypes.
+
+        Parameters
+        ----------
+        path : str or Path
+            Path of the data file.
+
+        Returns
+        -------
+        DataFrame
+            Data in the file.
+        """
+        df = pd.read_csv(
+            path,
+            dtype={column: dtype for column, dtype in DTYPES.items() if column != "datetime"},
+            parse_dates=["datetime"]
+        )
+        return DataFrame(df)
+
     def check_format(self) -> None:
         """
         Check dataframe is valid format.
@@ -60,13 +314,209 @@ class DataFrame(pd.DataFrame):  # type: ignore
             raise exceptions.InvalidFormatError(f"df.colomns[5] should be `bid`, got {self.columns[5]}")
 
     def add_record(self, record: Record) -> DataFrame:
-        df = DataFrame(self.append(pd.DataFrame({
+        df = DataFrame(pd.concat([self, pd.DataFrame({
             "aID": [record.aID],
             "title": [record.title],
             "datetime": [record.datetime.isoformat(timespec="seconds")],
             "access": [record.access],
             "watch": [record.watch],
             "bid": [record.bid]
-        })))
+        })]))
         return df
 
+    def add_records(self, records: Iterable[Record]) -> DataFrame:
+        """
+        Add the records at once.
+
+        The values are collected into column buffers and concatenated to this dataframe only once,
+        so adding n records costs O(n) instead of the O(n^2) of calling `add_record` n times.
+
+        Parameters
+        ----------
+        records : Iterable[Record]
+            Records to add.
+
+        Returns
+        -------
+        DataFrame
+            New dataframe with the records, whose columns have the dtypes of `DTYPES`.
+        """
+        builder = RecordBuilder()
+        builder.extend(records)
+        return builder.build(self)
+
+
+class RecordBuilder:
+    """
+    Typed column buffers of records, which are materialized into a `DataFrame` at once.
+    """
+
+    def __init__(self) -> None:
+        self._aIDs: list[str] = []
+        self._titles: list[str] = []
+        self._datetimes: list[datetime] = []
+        self._accesses = array.array("i")
+        self._watches = array.array("i")
+        self._bids = array.array("i")
+
+    def __len__(self) -> int:
+        return len(self._aIDs)
+
+    def add(self, record: Record) -> None:
+        self._aIDs.append(record.aID)
+        self._titles.append(record.title)
+        self._datetimes.append(record.datetime)
+        self._accesses.append(record.access)
+        self._watches.append(record.watch)
+        self._bids.append(record.bid)
+
+    def extend(self, records: Iterable[Record]) -> None:
+        for record in records:
+            self.add(record)
+
+    def build(self, base: Optional[pd.DataFrame] = None) -> DataFrame:
+        """
+        Materialize the buffered records.
+
+        Parameters
+        ----------
+        base : pd.DataFrame, optional
+            Dataframe the records are appended to.
+
+        Returns
+        -------
+        DataFrame
+            Dataframe of `base` followed by the records, whose columns have the dtypes of `DTYPES`.
+        """
+        df = pd.DataFrame({
+            "aID": pd.Categorical(self._aIDs),
+            "title": pd.Series(self._titles, dtype="object"),
+            "datetime": pd.to_datetime(pd.Series(self._datetimes, dtype="object")),
+            "access": pd.Series(self._accesses, dtype="int32"),
+            "watch": pd.Series(self._watches, dtype="int32"),
+            "bid": pd.Series(self._bids, dtype="int32"),
+        }, columns=COLUMNS)
+        if base is not None and len(base) > 0:
+            df = pd.concat([base, df], ignore_index=True)
+        return DataFrame(df.astype(DTYPES))
+
+
+class RecordBatch:
+    """
+    Records of a run held as NumPy columns, which become a `DataFrame` or a `SnapshotFrame` at once
+    without building an object per record.
+
+    Parameters
+    ----------
+    aIDs : np.ndarray
+        aIDs of the items, as an object array.
+    titles : np.ndarray
+        Titles of the items, as an object array.
+    datetimes : np.ndarray
+        Times of the snapshots, as a `datetime64[ns]` array.
+    access : np.ndarray
+        Access counts, as an `int32` array.
+    watch : np.ndarray
+        Watch counts, as an `int32` array.
+    bid : np.ndarray
+        Bid counts, as an `int32` array.
+    """
+
+    def __init__(
+        self,
+        aIDs: npt.NDArray[np.object_],
+        titles: npt.NDArray[np.object_],
+        datetimes: npt.NDArray[np.datetime64],
+        access: npt.NDArray[np.int32],
+        watch: npt.NDArray[np.int32],
+        bid: npt.NDArray[np.int32]
+    ) -> None:
+        self.aIDs = aIDs
+        self.titles = titles
+        self.datetimes = datetimes
+        self.access = access
+        self.watch = watch
+        self.bid = bid
+
+    @classmethod
+    def from_infos(cls, infos: Sequence[SellingItemInfo], now: _Datetime) -> RecordBatch:
+        """
+        Batch of the snapshots of the items at `now`.
+        """
+        n = len(infos)
+        return cls(
+            np.array([info.aID for info in infos], dtype=object),
+            np.array([info.title for info in infos], dtype=object),
+            np.full(n, np.datetime64(now, "ns")),
+            np.fromiter((info.count_access for info in infos), dtype=np.int32, count=n),
+            np.fromiter((info.count_watch for info in infos), dtype=np.int32, count=n),
+            np.fromiter((info.count_bid for info in infos), dtype=np.int32, count=n),
+        )
+
+    def __len__(self) -> int:
+        return len(self.aIDs)
+
+    def to_frame(self) -> DataFrame:
+        """
+        Wide dataframe of the records.
+        """
+        return DataFrame(pd.DataFrame({
+            "aID": pd.Categorical(self.aIDs),
+            "title": self.titles,
+            "datetime": self.datetimes,
+            "access": self.access,
+            "watch": self.watch,
+            "bid": self.bid,
+        }, columns=COLUMNS))
+
+    def to_snapshots(self) -> SnapshotFrame:
+        """
+        Narrow dataframe of the snapshots of the records without the titles.
+        """
+        return SnapshotFrame(pd.DataFrame({
+            "aID": pd.Categorical(self.aIDs),
+            "datetime": self.datetimes,
+            "access": self.access,
+            "watch": self.watch,
+            "bid": self.bid,
+        }, columns=SNAPSHOT_COLUMNS))
+
+
+def parse_yen(prices: pd.Series) -> pd.Series:
+    """
+    Prices in yen, parsed from the first number of their texts such as `10,000 円（税 0 円）`, or 0 if none.
+    """
+    numbers = prices.astype("str").str.extract(r"(\d[\d,]*)", expand=False).str.replace(",", "", regex=False)
+    return numbers.fillna("0").astype("int64")
+
+
+def join(snapshots: SnapshotFrame, items: ItemFrame) -> DataFrame:
+    """
+    Rebuild the wide `DataFrame` from the normalized tables.
+
+    Each snapshot takes the title of the latest version of its item at the time of the snapshot.
+
+    Parameters
+    ----------
+    snapshots : SnapshotFrame
+        Counters of the items.
+    items : ItemFrame
+        Static fields of the items.
+
+    Returns
+    -------
+    DataFrame
+        Wide dataframe of the snapshots in the same order.
+    """
+    left = snapshots.astype({"aID": "str"}).reset_index(drop=True)
+    left["_order"] = range(len(left))
+    right = items[["aID", "datetime", "title"]].astype({"aID": "str"})
+    merged = pd.merge_asof(
+        left.sort_values("datetime", kind="mergesort"),
+        right.sort_values("datetime", kind="mergesort"),
+        on="datetime",
+        by="aID",
+        direction="backward"
+    )
+    merged = merged.sort_values("_order").reset_index(drop=True)
+    return DataFrame(merged[COLUMNS].astype(DTYPES))
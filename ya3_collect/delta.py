@@ -0,0 +1,273 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import os
+import json
+import logging
+import dataclasses
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence, Union
+
+import pandas as pd
+
+from ya3_collect import constants, dataframe, metrics, storage
+
+
+ENCODINGS = constants.ENCODINGS
+KEYFRAME_INTERVAL = timedelta(hours=1)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class Run:
+    """
+    Entry of the log of the runs written into a data file with the `delta` encoding.
+
+    Parameters
+    ----------
+    datetime : datetime
+        Time of the snapshots of the run, in seconds.
+    keyframe : bool
+        Whether all the items of the run are written, or only the items changed since the previous run.
+    removed : list[str]
+        aIDs of the items of the previous run which are not in the run.
+    """
+    datetime: datetime
+    keyframe: bool
+    removed: list[str] = dataclasses.field(default_factory=list)
+
+
+def read_runs(store: storage.Storage, key: Union[date, str]) -> list[Run]:
+    """
+    Read the log of the runs written into the data file of `key`, which is empty for a `dense` data file.
+    """
+    path = store.runs_path(key)
+    if not path.exists():
+        return []
+    runs: list[Run] = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                runs.append(Run(datetime.fromisoformat(entry["datetime"]), entry["keyframe"], entry["removed"]))
+    return runs
+
+
+def append_runs(store: storage.Storage, key: Union[date, str], runs: Iterable[Run]) -> Path:
+    """
+    Append `runs` to the log of the runs written into the data file of `key`.
+    """
+    path = store.runs_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        for run in runs:
+            entry = {"datetime": run.datetime.isoformat(), "keyframe": run.keyframe, "removed": run.removed}
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    return path
+
+
+def _values(df: pd.DataFrame) -> pd.DataFrame:
+    # Values of the items indexed by aID, without the time of the snapshot.
+    values = df.drop(columns="datetime").astype({"aID": "str"}).set_index("aID")
+    return values[~values.index.duplicated(keep="last")]
+
+
+def _replay(df: pd.DataFrame, runs: Sequence[Run]) -> Iterator[tuple[Run, pd.DataFrame]]:
+    # Forward-fill the values of the items run by run. The rows at a time missing in `runs`, e.g. those written
+    # with the `dense` encoding earlier in the day, are taken as a keyframe.
+    times = df["datetime"].dt.floor("s")
+    logged = {run.datetime: run for run in runs}
+    for time in times.unique():
+        time = pd.Timestamp(time).to_pydatetime()
+        if time not in logged:
+            logged[time] = Run(time, True)
+    parts = {pd.Timestamp(time).to_pydatetime(): part for time, part in df.groupby(times, sort=False)}
+    state = _values(df.iloc[:0])
+    for time in sorted(logged):
+        run = logged[time]
+        rows = _values(parts[time]) if time in parts else _values(df.iloc[:0])
+        if run.keyframe:
+            state = rows
+        else:
+            state = state.drop(index=run.removed, errors="ignore")
+            state.update(rows)
+            state = pd.concat([state, rows[~rows.index.isin(state.index)]])
+        yield run, state
+
+
+def decode(df: pd.DataFrame, runs: Sequence[Run]) -> pd.DataFrame:
+    """
+    Forward-fill the rows written with the `delta` encoding into the rows of every item at every run.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Rows of a data file, which has at least `aID` and `datetime`.
+    runs : Sequence[Run]
+        Log of the runs written into the data file.
+
+    Returns
+    -------
+    pd.DataFrame
+        Rows of every item at every run in the order of the runs, with the columns and the dtypes of `df`.
+    """
+    frames = [
+        state.reset_index().assign(datetime=run.datetime)[list(df.columns)] for run, state in _replay(df, runs)
+    ]
+    if not frames:
+        return df.iloc[:0]
+    dtypes = {
+        column: "category" if isinstance(dtype, pd.CategoricalDtype) else dtype for column, dtype in df.dtypes.items()
+    }
+    dense = pd.concat(frames, ignore_index=True).astype(dtypes)
+    return type(df)(dense) if isinstance(df, dataframe.BaseFrame) else dense
+
+
+def read(
+    store: storage.Storage,
+    key: Union[date, str],
+    columns: Optional[Sequence[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> pd.DataFrame:
+    """
+    Read the data of `key` as `storage.Storage.read`, forward-filling it if written with the `delta` encoding.
+
+    The whole data file is read and forward-filled before the rows are filtered by `start` and `end`,
+    since the rows at a run may be written at an earlier run.
+    """
+    runs = read_runs(store, key)
+    if not runs:
+        return store.read(key, columns=columns, start=start, end=end)
+    columns = list(columns) if columns is not None else store.frame.COLUMNS
+    read_columns = list(dict.fromkeys(["aID", "datetime", *columns]))
+    df = decode(store.read(key, columns=read_columns), runs)
+    if start is not None:
+        df = df[df["datetime"] >= start]
+    if end is not None:
+        df = df[df["datetime"] < end]
+    df = df[columns].reset_index(drop=True)
+    if columns == store.frame.COLUMNS:
+        return store.frame(df)
+    return df
+
+
+class DeltaEncoder:
+    """
+    Encoder of the snapshots of the runs, which keeps only the rows of the items changed since the previous run.
+
+    An item is written when any of its values but the time differs from the previous run, or when it is new.
+    All the items of a run are written as a keyframe at the first run and every `keyframe_interval` after it,
+    so that a data file is forward-filled from its first run and a lost row is filled again at the next keyframe.
+    The items of the previous run which are not in a run are recorded in its `Run` to stop filling them.
+    The previous run is saved next to the data file by `save`, so that the next process `load`s it
+    instead of replaying the whole data file.
+
+    Parameters
+    ----------
+    keyframe_interval : timedelta
+        Interval between the keyframes.
+    """
+
+    def __init__(self, keyframe_interval: timedelta = KEYFRAME_INTERVAL) -> None:
+        self.keyframe_interval = keyframe_interval
+        self.state: Optional[pd.DataFrame] = None
+        self.keyframe_at: Optional[datetime] = None
+        self.run_at: Optional[datetime] = None
+
+    def reset(self) -> None:
+        """
+        Forget the previous run, so that the next run is a keyframe.
+        """
+        self.state = None
+        self.keyframe_at = None
+        self.run_at = None
+
+    def restore(self, df: pd.DataFrame, runs: Sequence[Run]) -> None:
+        """
+        Restore the previous run from the rows and the log of the runs of a data file.
+        """
+        self.reset()
+        for run, state in _replay(df, runs):
+            self.state = state
+            self.run_at = run.datetime
+            if run.keyframe:
+                self.keyframe_at = run.datetime
+
+    def save(self, path: Path) -> None:
+        """
+        Save the values of the items at the previous run into `path`, which is replaced atomically.
+        """
+        if self.state is None or self.run_at is None:
+            return
+        content = {
+            "datetime": self.run_at.isoformat(),
+            "keyframe_at": self.keyframe_at.isoformat() if self.keyframe_at is not None else None,
+            "columns": list(self.state.columns),
+            "rows": dict(zip(self.state.index.astype("str"), self.state.astype("object").values.tolist())),
+        }
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def load(self, path: Path, runs: Sequence[Run]) -> bool:
+        """
+        Restore the previous run saved by `save` into `path`, which should be the last of `runs`,
+        the log of the runs of the data file.
+
+        Returns
+        -------
+        bool
+            Whether the previous run is restored. The encoder is reset if the file is missing, or is older than
+            the last run, e.g. when the process stopped between the writes of the data file and of `path`.
+        """
+        self.reset()
+        if not path.exists() or not runs:
+            return False
+        with open(path, encoding="utf-8") as f:
+            content = json.load(f)
+        if datetime.fromisoformat(content["datetime"]) != runs[-1].datetime:
+            return False
+        rows = content["rows"]
+        self.state = pd.DataFrame(
+            list(rows.values()), index=pd.Index(list(rows), name="aID", dtype="object"), columns=content["columns"]
+        )
+        self.run_at = runs[-1].datetime
+        if content["keyframe_at"] is not None:
+            self.keyframe_at = datetime.fromisoformat(content["keyframe_at"])
+        return True
+
+    def encode(self, df: pd.DataFrame, now: datetime) -> tuple[pd.DataFrame, Run]:
+        """
+        Encode the snapshots of all the items at the run at `now`.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Snapshots of the run, which has at least `aID` and `datetime`.
+        now : datetime
+            Time of the run.
+
+        Returns
+        -------
+        tuple[pd.DataFrame, Run]
+            Rows to write and the entry of the run to log after them.
+        """
+        values = _values(df)
+        run = Run(now.replace(microsecond=0), False)
+        self.run_at = run.datetime
+        if self.state is None or self.keyframe_at is None or now - self.keyframe_at >= self.keyframe_interval:
+            run.keyframe = True
+            self.keyframe_at = run.datetime
+            encoded = df
+        else:
+            previous = self.state.reindex(df["aID"].astype("str"))
+            current = df.drop(columns="datetime").set_index(df["aID"].astype("str")).drop(columns="aID")
+            new = ~previous.index.isin(self.state.index)
+            changed = (current.astype("object") != previous.astype("object")).any(axis=1).to_numpy()
+            encoded = df[new | changed].reset_index(drop=True)
+            run.removed = sorted(set(self.state.index) - set(values.index))
+            metrics.inc("delta_rows_skipped_total", len(df) - len(encoded))
+        self.state = values
+        return encoded, run
@@ -0,0 +1,245 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import os
+import gzip
+import json
+import hashlib
+import logging
+import threading
+import dataclasses
+import collections
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Optional
+
+
+INDEX = "index.json"
+BODY_SUFFIX = ".gz"
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class Entry:
+    """
+    Cached response of a URL to an account.
+
+    Parameters
+    ----------
+    url : str
+        URL of the request.
+    etag : str, optional
+        `ETag` of the response.
+    last_modified : str, optional
+        `Last-Modified` of the response.
+    size : int
+        Size of the compressed body on disk in bytes.
+    parsed : dict[str, dict[str, Any]]
+        Fields parsed from the body by the name of the parser, which are dropped when the body changes.
+    account : str
+        Account the response is sent to, which is empty for the requests without cookies.
+    """
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    size: int
+    parsed: dict[str, dict[str, Any]] = dataclasses.field(default_factory=dict)
+    account: str = ""
+
+    @property
+    def key(self) -> str:
+        return _key(self.url, self.account)
+
+    @property
+    def file(self) -> str:
+        return hashlib.sha1(self.key.encode()).hexdigest() + BODY_SUFFIX
+
+    def validators(self) -> dict[str, str]:
+        """
+        Headers of a conditional request for the cached body.
+        """
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HTTPCache:
+    """
+    On-disk cache of the bodies of the GET responses with a validator, revalidated by conditional requests.
+
+    Each body is saved gzip-compressed in a file of `cache_dir`, and the entries are indexed in `index.json`,
+    which is written when the cache is closed or saved. The entries are never served without revalidation.
+    The content of a URL depends on the cookies, while its validator may not, so the entries are kept apart
+    by `account`, the identity of the cookies. The least recently used entries are evicted once the bodies exceed
+    `max_bytes`. It is shared by any number of threads.
+
+    Parameters
+    ----------
+    cache_dir : Path
+        Directory of the cache.
+    max_bytes : int
+        Total size of the compressed bodies kept at most in bytes.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        if max_bytes <= 0:
+            raise ValueError(f"max_bytes should be positive, got {max_bytes}")
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: collections.OrderedDict[str, Entry] = collections.OrderedDict()  # least recently used first
+        self._size = 0
+        self._load()
+
+    def __enter__(self) -> HTTPCache:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """
+        Total size of the compressed bodies in bytes.
+        """
+        return self._size
+
+    def lookup(self, url: str, account: str = "") -> Optional[Entry]:
+        """
+        Entry of `url` to `account`, or None if it is not cached.
+        """
+        key = _key(url, account)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def body(self, entry: Entry) -> Optional[bytes]:
+        """
+        Cached body of `entry`, or None if it has been evicted or is unreadable.
+        """
+        try:
+            with gzip.open(self.cache_dir / entry.file, "rb") as f:
+                content: bytes = f.read()
+        except (OSError, EOFError):
+            self.discard(entry.url, entry.account)
+            return None
+        return content
+
+    def put(
+        self,
+        url: str,
+        content: bytes,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        account: str = ""
+    ) -> None:
+        """
+        Cache the body of a response of `url` to `account` with its validators, replacing the previous entry
+        and its parses. The entry is discarded if the response has no validator.
+        """
+        if etag is None and last_modified is None:
+            self.discard(url, account)
+            return
+        entry = Entry(url, etag, last_modified, 0, account=account)
+        path = self.cache_dir / entry.file
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(gzip.compress(content, compresslevel=6))
+        entry.size = tmp.stat().st_size
+        with self._lock:
+            os.replace(tmp, path)
+            if (previous := self._entries.pop(entry.key, None)) is not None:
+                self._size -= previous.size
+            self._entries[entry.key] = entry
+            self._size += entry.size
+            self._evict()
+
+    def parsed(self, url: str, parser: str, account: str = "") -> Optional[dict[str, Any]]:
+        """
+        Fields parsed by `parser` from the cached body of `url` to `account`, or None if it has not been parsed.
+        """
+        with self._lock:
+            entry = self._entries.get(_key(url, account))
+            return None if entry is None else entry.parsed.get(parser)
+
+    def set_parsed(self, url: str, parser: str, fields: dict[str, Any], account: str = "") -> None:
+        """
+        Keep the fields parsed by `parser` from the cached body of `url` to `account`,
+        which is ignored if it is not cached.
+        """
+        with self._lock:
+            if (entry := self._entries.get(_key(url, account))) is not None:
+                entry.parsed[parser] = fields
+
+    def discard(self, url: str, account: str = "") -> None:
+        with self._lock:
+            if (entry := self._entries.pop(_key(url, account), None)) is not None:
+                self._size -= entry.size
+                (self.cache_dir / entry.file).unlink(missing_ok=True)
+
+    def save(self) -> None:
+        """
+        Write the index of the entries.
+        """
+        with self._lock:
+            content = [dataclasses.asdict(entry) for entry in self._entries.values()]
+        path = self.cache_dir / INDEX
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(content, ensure_ascii=False, separators=(",", ":")))
+        os.replace(tmp, path)
+
+    def close(self) -> None:
+        self.save()
+
+    def _load(self) -> None:
+        path = self.cache_dir / INDEX
+        if path.exists():
+            try:
+                with open(path, encoding="utf-8") as f:
+                    content = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(f"The broken index of the HTTP cache {path.as_posix()} is ignored")
+                content = []
+            for fields in content:
+                entry = Entry(**fields)
+                if (self.cache_dir / entry.file).exists():
+                    self._entries[entry.key] = entry
+                    self._size += entry.size
+        files = {entry.file for entry in self._entries.values()}
+        for file in self.cache_dir.glob(f"*{BODY_SUFFIX}"):
+            if file.name not in files:  # written after the index was saved last
+                file.unlink()
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+            (self.cache_dir / entry.file).unlink(missing_ok=True)
+
+
+def _key(url: str, account: str) -> str:
+    return f"{account} {url}" if account else url
+
+
+def account(cookies: dict[str, str]) -> str:
+    """
+    Identity of the account of `cookies` to key the entries, which is empty for no cookies.
+    """
+    if not cookies:
+        return ""
+    return hashlib.sha1(json.dumps(sorted(cookies.items())).encode()).hexdigest()[:16]
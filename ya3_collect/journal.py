@@ -0,0 +1,114 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Optional
+
+from ya3_collect.yahoo_auction import SellingItemInfo
+
+
+JOURNAL = "journal.jsonl"
+
+logger = logging.getLogger(__name__)
+
+
+def path(data_dir: Path) -> Path:
+    """
+    Path of the journal of the run in progress which saves into `data_dir`.
+    """
+    return Path(data_dir) / JOURNAL
+
+
+class Journal:
+    """
+    Write-ahead journal of the items of a run, appended as soon as each item page is parsed.
+
+    The first line has the start time of the run, and each following line has the URL and the information
+    of an item, flushed before the item is handed to the caller, so that a run killed midway leaves the items
+    parsed so far. The journal is removed once its items are saved into the data file.
+    A line torn by a crash is ignored when the journal is loaded.
+
+    Parameters
+    ----------
+    data_dir : Path
+        Directory where the items of the run are saved.
+    started : datetime
+        Start time of the run, which is the time of the snapshots of the items.
+    """
+
+    def __init__(self, data_dir: Path, started: datetime) -> None:
+        self.path = path(data_dir)
+        self.started = started
+        self.infos: list[SellingItemInfo] = []
+        self.done: set[str] = set()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._write({"started": started.isoformat()})
+
+    @classmethod
+    def load(cls, data_dir: Path) -> Optional[Journal]:
+        """
+        Open the journal left in `data_dir` by an interrupted run to append to it, or None if there is none.
+        """
+        journal_path = path(data_dir)
+        if not journal_path.exists():
+            return None
+        with open(journal_path, encoding="utf-8") as f:
+            text = f.read()
+        lines = text.splitlines()
+        if not lines or not lines[0].endswith("}"):
+            journal_path.unlink()  # killed before the first line is written
+            return None
+        journal = cls.__new__(cls)
+        journal.path = journal_path
+        journal.started = datetime.fromisoformat(json.loads(lines[0])["started"])
+        journal.infos = []
+        journal.done = set()
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"A torn line of {journal_path.as_posix()} is ignored")
+                continue
+            journal.infos.append(SellingItemInfo.from_dict(entry["info"]))
+            journal.done.add(entry["url"])
+        journal._file = open(journal_path, "a", encoding="utf-8")
+        if not text.endswith("\n"):
+            journal._file.write("\n")
+        return journal
+
+    def __enter__(self) -> Journal:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        self.close()
+
+    def add(self, url: str, info: SellingItemInfo) -> None:
+        """
+        Append the information of the item of the page at `url`.
+        """
+        self._write({"url": url, "info": info.to_dict()})
+        self.infos.append(info)
+        self.done.add(url)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def remove(self) -> None:
+        """
+        Close and remove the journal once its items are saved.
+        """
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def _write(self, entry: dict[str, Any]) -> None:
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
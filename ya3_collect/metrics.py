@@ -0,0 +1,223 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import os
+import sys
+import json
+import math
+import time
+import threading
+import contextlib
+from pathlib import Path
+from typing import Any, Iterator, Union
+
+
+PREFIX = "ya3_collect_"
+QUANTILES = (0.5, 0.95, 0.99)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Observed values of a metric, summarized by the count, the sum, the maximum and the quantiles.
+    """
+
+    def __init__(self) -> None:
+        self.values: list[float] = []
+
+    def observe(self, value: float) -> None:
+        self.values.append(value)
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    @property
+    def sum(self) -> float:
+        return math.fsum(self.values)
+
+    def quantile(self, q: float) -> float:
+        """
+        The `q` quantile of the observed values by the nearest rank, or NaN if nothing is observed.
+        """
+        if not self.values:
+            return math.nan
+        values = sorted(self.values)
+        return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+    def summary(self) -> dict[str, float]:
+        summary: dict[str, float] = {"count": self.count, "sum": self.sum}
+        if self.values:
+            summary["max"] = max(self.values)
+            for q in QUANTILES:
+                summary[f"p{q * 100:g}"] = self.quantile(q)
+        return summary
+
+
+class Registry:
+    """
+    Metrics of a collection: counters, gauges and histograms, each identified by a name and labels.
+
+    The metrics are recorded from any thread. The values in the worker processes are not recorded,
+    so the stages run in them are measured by the caller.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self.gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self.histograms.setdefault(key, Histogram()).observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """
+        Observe the elapsed seconds of the block in the histogram `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Summary of the metrics, which can be dumped as JSON.
+
+        The peak RSS of this process and of its finished child processes are recorded when available.
+        """
+        _set_peak_rss(self)
+        with self._lock:
+            return {
+                "started": self.started,
+                "elapsed": time.time() - self.started,
+                "counters": _group(self.counters),
+                "gauges": _group(self.gauges),
+                "histograms": _group({key: hist.summary() for key, hist in self.histograms.items()}),
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Metrics in the Prometheus text format, for the textfile collector of the node exporter.
+
+        Every metric is a gauge of the last collection. The histograms are exported as
+        `<name>{quantile="..."}`, `<name>_count`, `<name>_sum` and `<name>_max`.
+        """
+        _set_peak_rss(self)
+        lines: list[str] = []
+        with self._lock:
+            samples: dict[str, list[tuple[str, Labels, float]]] = {}
+            for (name, labels), value in [*self.counters.items(), *self.gauges.items()]:
+                samples.setdefault(name, []).append(("", labels, value))
+            for (name, labels), hist in self.histograms.items():
+                for q in QUANTILES:
+                    samples.setdefault(name, []).append(("", (*labels, ("quantile", f"{q:g}")), hist.quantile(q)))
+                samples[name].append(("_count", labels, hist.count))
+                samples[name].append(("_sum", labels, hist.sum))
+                samples[name].append(("_max", labels, max(hist.values, default=math.nan)))
+            elapsed = time.time() - self.started
+        samples["last_run_timestamp_seconds"] = [("", (), self.started)]
+        samples["last_run_duration_seconds"] = [("", (), elapsed)]
+        for name in sorted(samples):
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            for suffix, labels, value in sorted(samples[name], key=lambda sample: (sample[0], sample[1])):
+                lines.append(f"{PREFIX}{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: Union[str, Path]) -> None:
+        _write_atomic(Path(path), json.dumps(self.summary(), indent=2, ensure_ascii=False) + "\n")
+
+    def write_prometheus(self, path: Union[str, Path]) -> None:
+        _write_atomic(Path(path), self.to_prometheus())
+
+
+REGISTRY = Registry()
+
+
+def reset() -> Registry:
+    """
+    Start recording the metrics of a new collection in a new `REGISTRY`.
+    """
+    global REGISTRY
+    REGISTRY = Registry()
+    return REGISTRY
+
+
+def inc(name: str, value: float = 1, **labels: str) -> None:
+    REGISTRY.inc(name, value, **labels)
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+    REGISTRY.set_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    REGISTRY.observe(name, value, **labels)
+
+
+def timer(name: str, **labels: str) -> contextlib.AbstractContextManager[None]:
+    return REGISTRY.timer(name, **labels)
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _group(values: dict[tuple[str, Labels], Any]) -> dict[str, Any]:
+    grouped: dict[str, Any] = {}
+    for (name, labels), value in sorted(values.items(), key=lambda item: item[0]):
+        if labels:
+            grouped.setdefault(name, {})[",".join(f"{key}={label}" for key, label in labels)] = value
+        else:
+            grouped[name] = value
+    return grouped
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _set_peak_rss(registry: Registry) -> None:
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        return
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in bytes on macOS and in KiB on Linux
+    registry.set_gauge(
+        "peak_rss_bytes", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, process="self"
+    )
+    registry.set_gauge(
+        "peak_rss_bytes", resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, process="children"
+    )
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(content)
+    os.replace(tmp, path)
@@ -0,0 +1,70 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import time
+import random
+import logging
+import threading
+from concurrent import futures
+from typing import Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def run_every(
+    cycle: Callable[[], object],
+    interval: float,
+    jitter: float = 0,
+    stop: Optional[threading.Event] = None,
+    max_cycles: Optional[int] = None
+) -> int:
+    """
+    Run `cycle` every `interval` seconds in a worker thread until `stop` is set.
+
+    Each start is delayed from the schedule by a random jitter up to `jitter` seconds.
+    A cycle is skipped if the previous one is still running, so that the cycles never overlap.
+    An exception raised by a cycle is logged and does not stop the schedule.
+
+    Parameters
+    ----------
+    cycle : Callable[[], object]
+        Function run at each cycle.
+    interval : float
+        Interval between the scheduled starts in seconds.
+    jitter : float
+        Maximum delay added to each start in seconds.
+    stop : threading.Event, optional
+        Event to stop the schedule. The running cycle is waited for.
+    max_cycles : int, optional
+        Number of the scheduled cycles, including the skipped ones, to stop after if given.
+
+    Returns
+    -------
+    int
+        Number of the skipped cycles.
+    """
+    stop = stop or threading.Event()
+    skipped = 0
+    running: Optional[futures.Future[object]] = None
+    with futures.ThreadPoolExecutor(1) as executor:
+        scheduled = time.monotonic()
+        n = 0
+        while not stop.is_set() and (max_cycles is None or n < max_cycles):
+            if stop.wait(max(0.0, scheduled + random.uniform(0, jitter) - time.monotonic())):
+                break
+            if running is not None and not running.done():
+                skipped += 1
+                logger.warning("Skipped a cycle since the previous one is still running")
+            else:
+                running = executor.submit(cycle)
+                running.add_done_callback(_log_exception)
+            n += 1
+            scheduled += interval
+            if scheduled < time.monotonic():
+                scheduled = time.monotonic()
+    return skipped
+
+
+def _log_exception(future: futures.Future[object]) -> None:
+    if (e := future.exception()) is not None:
+        logger.error(f"The cycle failed: {e!r}")
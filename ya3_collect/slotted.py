@@ -0,0 +1,21 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+from typing import Any
+
+
+class Slotted:
+    """
+    Base of the frozen dataclasses whose fields are listed in `__slots__`, so that an instance has no `__dict__`.
+
+    `dataclasses.dataclass(slots=True)` needs Python 3.10, so the subclasses list their fields themselves,
+    without defaults. The fields are pickled as a tuple and set back bypassing the frozen `__setattr__`,
+    so that the instances cross the process boundary of the parse workers.
+    """
+    __slots__: tuple[str, ...] = ()
+
+    def __getstate__(self) -> tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state: tuple[Any, ...]) -> None:
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
@@ -0,0 +1,480 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import io
+import os
+import abc
+import gzip
+import time
+import uuid
+import shutil
+import logging
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Iterator, Optional, Sequence, Union
+
+import pandas as pd
+
+from ya3_collect import constants, csvgz, dataframe
+
+
+DATE_FORMAT = constants.DATE_FORMAT
+ITEMS = "items"
+SNAPSHOTS = "snapshots"
+RUNS_SUFFIX = ".runs.jsonl"
+STATE_SUFFIX = ".state.json"
+ROW_GROUP_SIZE = 16384
+
+logger = logging.getLogger(__name__)
+
+
+class Storage(abc.ABC):
+    """
+    Backend storing data files of `frame` under `data_dir`, one per day or per name such as `ITEMS`.
+
+    Parameters
+    ----------
+    data_dir : Path
+        Directory where the data files are saved.
+    frame : type[dataframe.BaseFrame]
+        Type of the dataframes in the data files.
+    """
+    suffix: str
+
+    def __init__(self, data_dir: Path, frame: type[dataframe.BaseFrame] = dataframe.DataFrame) -> None:
+        self.data_dir = Path(data_dir)
+        self.frame = frame
+
+    def path(self, key: Union[date, str]) -> Path:
+        """
+        Path of the data file of `key`, a day or a name.
+        """
+        name = key.strftime(DATE_FORMAT) if isinstance(key, date) else key
+        return (self.data_dir / name).with_suffix(self.suffix)
+
+    def runs_path(self, key: Union[date, str]) -> Path:
+        """
+        Path of the log of the runs written into the data file of `key` with the `delta` encoding.
+        """
+        name = key.strftime(DATE_FORMAT) if isinstance(key, date) else key
+        return self.data_dir / f"{name}{RUNS_SUFFIX}"
+
+    def state_path(self, key: Union[date, str]) -> Path:
+        """
+        Path of the last run written into the data file of `key` with the `delta` encoding.
+        """
+        name = key.strftime(DATE_FORMAT) if isinstance(key, date) else key
+        return self.data_dir / f"{name}{STATE_SUFFIX}"
+
+    def days(self) -> list[date]:
+        """
+        Days which have the data files, in ascending order.
+        """
+        days: list[date] = []
+        for path in self.data_dir.glob(f"*{self.suffix}"):
+            try:
+                days.append(datetime.strptime(path.name[:-len(self.suffix)], DATE_FORMAT).date())
+            except ValueError:
+                continue
+        return sorted(days)
+
+    def exists(self, key: Union[date, str]) -> bool:
+        return self.path(key).exists()
+
+    def read(
+        self,
+        key: Union[date, str],
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> pd.DataFrame:
+        """
+        Read the data of `key`.
+
+        Parameters
+        ----------
+        key : date or str
+            Day or name of the data file.
+        columns : Sequence[str], optional
+            Columns to read. All the columns are read if not given.
+        start : datetime, optional
+            Only the rows at or after `start` are read if given.
+        end : datetime, optional
+            Only the rows before `end` are read if given.
+
+        Returns
+        -------
+        pd.DataFrame
+            Data of the file, which is a `frame` when all the columns are read.
+        """
+        columns = list(columns) if columns is not None else self.frame.COLUMNS
+        read_columns = columns
+        if (start is not None or end is not None) and "datetime" not in columns:
+            read_columns = [*columns, "datetime"]
+        df = self._read(self.path(key), read_columns, start, end)
+        if start is not None:
+            df = df[df["datetime"] >= start]
+        if end is not None:
+            df = df[df["datetime"] < end]
+        df = self.frame.upgrade(df[columns].reset_index(drop=True))
+        if columns == self.frame.COLUMNS:
+            return self.frame(df)
+        return df
+
+    def write(self, df: dataframe.BaseFrame, key: Union[date, str]) -> Path:
+        """
+        Write `df` as the whole data of `key`, replacing the existing data file.
+
+        Returns
+        -------
+        Path
+            Path of the data file.
+        """
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._write(df, path)
+        return path
+
+    def remove(self, key: Union[date, str]) -> bool:
+        """
+        Remove the data file of `key` with its log and its last run.
+
+        Returns
+        -------
+        bool
+            Whether the data file existed.
+        """
+        self.runs_path(key).unlink(missing_ok=True)
+        self.state_path(key).unlink(missing_ok=True)
+        path = self.path(key)
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+        else:
+            return False
+        return True
+
+    def append(self, df: dataframe.BaseFrame, key: Union[date, str]) -> Path:
+        """
+        Append the rows of `df` to the data of `key` without reading or rewriting the existing data.
+
+        Returns
+        -------
+        Path
+            Path of the data file.
+        """
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._append(df, path)
+        return path
+
+    def write_blocks(self, blocks: Sequence[pd.DataFrame], path: Path) -> list[tuple[int, int]]:
+        """
+        Write the blocks of the rows of `frame` into a single file, each of which can be read alone.
+
+        The file is written to a temporary file first and then renamed to `path`.
+
+        Parameters
+        ----------
+        blocks : Sequence[pd.DataFrame]
+            Blocks of rows in the order written.
+        path : Path
+            Path of the file.
+
+        Returns
+        -------
+        list[tuple[int, int]]
+            Location of each block in the file, which is passed to `read_blocks`.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            locations = self._write_blocks([block.astype(self.frame.DTYPES) for block in blocks], tmp)
+            os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return locations
+
+    def read_blocks(
+        self,
+        path: Path,
+        locations: Sequence[tuple[int, int]],
+        columns: Optional[Sequence[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Read the blocks at `locations` of a file written by `write_blocks`.
+
+        Parameters
+        ----------
+        path : Path
+            Path of the file.
+        locations : Sequence[tuple[int, int]]
+            Locations of the blocks returned by `write_blocks`.
+        columns : Sequence[str], optional
+            Columns to read. All the columns are read if not given.
+
+        Returns
+        -------
+        pd.DataFrame
+            Rows of the blocks in the order in the file.
+        """
+        columns = list(columns) if columns is not None else self.frame.COLUMNS
+        dtypes = {column: self.frame.DTYPES[column] for column in columns}
+        if not locations:
+            return pd.DataFrame(columns=columns).astype(dtypes)
+        return self.frame.upgrade(self._read_blocks(path, sorted(set(locations)), columns)).reset_index(drop=True)
+
+    def _read_dtypes(self, columns: Sequence[str]) -> dict[str, str]:
+        # The columns are read in `LEGACY_DTYPES` if any, so that the files written by the older versions are read.
+        return {column: self.frame.LEGACY_DTYPES.get(column, self.frame.DTYPES[column]) for column in columns}
+
+    @abc.abstractmethod
+    def _read(
+        self,
+        path: Path,
+        columns: list[str],
+        start: Optional[datetime],
+        end: Optional[datetime]
+    ) -> pd.DataFrame:
+        pass  # pragma: no cover
+
+    @abc.abstractmethod
+    def _write(self, df: dataframe.BaseFrame, path: Path) -> None:
+        pass  # pragma: no cover
+
+    @abc.abstractmethod
+    def _append(self, df: dataframe.BaseFrame, path: Path) -> None:
+        pass  # pragma: no cover
+
+    @abc.abstractmethod
+    def _write_blocks(self, blocks: list[pd.DataFrame], path: Path) -> list[tuple[int, int]]:
+        pass  # pragma: no cover
+
+    @abc.abstractmethod
+    def _read_blocks(self, path: Path, locations: list[tuple[int, int]], columns: list[str]) -> pd.DataFrame:
+        pass  # pragma: no cover
+
+
+class CsvGzStorage(Storage):
+    """
+    Storage of gzip-compressed CSV files, `YYYY-MM-DD.csv.gz`.
+    """
+    suffix = csvgz.SUFFIX
+
+    def _read(
+        self,
+        path: Path,
+        columns: list[str],
+        start: Optional[datetime],
+        end: Optional[datetime]
+    ) -> pd.DataFrame:
+        dates = [column for column in columns if self.frame.DTYPES[column].startswith("datetime")]
+        dtypes = self._read_dtypes(columns)
+        return pd.read_csv(
+            path,
+            usecols=columns,
+            dtype={column: dtypes[column] for column in columns if column not in dates},
+            parse_dates=dates
+        )
+
+    def _write(self, df: dataframe.BaseFrame, path: Path) -> None:
+        df.to_csv(path, compression="gzip", index=False, date_format=dataframe.DATETIME_FORMAT)
+
+    def _append(self, df: dataframe.BaseFrame, path: Path) -> None:
+        df.append_csv(path)
+
+    def _write_blocks(self, blocks: list[pd.DataFrame], path: Path) -> list[tuple[int, int]]:
+        # The header and each block are gzip members, so that the file is also a data file read by `read`,
+        # and a block is located by the offset and the size of its member.
+        locations: list[tuple[int, int]] = []
+        with open(path, "wb") as f:
+            f.write(gzip.compress((",".join(self.frame.COLUMNS) + "\n").encode()))
+            for block in blocks:
+                offset = f.tell()
+                content = block.to_csv(index=False, header=False, date_format=dataframe.DATETIME_FORMAT)
+                f.write(gzip.compress(content.encode()))
+                locations.append((offset, f.tell() - offset))
+        return locations
+
+    def _read_blocks(self, path: Path, locations: list[tuple[int, int]], columns: list[str]) -> pd.DataFrame:
+        with open(path, "rb") as f:
+            content = b"".join(_read_ranges(f, locations))
+        dates = [column for column in columns if self.frame.DTYPES[column].startswith("datetime")]
+        dtypes = self._read_dtypes(columns)
+        return pd.read_csv(
+            io.BytesIO(gzip.decompress(content)),
+            names=self.frame.COLUMNS,
+            header=None,
+            usecols=columns,
+            dtype={column: dtypes[column] for column in columns if column not in dates},
+            parse_dates=dates
+        )[columns]
+
+
+def _read_ranges(f: Any, locations: list[tuple[int, int]]) -> Iterator[bytes]:
+    # The adjacent ranges are read at once.
+    start, end = locations[0][0], locations[0][0]
+    for offset, size in locations:
+        if offset != end:
+            f.seek(start)
+            yield f.read(end - start)
+            start = offset
+        end = offset + size
+    f.seek(start)
+    yield f.read(end - start)
+
+
+def _import_pyarrow() -> Any:
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:  # pragma: no cover
+        raise ImportError("The parquet format requires pyarrow, install `ya3-collect[parquet]`") from e
+    return pyarrow
+
+
+class ParquetStorage(Storage):
+    """
+    Storage of Parquet datasets, `YYYY-MM-DD.parquet/`, which needs the optional dependency `pyarrow`.
+
+    Each day is a directory of Parquet files and each append adds a file to it, named in the order of the appends.
+    `aID` and `title` are dictionary-encoded, `datetime` is stored as a native timestamp and the counters as int32,
+    with the statistics of every row group, so that only the needed columns and the row groups in the needed
+    time range are read.
+    """
+    suffix = ".parquet"
+
+    def __init__(self, data_dir: Path, frame: type[dataframe.BaseFrame] = dataframe.DataFrame) -> None:
+        super().__init__(data_dir, frame)
+        self._pa = _import_pyarrow()
+
+    def _schema(self, read: bool = False) -> Any:
+        # The schema read is in `LEGACY_DTYPES`, where the newer files are cast from `DTYPES`.
+        pa = self._pa
+        types = {
+            "category": pa.dictionary(pa.int32(), pa.string()),
+            "object": pa.string(),
+            "datetime64[ns]": pa.timestamp("s"),
+            "int32": pa.int32(),
+            "int64": pa.int64(),
+            "bool": pa.bool_(),
+        }
+        dtypes = self._read_dtypes(self.frame.COLUMNS) if read else self.frame.DTYPES
+        return pa.schema([(column, types[dtypes[column]]) for column in self.frame.COLUMNS])
+
+    def _read(
+        self,
+        path: Path,
+        columns: list[str],
+        start: Optional[datetime],
+        end: Optional[datetime]
+    ) -> pd.DataFrame:
+        filters = []
+        if start is not None:
+            filters.append(("datetime", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("datetime", "<", pd.Timestamp(end)))
+        table = self._pa.parquet.read_table(
+            path, columns=columns, filters=filters or None, schema=self._schema(read=True)
+        )
+        df: pd.DataFrame = table.to_pandas()
+        return df
+
+    def _write(self, df: dataframe.BaseFrame, path: Path) -> None:
+        if path.exists():
+            shutil.rmtree(path)
+        self._append(df, path)
+
+    def _table(self, df: pd.DataFrame) -> Any:
+        df = df.astype(self.frame.DTYPES)
+        for column, dtype in self.frame.DTYPES.items():
+            if dtype.startswith("datetime"):
+                df[column] = df[column].dt.floor("s")
+        return self._pa.Table.from_pandas(df, schema=self._schema(), preserve_index=False)
+
+    def _dictionary_columns(self) -> list[str]:
+        return [column for column in ("aID", "title") if column in self.frame.COLUMNS]
+
+    def _append(self, df: dataframe.BaseFrame, path: Path) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+        part = path / f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet"
+        self._pa.parquet.write_table(
+            self._table(df),
+            part,
+            row_group_size=ROW_GROUP_SIZE,
+            use_dictionary=self._dictionary_columns(),
+            write_statistics=True
+        )
+
+    def _write_blocks(self, blocks: list[pd.DataFrame], path: Path) -> list[tuple[int, int]]:
+        # Each block is a row group, located by its index and its number of rows.
+        locations: list[tuple[int, int]] = []
+        with self._pa.parquet.ParquetWriter(
+            path, self._schema(), use_dictionary=self._dictionary_columns(), write_statistics=True
+        ) as writer:
+            for block in blocks:
+                writer.write_table(self._table(block), row_group_size=max(1, len(block)))
+                locations.append((len(locations), len(block)))
+        return locations
+
+    def _read_blocks(self, path: Path, locations: list[tuple[int, int]], columns: list[str]) -> pd.DataFrame:
+        file = self._pa.parquet.ParquetFile(path)
+        table = file.read_row_groups([index for index, _ in locations], columns=columns)
+        df: pd.DataFrame = table.to_pandas()
+        return df
+
+
+FORMATS: dict[str, type[Storage]] = {
+    "csv.gz": CsvGzStorage,
+    "parquet": ParquetStorage,
+}
+
+
+def get_storage(format: str, data_dir: Path, frame: type[dataframe.BaseFrame] = dataframe.DataFrame) -> Storage:
+    """
+    Get the storage of `format`.
+
+    Parameters
+    ----------
+    format : str
+        One of `FORMATS`.
+    data_dir : Path
+        Directory where the data files are saved.
+    frame : type[dataframe.BaseFrame]
+        Type of the dataframes in the data files.
+
+    Returns
+    -------
+    Storage
+        Storage of the format.
+    """
+    return FORMATS[format](data_dir, frame)
+
+
+def convert(src: Storage, dst: Storage, days: Optional[Sequence[date]] = None) -> list[Path]:
+    """
+    Convert the data files of `src` into the format of `dst`.
+
+    Parameters
+    ----------
+    src : Storage
+        Storage to convert from.
+    dst : Storage
+        Storage to convert to.
+    days : Sequence[date], optional
+        Days to convert. All the days of `src` and `ITEMS` are converted if not given.
+
+    Returns
+    -------
+    list[Path]
+        Paths of the converted data files.
+    """
+    keys: list[Union[date, str]] = list(days if days is not None else src.days())
+    if days is None and src.exists(ITEMS):
+        keys.append(ITEMS)
+    paths: list[Path] = []
+    for key in keys:
+        paths.append(dst.write(src.frame(src.read(key)), key))
+        logger.info(f"Converted {src.path(key).as_posix()} into {paths[-1].as_posix()}")
+    return paths
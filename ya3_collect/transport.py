@@ -0,0 +1,441 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import copy
+import time
+import random
+import asyncio
+import logging
+import threading
+from types import TracebackType, ModuleType
+from typing import Optional, Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InvalidHeader
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+from ya3_collect import concurrency, constants, httpcache, metrics
+
+
+DEFAULT_POOL_SIZE = constants.DEFAULT_POOL_SIZE
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+logger = logging.getLogger(__name__)
+
+
+class _JitteredRetry(Retry):
+    # The failures are reported to the controller before they are retried.
+    controller: Optional[concurrency.AIMDController] = None
+
+    def new(self, **kw: Any) -> _JitteredRetry:
+        retry: _JitteredRetry = super().new(**kw)
+        retry.controller = self.controller
+        return retry
+
+    def increment(self, *args: Any, **kwargs: Any) -> _JitteredRetry:
+        response = kwargs.get("response")
+        error = kwargs.get("error")
+        if self.controller is not None:
+            if response is not None and response.status in RETRY_STATUSES:
+                self.controller.throttle(f"status {response.status}")
+                if (seconds := _parse_retry_after(response.headers.get("Retry-After"))) is not None:
+                    self.controller.pause(seconds)
+            elif error is not None:
+                self.controller.throttle(type(error).__name__)
+        retry: _JitteredRetry = super().increment(*args, **kwargs)
+        return retry
+
+    def get_backoff_time(self) -> float:
+        backoff: float = super().get_backoff_time()
+        return random.uniform(0, backoff)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        seconds: float = Retry().parse_retry_after(value)
+    except InvalidHeader:
+        return None
+    return seconds
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Whether a request failed with `error` may succeed if it is sent again later.
+    """
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUSES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Seconds to wait before sending again a request failed with `error`, asked by its `Retry-After` if any.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    return _parse_retry_after(response.headers.get("Retry-After"))
+
+
+class TokenBucket:
+    """
+    Rate limit of the requests, which allows `rate` requests per second on average and bursts of `burst` requests.
+
+    A request reserves a token and waits until the token would have been refilled,
+    so that the requests waiting for the limit are sent in the order of their arrival.
+    It is shared by any number of threads and transports.
+
+    Parameters
+    ----------
+    rate : float
+        Number of the tokens refilled per second.
+    burst : int
+        Number of the tokens held at most.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"invalid rate limit: rate={rate}, burst={burst}")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token, returning the seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            metrics.inc("rate_limit_wait_seconds_total", wait)
+        return wait
+
+    def acquire(self) -> None:
+        """
+        Take a token, blocking until the request can be sent.
+        """
+        if (wait := self.reserve()) > 0:
+            time.sleep(wait)
+
+
+class Transport:
+    """
+    HTTP transport shared by all the requests to Yahoo! Auctions.
+
+    The connections are kept alive in a pool of `pool_size` connections,
+    and GET requests failed with a transient error are retried with jittered exponential backoff.
+    The requests are sent within `rate_limiter` if given, while their retries are not limited.
+    The number of the in-flight requests is adjusted by `controller` if given, which is told of
+    every throttled or failed attempt before it is retried.
+    The responses are compressed with any encoding urllib3 decodes, which includes `br` if `brotli` is installed.
+    With `cache`, a URL cached before is requested with its validators and its cached body is returned on 304.
+    The responses are cached apart by `account`, the identity of the cookies.
+
+    Parameters
+    ----------
+    cookies : dict[str, str]
+        Cookies sent with every request.
+    pool_size : int
+        Number of connections kept alive, which is also the number of the concurrent requests.
+    retries : int
+        Number of the retries of a request.
+    backoff_factor : float
+        Base of the backoff between the retries in seconds.
+    connect_timeout : float
+        Timeout to connect to the server in seconds.
+    read_timeout : float
+        Timeout to read a response in seconds.
+    rate_limiter : TokenBucket, optional
+        Rate limit of the requests.
+    controller : concurrency.AIMDController, optional
+        Controller of the number of the in-flight requests, whose maximum should not exceed `pool_size`.
+    cache : httpcache.HTTPCache, optional
+        Cache of the responses, which is kept open by the caller.
+    """
+
+    def __init__(
+        self,
+        cookies: dict[str, str],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        connect_timeout: float = 10,
+        read_timeout: float = 60,
+        rate_limiter: Optional[TokenBucket] = None,
+        controller: Optional[concurrency.AIMDController] = None,
+        cache: Optional[httpcache.HTTPCache] = None
+    ) -> None:
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.controller = controller
+        self.cache = cache
+        self.account = httpcache.account(cookies)
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        self.session.cookies.update(cookies)
+        self._shared = False
+        max_retries = _JitteredRetry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+        )
+        max_retries.controller = controller
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+    def __enter__(self) -> Transport:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        self.close()
+
+    def get(self, url: str) -> requests.Response:
+        """
+        Send a GET request.
+
+        Parameters
+        ----------
+        url : str
+            URL to request.
+
+        Returns
+        -------
+        requests.Response
+            Response of the request, whose content is the cached body if it is 304 to a conditional request.
+
+        Raises
+        ------
+        requests.HTTPError
+            Raises when the response has an error status after all the retries.
+        """
+        entry = self.cache.lookup(url, self.account) if self.cache is not None else None
+        response = self._send(url, entry.validators() if entry is not None else {})
+        if self.cache is None:
+            return response
+        if response.status_code == 304 and entry is not None:
+            if (content := self.cache.body(entry)) is None:  # evicted since the lookup
+                return self._send(url, {})
+            response._content = content
+            metrics.inc("http_cache_total", result="hit")
+            metrics.inc("http_cache_saved_bytes_total", len(content))
+            return response
+        metrics.inc("http_cache_total", result="miss")
+        self.cache.put(
+            url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"), self.account
+        )
+        return response
+
+    def _send(self, url: str, headers: dict[str, str]) -> requests.Response:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        if self.controller is None:
+            response: requests.Response = self.session.get(url, headers=headers, timeout=self.timeout)
+        else:
+            response = self._get_controlled(url, headers, self.controller)
+        metrics.inc("http_responses_total", status=str(response.status_code))
+        metrics.inc("downloaded_bytes_total", len(response.content))
+        response.raise_for_status()
+        return response
+
+    def _get_controlled(
+        self,
+        url: str,
+        headers: dict[str, str],
+        controller: concurrency.AIMDController
+    ) -> requests.Response:
+        controller.acquire()
+        latency: Optional[float] = None
+        try:
+            start = time.perf_counter()
+            response: requests.Response = self.session.get(url, headers=headers, timeout=self.timeout)
+            retries = getattr(response.raw, "retries", None)
+            if response.ok and not (retries is not None and retries.history):
+                latency = time.perf_counter() - start
+            return response
+        finally:
+            controller.release(latency)
+
+    def with_cookies(self, cookies: dict[str, str]) -> Transport:
+        """
+        Transport sending the requests with `cookies` instead, over the connection pool and within the rate limit
+        of this transport.
+
+        The cookies set by the responses are kept apart from this transport, and so are the cached responses.
+        Closing the returned transport leaves the connection pool open, which is closed with this transport.
+
+        Parameters
+        ----------
+        cookies : dict[str, str]
+            Cookies sent with every request.
+
+        Returns
+        -------
+        Transport
+            Transport sharing the connection pool.
+        """
+        other = copy.copy(self)
+        other.account = httpcache.account(cookies)
+        other.session = requests.Session()
+        other.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        other.session.cookies.update(cookies)
+        other.session.mount("https://", self._adapter)
+        other.session.mount("http://", self._adapter)
+        other._shared = True
+        return other
+
+    def close(self) -> None:
+        if not self._shared:
+            self.session.close()
+
+
+def _import_aiohttp() -> ModuleType:
+    try:
+        import aiohttp
+    except ImportError as e:  # pragma: no cover
+        raise ImportError("The async engine requires aiohttp, install `ya3-collect[async]`") from e
+    return aiohttp
+
+
+class AsyncTransport:
+    """
+    HTTP transport for the asyncio engine, which needs the optional dependency `aiohttp`.
+
+    At most `pool_size` requests are in flight at once, and at most `pool_size_per_host` to each host.
+    GET requests failed with a transient error are retried with jittered exponential backoff as `Transport`.
+    The session is opened when the transport is entered with `async with`.
+    The pages are not cached, as the requests are sent without validators.
+
+    Parameters
+    ----------
+    cookies : dict[str, str]
+        Cookies sent with every request.
+    pool_size : int
+        Number of the concurrent requests.
+    pool_size_per_host : int
+        Number of the concurrent requests to the same host. No limit if 0.
+    retries : int
+        Number of the retries of a request.
+    backoff_factor : float
+        Base of the backoff between the retries in seconds.
+    connect_timeout : float
+        Timeout to connect to the server in seconds.
+    read_timeout : float
+        Timeout to read a response in seconds.
+    rate_limiter : TokenBucket, optional
+        Rate limit of the requests, including the retries.
+    """
+
+    def __init__(
+        self,
+        cookies: dict[str, str],
+        pool_size: int = 100,
+        pool_size_per_host: int = 0,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        connect_timeout: float = 10,
+        read_timeout: float = 60,
+        rate_limiter: Optional[TokenBucket] = None
+    ) -> None:
+        self.cookies = cookies
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.rate_limiter = rate_limiter
+        self._aiohttp = _import_aiohttp()
+        self._session: Any = None
+        self._semaphore: Optional[asyncio.BoundedSemaphore] = None
+
+    async def __aenter__(self) -> AsyncTransport:
+        aiohttp = self._aiohttp
+        self._semaphore = asyncio.BoundedSemaphore(self.pool_size)
+        self._session = aiohttp.ClientSession(
+            cookies=self.cookies,
+            connector=aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size_per_host),
+            timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+        )
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        await self._session.close()
+
+    def is_transient(self, error: BaseException) -> bool:
+        """
+        Whether a request failed with `error` may succeed if it is sent again later, as `is_transient`.
+        """
+        if isinstance(error, self._aiohttp.ClientResponseError):
+            return error.status in RETRY_STATUSES
+        return isinstance(error, (self._aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+    def retry_after(self, error: BaseException) -> Optional[float]:
+        """
+        Seconds to wait before sending again a request failed with `error`, as `retry_after`.
+        """
+        headers = getattr(error, "headers", None)
+        if headers is None:
+            return None
+        return _parse_retry_after(headers.get("Retry-After"))
+
+    async def get(self, url: str) -> bytes:
+        """
+        Send a GET request.
+
+        Parameters
+        ----------
+        url : str
+            URL to request.
+
+        Returns
+        -------
+        bytes
+            Body of the response.
+
+        Raises
+        ------
+        aiohttp.ClientError
+            Raises when the request fails after all the retries.
+        """
+        if self._session is None or self._semaphore is None:
+            raise RuntimeError("AsyncTransport should be entered before sending requests")
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None and (wait := self.rate_limiter.reserve()) > 0:
+                await asyncio.sleep(wait)
+            async with self._semaphore:
+                try:
+                    async with self._session.get(url) as response:
+                        metrics.inc("http_responses_total", status=str(response.status))
+                        if response.status not in RETRY_STATUSES or attempt >= self.retries:
+                            response.raise_for_status()
+                            content: bytes = await response.read()
+                            metrics.inc("downloaded_bytes_total", len(content))
+                            return content
+                except (self._aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt >= self.retries:
+                        raise
+            await asyncio.sleep(random.uniform(0, self.backoff_factor * 2 ** attempt))
+            attempt += 1
@@ -0,0 +1,335 @@
+# Copyright (c) 2022 Shuhei Nitta. All rights reserved.
+from __future__ import annotations
+import json
+import time
+import sqlite3
+import logging
+import itertools
+import dataclasses
+import concurrent.futures as cf
+from datetime import datetime
+from pathlib import Path
+from types import TracebackType
+from typing import Iterable, Optional
+
+from ya3_collect import constants, metrics, transport, yahoo_auction
+from ya3_collect.yahoo_auction import SellingItemInfo
+
+
+QUEUE = constants.QUEUE
+DEFAULT_LEASE = 300.0  # seconds
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 10.0  # seconds, before a released task is claimed again
+STATES = ("queued", "leased", "done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    seller TEXT NOT NULL,
+    data_dir TEXT NOT NULL,
+    started TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    encoding TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    run INTEGER NOT NULL REFERENCES runs(id),
+    url TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    visible_at REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    info TEXT,
+    fast INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    UNIQUE (run, url)
+);
+CREATE INDEX IF NOT EXISTS tasks_visible ON tasks (visible_at) WHERE state IN ('queued', 'leased');
+"""
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class Run:
+    """
+    Collection of the items of a seller, merged into one write once all its tasks are finished.
+
+    Parameters
+    ----------
+    id : int
+        ID of the run in the queue.
+    seller : str
+        Name of the seller, which is empty for the seller of `cookies.json`.
+    data_dir : Path
+        Directory where the items of the run are saved.
+    started : datetime
+        Start time of the run, which is the time of the snapshots of the items.
+    layout : str
+        Layout the items are saved in, one of `constants.LAYOUTS`.
+    encoding : str
+        Encoding of the snapshots of the items, one of `constants.ENCODINGS`.
+    """
+    id: int
+    seller: str
+    data_dir: Path
+    started: datetime
+    layout: str = "wide"
+    encoding: str = "dense"
+
+
+@dataclasses.dataclass
+class Task:
+    """
+    Item page to fetch, leased to a worker until it is finished or its lease expires.
+    `layout` is the layout of its run.
+    """
+    id: int
+    run: int
+    seller: str
+    url: str
+    attempts: int
+    layout: str
+
+
+class WorkQueue:
+    """
+    Durable queue of the item pages to fetch, shared by a coordinator and any number of worker processes.
+
+    The queue is a SQLite database in WAL mode, so that the workers on the same host, or on hosts sharing
+    a filesystem with working locks, claim the tasks concurrently. A claimed task is leased to its worker and
+    hidden from the others until the lease expires, when it is claimed again as the worker is presumed dead.
+    A task is failed once it has been claimed `max_attempts` times.
+
+    Parameters
+    ----------
+    path : Path
+        Path of the database, which is created if missing.
+    timeout : float
+        Seconds to wait for the lock of the database held by another process.
+    max_attempts : int
+        Number of the times a task is claimed at most.
+    """
+
+    def __init__(self, path: Path, timeout: float = 30, max_attempts: int = MAX_ATTEMPTS) -> None:
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts should be positive, got {max_attempts}")
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=timeout, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self) -> WorkQueue:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType]
+    ) -> None:
+        self.close()
+
+    def start(
+        self,
+        seller: str,
+        data_dir: Path,
+        started: datetime,
+        layout: str = "wide",
+        encoding: str = "dense"
+    ) -> Run:
+        """
+        New run of `seller` started at `started`, whose items are saved in `layout` and `encoding`.
+        """
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            cursor = self._conn.execute(
+                "INSERT INTO runs (seller, data_dir, started, layout, encoding) VALUES (?, ?, ?, ?, ?)",
+                (seller, Path(data_dir).as_posix(), started.isoformat(), layout, encoding)
+            )
+            return Run(int(cursor.lastrowid or 0), seller, Path(data_dir), started, layout, encoding)
+
+    def runs(self) -> list[Run]:
+        """
+        Unfinished runs, the oldest first.
+        """
+        rows = self._conn.execute("SELECT id, seller, data_dir, started, layout, encoding FROM runs ORDER BY id")
+        return [_run(row) for row in rows]
+
+    def put(self, run: Run, urls: Iterable[str]) -> int:
+        """
+        Add the item pages at `urls` to `run`, ignoring those already in it. Returns the number of the new tasks.
+        """
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO tasks (run, url) VALUES (?, ?)", ((run.id, url) for url in urls)
+            )
+            return cursor.rowcount
+
+    def claim(self, worker: str, size: int, lease: float = DEFAULT_LEASE) -> list[Task]:
+        """
+        Lease at most `size` visible tasks to `worker` for `lease` seconds, the oldest first.
+        """
+        now = time.time()
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "UPDATE tasks SET state = 'failed', error = 'lease expired' "
+                "WHERE state = 'leased' AND visible_at <= ? AND attempts >= ?",
+                (now, self.max_attempts)
+            )
+            rows = self._conn.execute(
+                "SELECT tasks.id, run, seller, url, attempts, layout FROM tasks JOIN runs ON runs.id = tasks.run "
+                "WHERE state IN ('queued', 'leased') AND visible_at <= ? ORDER BY tasks.id LIMIT ?",
+                (now, size)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE tasks SET state = 'leased', visible_at = ?, attempts = attempts + 1, worker = ? WHERE id = ?",
+                ((now + lease, worker, row[0]) for row in rows)
+            )
+        return [
+            Task(id, run, seller, url, attempts + 1, layout) for id, run, seller, url, attempts, layout in rows
+        ]
+
+    def complete(self, results: dict[int, SellingItemInfo], fast: bool = False) -> None:
+        """
+        Finish the tasks with the information of their items by the IDs of the tasks,
+        which has only `yahoo_auction.FAST_FIELDS` if `fast`.
+        """
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "UPDATE tasks SET state = 'done', info = ?, fast = ?, error = NULL WHERE id = ? AND state != 'done'",
+                ((json.dumps(info.to_dict(), ensure_ascii=False), fast, id) for id, info in results.items())
+            )
+
+    def release(self, tasks: Iterable[Task], error: str, delay: float = RETRY_DELAY) -> None:
+        """
+        Give back the tasks failed with `error` to be claimed again after `delay` seconds,
+        or fail those claimed `max_attempts` times.
+        """
+        now = time.time()
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "visible_at = ?, error = ? WHERE id = ? AND state = 'leased'",
+                ((self.max_attempts, now + delay, error, task.id) for task in tasks)
+            )
+
+    def progress(self, run: Run) -> dict[str, int]:
+        """
+        Number of the tasks of `run` by their states, one of `STATES`.
+        """
+        rows = self._conn.execute("SELECT state, COUNT(*) FROM tasks WHERE run = ? GROUP BY state", (run.id,))
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(dict(rows.fetchall()))
+        return counts
+
+    def results(self, run: Run, fast: Optional[bool] = None) -> list[SellingItemInfo]:
+        """
+        Information of the items of the finished tasks of `run`, only of those finished by `complete`
+        with `fast` if given.
+        """
+        rows = self._conn.execute(
+            "SELECT info FROM tasks WHERE run = ? AND state = 'done' AND fast IN (?, ?) ORDER BY id",
+            (run.id, *((fast, fast) if fast is not None else (False, True)))
+        )
+        return [SellingItemInfo.from_dict(json.loads(info)) for info, in rows]
+
+    def finish(self, run: Run) -> None:
+        """
+        Remove `run` and its tasks once its items are saved.
+        """
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM tasks WHERE run = ?", (run.id,))
+            self._conn.execute("DELETE FROM runs WHERE id = ?", (run.id,))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def work(
+    queue: WorkQueue,
+    tasks: list[Task],
+    accounts: dict[str, dict[str, str]],
+    client: transport.Transport,
+    parser: Optional[cf.Executor] = None,
+    fast: bool = False,
+    validate: float = 0.0
+) -> int:
+    """
+    Fetch and parse the item pages of the tasks claimed from `queue`, and finish them with their items.
+
+    The pages of each seller are fetched by `yahoo_auction.iter_infos` with the cookies of the seller over the
+    connection pool of `client`. The tasks whose items are not found are given back to be claimed again.
+
+    Parameters
+    ----------
+    queue : WorkQueue
+        Queue where the tasks are claimed.
+    tasks : list[Task]
+        Tasks claimed by this worker.
+    accounts : dict[str, dict[str, str]]
+        Cookies of each seller by the name of the seller.
+    client : transport.Transport
+        Transport whose connection pool and rate limit are shared by the sellers.
+    parser : concurrent.futures.Executor, optional
+        Executor parsing the item pages, or the pages are parsed in this process.
+    fast : bool
+        Whether to extract only `FAST_FIELDS`, as in `yahoo_auction.iter_infos`.
+        The tasks are then completed as `fast`, so that only the counters of their items are saved.
+        The tasks of the runs in a layout other than `constants.FAST_PARSE_LAYOUTS` are parsed in full anyway.
+    validate : float
+        Ratio of the pages extracted by `fast` which are also parsed in full to compare,
+        as in `yahoo_auction.iter_infos`.
+
+    Returns
+    -------
+    int
+        Number of the finished tasks.
+    """
+    def key(task: Task) -> tuple[str, bool]:
+        return task.seller, fast and task.layout in constants.FAST_PARSE_LAYOUTS
+
+    if fast and (n_full := sum(task.layout not in constants.FAST_PARSE_LAYOUTS for task in tasks)):
+        logger.warning(f"{n_full} item pages are parsed in full, as their runs save the fields left out by fast")
+    results: dict[bool, dict[int, SellingItemInfo]] = {False: {}, True: {}}
+    missing: list[Task] = []
+    for (seller, task_fast), group in itertools.groupby(sorted(tasks, key=key), key):
+        by_aID = {yahoo_auction.get_aID_from_url(task.url): task for task in group}
+        if (cookies := accounts.get(seller)) is None:
+            logger.error(f"No cookies of the seller {seller!r} are given for {len(by_aID)} item pages")
+            queue.release(by_aID.values(), f"no cookies of the seller {seller!r}")
+            continue
+        with client.with_cookies(cookies) as seller_client:
+            for info in yahoo_auction.iter_infos(
+                cookies,
+                client=seller_client,
+                parser=parser,
+                fast=task_fast,
+                validate=validate,
+                urls=[task.url for task in by_aID.values()]
+            ):
+                if (task := by_aID.pop(info.aID, None)) is not None:
+                    results[task_fast][task.id] = info
+        missing.extend(by_aID.values())
+    for task_fast, task_results in results.items():
+        queue.complete(task_results, task_fast)
+    count = sum(len(task_results) for task_results in results.values())
+    metrics.inc("tasks_total", count, result="done")
+    if missing:
+        queue.release(missing, "failed to fetch or parse")
+        metrics.inc("tasks_total", len(missing), result="released")
+        logger.warning(f"{len(missing)} item pages are given back to the queue")
+    return count
+
+
+def _run(row: tuple[int, str, str, str, str, str]) -> Run:
+    id, seller, data_dir, started, layout, encoding = row
+    return Run(id, seller, Path(data_dir), datetime.fromisoformat(started), layout, encoding)
@@ -1,22 +1,50 @@
 # Copyright (c) 2022 Shuhei Nitta. All rights reserved.
 from __future__ import annotations
 import re
+import html
+import time
+import heapq
+import random
+import asyncio
+import queue
 import logging
+import contextlib
 import dataclasses
 import concurrent.futures as cf
 from datetime import datetime
-from typing import Pattern, Callable, Any
+from typing import Pattern, Callable, Any, Optional, Iterable, Iterator, AsyncIterator, Coroutine, TYPE_CHECKING
+from urllib import parse
 
 import bs4
-import requests
 
+from ya3_collect import archive, metrics, slotted, transport
+
+if TYPE_CHECKING:
+    from ya3_collect import journal
+
+
+SELLING_URL = "https://auctions.yahoo.co.jp/openuser/jp/show/mystatus?select=selling"
+ITEM_LINK_PATTERN: Pattern[str] = re.compile(r"^rsec:itm;slk:tc;")
+TOTAL_COUNT_PATTERN: Pattern[str] = re.compile(r"全\s*([\d,]+)\s*件")
+TIMELEFT_PATTERN: Pattern[str] = re.compile(r"(\d+)\s*(日|時間|分|秒)")
+TIMELEFT_UNITS = {"日": 86400, "時間": 3600, "分": 60, "秒": 1}
+PRICE_PATTERN: Pattern[str] = re.compile(r"(\d[\d,]*)\s*円")
+REQUEUE_BACKOFF = 1.0  # seconds, the base of the delay of a requeued item page
+PARSER_VERSION = 3  # bumped when the parsed fields change, so that the parses cached before are not reused
 
 Tags = list[bs4.element.Tag]
 logger = logging.getLogger(__name__)
 
 
-@dataclasses.dataclass
-class SellingItemInfo:
+@dataclasses.dataclass(frozen=True)
+class SellingItemInfo(slotted.Slotted):
+    """
+    Information of a selling item parsed from its page, whose `startprice` is in yen and `timeleft` in seconds.
+    """
+    __slots__ = (
+        "aID", "title", "seller_name", "stock", "start_datetime", "end_datetime", "refundable", "startprice",
+        "timeleft", "count_bid", "count_access", "count_watch"
+    )
     aID: str
     title: str
     seller_name: str
@@ -24,61 +52,137 @@ class SellingItemInfo:
     start_datetime: datetime
     end_datetime: datetime
     refundable: bool
-    startprice: str
-    timeleft: str
+    startprice: int
+    timeleft: int
     count_bid: int
     count_access: int
     count_watch: int
 
     @staticmethod
     def from_soup(soup: bs4.BeautifulSoup) -> SellingItemInfo:
-        return SellingItemInfo(
-            aID=_get_aID(soup),
-            title=_get_title(soup),
-            seller_name=_get_seller_name(soup),
-            stock=_get_stock(soup),
-            start_datetime=_get_start_datetime(soup),
-            end_datetime=_get_end_datetime(soup),
-            refundable=_get_refundable(soup),
-            startprice=_get_startprice(soup),
-            timeleft=_get_timeleft(soup),
-            count_bid=_get_count_bid(soup),
-            count_access=_get_count_access(soup),
-            count_watch=_get_count_watch(soup),
-        )
-
-
-def _get_aID(soup: bs4.BeautifulSoup) -> str:
-    tags: Tags = list(soup.find_all("dt", text="オークションID"))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        tag = tags[0].find_next_sibling("dd", attrs={"class": "ProductDetail__description"})
-        if isinstance(tag, bs4.element.Tag):
-            return str(tag.text[1:])
-    return ""  # pragma: no cover
-
-
-def _get_title(soup: bs4.BeautifulSoup) -> str:
-    tags: Tags = list(soup.find_all("h1", attrs={"class": "ProductTitle__text"}))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        return str(tags[0].text)
-    return ""  # pragma: no cover
+        return SellingItemInfo(**_get_fields(soup))
 
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Fields of the item serializable to JSON, with the datetimes in ISO format.
+        """
+        return {
+            name: value.isoformat() if isinstance(value, datetime) else value
+            for name, value in dataclasses.asdict(self).items()
+        }
 
-def _get_seller_name(soup: bs4.BeautifulSoup) -> str:
-    pattern: Pattern[str] = re.compile(r"^rsec:seller;slk:slfinfo;")
-    tags: Tags = list(soup.find_all("a", attrs={"data-ylk": pattern}))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        return str(tags[0].text)
-    return ""  # pragma: no cover
+    @staticmethod
+    def from_dict(fields: dict[str, Any]) -> SellingItemInfo:
+        """
+        Item of the fields returned by `to_dict`, whose `startprice` may be the text saved by the older versions.
+        """
+        values: dict[str, Any] = {
+            name: datetime.fromisoformat(fields[name]) if name in _DATETIME_FIELDS else fields[name]
+            for name in _FIELD_NAMES
+        }
+        if isinstance(values["startprice"], str):
+            values["startprice"] = _parse_price(values["startprice"])
+        return SellingItemInfo(**values)
+
+
+_FIELD_NAMES = [field.name for field in dataclasses.fields(SellingItemInfo)]
+_DATETIME_FIELDS = {field.name for field in dataclasses.fields(SellingItemInfo) if field.type == "datetime"}
+
+
+def parse_item_page(content: bytes, fast: bool = False) -> SellingItemInfo:
+    """
+    Parse the raw content of an item page.
+
+    Parameters
+    ----------
+    content : bytes
+        Body of the response of an item page.
+    fast : bool
+        Whether to extract only `FAST_FIELDS` by `extract_counts`, falling back to the full parse if it fails.
+
+    Returns
+    -------
+    SellingItemInfo
+        Information extracted from the page.
+    """
+    return _parse_item_page_timed(content, fast).info
+
+
+def extract_counts(content: bytes) -> Optional[SellingItemInfo]:
+    """
+    Extract `FAST_FIELDS` straight from the raw content of an item page by regular expressions, without a DOM.
+
+    The other fields are left as the defaults of a missing field of `SellingItemInfo.from_soup`.
+
+    Parameters
+    ----------
+    content : bytes
+        Body of the response of an item page.
+
+    Returns
+    -------
+    SellingItemInfo, optional
+        Information extracted from the page, or None if any of `FAST_FIELDS` is not found.
+    """
+    fields = {spec.name: spec.default for spec in _FIELD_SPECS}
+    for name, pattern in _FAST_PATTERNS.items():
+        match = pattern.search(content)
+        if match is None:
+            return None
+        value = html.unescape(match.group(1).decode("utf-8", "replace"))
+        fields[name] = int(value) if name.startswith("count_") else value
+    return SellingItemInfo(**fields)
 
 
-def _get_stock(soup: bs4.BeautifulSoup) -> int:
-    tags: Tags = list(soup.find_all("dt", text="個数"))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        tag = tags[0].find_next_sibling("dd", attrs={"class": "ProductDetail__description"})
-        if isinstance(tag, bs4.element.Tag):
-            return int(tag.text[1:])
-    return 0  # pragma: no cover
+@dataclasses.dataclass
+class _Parsed:
+    """
+    Result of the parse of an item page, returned from a worker process whose metrics and logs are lost.
+
+    `path` is `full` for the full parse, `fast` for `extract_counts`, `fallback` for the full parse after
+    `extract_counts` failed, and `validated` for the full parse compared with `extract_counts`,
+    whose disagreements are in `mismatches`.
+    """
+    info: SellingItemInfo
+    elapsed: float
+    path: str = "full"
+    mismatches: list[str] = dataclasses.field(default_factory=list)
+
+
+def _parse_item_page_timed(content: bytes, fast: bool = False, validate: float = 0.0) -> _Parsed:
+    start = time.perf_counter()
+    path = "full"
+    extracted = extract_counts(content) if fast else None
+    if fast and extracted is None:
+        path = "fallback"
+    elif extracted is not None and random.random() < validate:
+        path = "validated"
+    elif extracted is not None:
+        elapsed = time.perf_counter() - start
+        logger.debug(f"extracted {extracted.aID}: {elapsed:.5g} [sec]")
+        return _Parsed(extracted, elapsed, "fast")
+    info = SellingItemInfo.from_soup(bs4.BeautifulSoup(content, "lxml"))
+    elapsed = time.perf_counter() - start
+    logger.debug(f"parsed {info.aID or 'unknown item'}: {elapsed:.5g} [sec]")
+    mismatches = [
+        f"{name}: {getattr(extracted, name)!r} != {getattr(info, name)!r}"
+        for name in FAST_FIELDS if getattr(extracted, name) != getattr(info, name)
+    ] if path == "validated" else []
+    return _Parsed(info, elapsed, path, mismatches)
+
+
+def _observe_parse(parsed: _Parsed) -> SellingItemInfo:
+    metrics.observe("parse_seconds", parsed.elapsed)
+    if parsed.path != "full":
+        metrics.inc("fast_parse_total", path=parsed.path)
+    if parsed.path == "fallback":
+        logger.debug(f"Fell back to the full parse of {parsed.info.aID or 'unknown item'}")
+    if parsed.mismatches:
+        metrics.inc("fast_parse_mismatches_total")
+        logger.warning(
+            f"Fast parse of {parsed.info.aID} disagrees with the full parse: {', '.join(parsed.mismatches)}"
+        )
+    return parsed.info
 
 
 def _from_yahoo_datetime(datetimestr: str) -> datetime:
@@ -90,91 +194,127 @@ def _from_yahoo_datetime(datetimestr: str) -> datetime:
     return datetime(year, month, day, hour, minute)
 
 
-def _get_start_datetime(soup: bs4.BeautifulSoup) -> datetime:
-    tags: Tags = list(soup.find_all("dt", text="開始日時"))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        tag = tags[0].find_next_sibling("dd", attrs={"class": "ProductDetail__description"})
-        if isinstance(tag, bs4.element.Tag):
-            return _from_yahoo_datetime(tag.text[1:])
-    return datetime(2000, 1, 1)  # pragma: no cover
+def _parse_timeleft(text: str) -> int:
+    # "19時間" or "3日" in seconds, and 0 once the auction is over.
+    return sum(int(number) * TIMELEFT_UNITS[unit] for number, unit in TIMELEFT_PATTERN.findall(text))
+
+
+def _parse_price(text: str) -> int:
+    # "10,000 円（税 0 円）" in yen, the first price of the text, and 0 if none.
+    if match := PRICE_PATTERN.search(text):
+        return int(match.group(1).replace(",", ""))
+    return 0
+
+
+@dataclasses.dataclass(frozen=True)
+class _FieldSpec:
+    """
+    Where one field of `SellingItemInfo` is found on an item page.
+
+    The field is read from the first `tag` whose term is `term`. The term of a `dt` is its text,
+    the terms of other tags are their classes, and the terms of an `a` are the terms of the `a` fields
+    its `data-ylk` starts with.
+    When `sibling` is given, the value is the text of the next sibling of the tag with that class,
+    otherwise it is the text of the tag itself.
+    """
+    name: str
+    tag: str
+    term: str
+    sibling: str
+    convert: Callable[[str], Any]
+    default: Any
+
+
+_FIELD_SPECS: tuple[_FieldSpec, ...] = (
+    _FieldSpec("aID", "dt", "オークションID", "ProductDetail__description", lambda s: s[1:], ""),
+    _FieldSpec("title", "h1", "ProductTitle__text", "", str, ""),
+    _FieldSpec("seller_name", "a", "rsec:seller;slk:slfinfo;", "", str, ""),
+    _FieldSpec("stock", "dt", "個数", "ProductDetail__description", lambda s: int(s[1:]), 0),
+    _FieldSpec(
+        "start_datetime", "dt", "開始日時", "ProductDetail__description",
+        lambda s: _from_yahoo_datetime(s[1:]), datetime(2000, 1, 1)
+    ),
+    _FieldSpec(
+        "end_datetime", "dt", "終了日時", "ProductDetail__description",
+        lambda s: _from_yahoo_datetime(s[1:]), datetime(2000, 1, 1)
+    ),
+    _FieldSpec("refundable", "dt", "返品", "ProductDetail__description", lambda s: s[1:] != "返品不可", False),
+    _FieldSpec("startprice", "dt", "開始価格", "ProductDetail__description", _parse_price, 0),
+    _FieldSpec("timeleft", "dt", "残り時間", "Count__number", lambda s: _parse_timeleft(s.splitlines()[0]), 0),
+    _FieldSpec("count_bid", "dt", "入札件数", "Count__number", lambda s: int(s[:-4]), 0),
+    _FieldSpec("count_access", "span", "StatisticsInfo__term--access", "StatisticsInfo__data", int, 0),
+    _FieldSpec("count_watch", "span", "StatisticsInfo__term--watch", "StatisticsInfo__data", int, 0),
+)
+_FIELD_SPECS_BY_TERM: dict[tuple[str, str], _FieldSpec] = {(spec.tag, spec.term): spec for spec in _FIELD_SPECS}
+_TERM_TAGS: list[str] = sorted({spec.tag for spec in _FIELD_SPECS})
+_SIBLING_TAGS: dict[str, str] = {"dt": "dd", "span": "span"}
+_YLK_TERMS: tuple[str, ...] = tuple(spec.term for spec in _FIELD_SPECS if spec.tag == "a")
+# Patterns of the fields which change between the runs, matched against the raw bytes of an item page.
+# Each group is the text of the tag the corresponding `_FieldSpec` reads, so that a page laid out differently
+# is not matched and falls back to the full parse.
+_FAST_PATTERNS: dict[str, Pattern[bytes]] = {
+    "aID": re.compile(
+        r"<dt[^>]*>オークションID</dt>\s*<dd class=\"ProductDetail__description\">"
+        r"<span class=\"ProductDetail__bullet\">：</span>([0-9A-Za-z]+)</dd>".encode()
+    ),
+    "title": re.compile(rb"<h1 class=\"ProductTitle__text\">([^<]*)</h1>"),
+    "count_bid": re.compile(r"<dt[^>]*>入札件数</dt>\s*<dd class=\"Count__number\">(\d+)<".encode()),
+    "count_access": re.compile(
+        rb"<span class=\"[^\"]*\bStatisticsInfo__term--access\b[^\"]*\">[^<]*</span>\s*"
+        rb"<span class=\"StatisticsInfo__data\">(\d+)</span>"
+    ),
+    "count_watch": re.compile(
+        rb"<span class=\"[^\"]*\bStatisticsInfo__term--watch\b[^\"]*\">[^<]*</span>\s*"
+        rb"<span class=\"StatisticsInfo__data\">(\d+)</span>"
+    ),
+}
+FAST_FIELDS: tuple[str, ...] = tuple(_FAST_PATTERNS)
+
+
+def _get_terms(tag: bs4.element.Tag) -> list[str]:
+    if tag.name == "dt":
+        return [str(tag.string)] if tag.string is not None else []
+    if tag.name == "a":
+        ylk = str(tag.get("data-ylk", ""))
+        return [term for term in _YLK_TERMS if ylk.startswith(term)]
+    return [str(cls) for cls in tag.get_attribute_list("class") if cls]
+
+
+def _get_fields(soup: bs4.BeautifulSoup) -> dict[str, Any]:
+    found: dict[str, Optional[bs4.element.Tag]] = {}
+    for tag in soup.find_all(_TERM_TAGS):
+        for term in _get_terms(tag):
+            spec = _FIELD_SPECS_BY_TERM.get((tag.name, term))
+            if spec is None or spec.name in found:
+                continue
+            if spec.sibling:
+                found[spec.name] = tag.find_next_sibling(_SIBLING_TAGS[spec.tag], attrs={"class": spec.sibling})
+            else:
+                found[spec.name] = tag
+    fields: dict[str, Any] = {}
+    for spec in _FIELD_SPECS:
+        value = found.get(spec.name)
+        if isinstance(value, bs4.element.Tag):
+            fields[spec.name] = spec.convert(str(value.text))
+        else:
+            fields[spec.name] = spec.default  # pragma: no cover
+    return fields
 
 
-def _get_end_datetime(soup: bs4.BeautifulSoup) -> datetime:
-    tags: Tags = list(soup.find_all("dt", text="終了日時"))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        tag = tags[0].find_next_sibling("dd", attrs={"class": "ProductDetail__description"})
-        if isinstance(tag, bs4.element.Tag):
-            return _from_yahoo_datetime(tag.text[1:])
-    return datetime(2000, 1, 1)  # pragma: no cover
-
-
-def _get_refundable(soup: bs4.BeautifulSoup) -> bool:
-    tags: Tags = list(soup.find_all("dt", text="返品"))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        tag = tags[0].find_next_sibling("dd", attrs={"class": "ProductDetail__description"})
-        if isinstance(tag, bs4.element.Tag):
-            return bool(tag.text[1:] != "返品不可")
-    return False  # pragma: no cover
-
-
-def _get_startprice(soup: bs4.BeautifulSoup) -> str:
-    tags: Tags = list(soup.find_all("dt", text="開始価格"))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        tag = tags[0].find_next_sibling("dd", attrs={"class": "ProductDetail__description"})
-        if isinstance(tag, bs4.element.Tag):
-            return str(tag.text[1:])
-    return ""  # pragma: no cover
-
-
-def _get_timeleft(soup: bs4.BeautifulSoup) -> str:
-    tags: Tags = list(soup.find_all("dt", text="残り時間"))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        tag = tags[0].find_next_sibling("dd", attrs={"class": "Count__number"})
-        if isinstance(tag, bs4.element.Tag):
-            return str(tag.text.splitlines()[0])
-    return ""  # pragma: no cover
-
-
-def _get_count_bid(soup: bs4.BeautifulSoup) -> int:
-    tags: Tags = list(soup.find_all("dt", text="入札件数"))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        tag = tags[0].find_next_sibling("dd", attrs={"class": "Count__number"})
-        if isinstance(tag, bs4.element.Tag):
-            return int(tag.text[:-4])
-    return 0  # pragma: no cover
-
-
-def _get_count_access(soup: bs4.BeautifulSoup) -> int:
-    tags: Tags = list(soup.find_all("span", {"class": "StatisticsInfo__term--access"}))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        tag = tags[0].find_next_sibling("span", attrs={"class": "StatisticsInfo__data"})
-        if isinstance(tag, bs4.element.Tag):
-            return int(tag.text)
-    return 0  # pragma: no cover
-
-
-def _get_count_watch(soup: bs4.BeautifulSoup) -> int:
-    tags: Tags = list(soup.find_all("span", {"class": "StatisticsInfo__term--watch"}))
-    if len(tags) > 0 and isinstance(tags[0], bs4.element.Tag):
-        tag = tags[0].find_next_sibling("span", attrs={"class": "StatisticsInfo__data"})
-        if isinstance(tag, bs4.element.Tag):
-            return int(tag.text)
-    return 0  # pragma: no cover
+@dataclasses.dataclass
+class _ListingPage:
+    urls: list[str]
+    next_page_url: str
+    total: int
 
 
-def _get_urls(source_url: str, cookies: dict[str, str], pattern: Pattern[str], timeout: int = 60) -> list[str]:
-    response: requests.Response = requests.get(source_url, cookies=cookies, timeout=timeout)
-    response.raise_for_status()
-    soup = bs4.BeautifulSoup(response.content, "lxml")
+def _parse_listing_page(content: bytes, pattern: Pattern[str]) -> _ListingPage:
+    soup = bs4.BeautifulSoup(content, "lxml")
     urls: list[str] = []
     for tag in soup.find_all("a", attrs={"data-ylk": pattern}):
-        try:
-            urls.append(tag.get("href"))
-        except Exception:
-            continue
-    if next_page_url := _get_next_page_url(soup):
-        urls.extend(_get_urls(next_page_url, cookies, pattern, timeout))
-    return urls
+        if href := tag.get("href"):
+            urls.append(str(href))
+    return _ListingPage(urls, _get_next_page_url(soup), _get_total_count(soup))
 
 
 def _get_next_page_url(soup: bs4.BeautifulSoup) -> str:
@@ -185,37 +325,555 @@ def _get_next_page_url(soup: bs4.BeautifulSoup) -> str:
     return ""
 
 
-def get_selling_urls(cookies: dict[str, str], timeout: int = 60) -> list[str]:
-    url: str = "https://auctions.yahoo.co.jp/openuser/jp/show/mystatus?select=selling"
-    pattern: Pattern[str] = re.compile(r"^rsec:itm;slk:tc;")
-    return _get_urls(url, cookies, pattern, timeout)
-
-
-def get_infos(cookies: dict[str, str], timeout: int = 60) -> list[SellingItemInfo]:
-    selling_urls: list[str] = get_selling_urls(cookies, timeout=timeout)
-    logger.info(f"{len(selling_urls)} items are selling")
-    selling_infos: list[SellingItemInfo] = []
-    with cf.ThreadPoolExecutor() as executor:
-        submit: Callable[[Any], cf.Future[requests.Response]] = lambda url: executor.submit(
-            requests.get, url, cookies=cookies, timeout=timeout
-        )
-        futures: list[cf.Future[requests.Response]] = list(cf.as_completed(submit(url) for url in selling_urls))
-    for fut in futures:
-        if err := fut.exception():  # pragma: no cover
-            logger.error(err, exc_info=True)
-            continue
-        info: SellingItemInfo = SellingItemInfo.from_soup(
-            bs4.BeautifulSoup(fut.result().content, "lxml")
-        )
-        if info.aID:
-            selling_infos.append(info)
-    return selling_infos
+def _get_total_count(soup: bs4.BeautifulSoup) -> int:
+    if text := soup.find(string=TOTAL_COUNT_PATTERN):
+        if match := TOTAL_COUNT_PATTERN.search(str(text)):
+            return int(match.group(1).replace(",", ""))
+    return 0
+
+
+def _get_page_urls(url: str, page: _ListingPage) -> list[str]:
+    """
+    Build the URLs of the listing pages following `page`, the page of `url`.
+
+    The query parameter of the next page link that differs from `url` is taken as the page number
+    or the offset of the first item, and is extrapolated to cover `page.total` items.
+    A page number is preferred to a 1-based offset, and a 1-based offset to a 0-based one, which may as well be
+    the number of the items per page. The items listed by the pages are to be checked against `page.total`.
+    An empty list is returned when the URLs cannot be determined.
+    """
+    page_size = len(page.urls)
+    if not page.next_page_url or page.total <= page_size or page_size == 0:
+        return []
+    current = dict(parse.parse_qsl(parse.urlsplit(url).query))
+    next_url = parse.urlsplit(page.next_page_url)
+    query = parse.parse_qsl(next_url.query, keep_blank_values=True)
+    n_pages = -(-page.total // page_size)
+    guesses = [(2, 1), (page_size + 1, page_size), (page_size, page_size)]  # second page value and step
+    for start, step in guesses:
+        for i, (key, value) in enumerate(query):
+            if value != str(start) or current.get(key) == value:
+                continue
+            return [
+                parse.urlunsplit(next_url._replace(
+                    query=parse.urlencode(query[:i] + [(key, str(start + step * k))] + query[i + 1:])
+                ))
+                for k in range(n_pages - 1)
+            ]
+    return []
+
+
+def get_aID_from_url(url: str) -> str:
+    """
+    aID of the item page at `url`, which is the last segment of its path.
+    """
+    return parse.urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1] or url
+
+
+def _unique_by_aID(urls: list[str], aIDs: set[str]) -> Iterator[str]:
+    for url in urls:
+        if (aID := get_aID_from_url(url)) not in aIDs:
+            aIDs.add(aID)
+            yield url
+
+
+def _listed_all(page: _ListingPage, aIDs: set[str]) -> bool:
+    # Whether the guessed listing pages following `page` listed all its items, or the next links are to be followed.
+    if len(aIDs) >= page.total:
+        return True
+    logger.warning(
+        f"Only {len(aIDs)} of {page.total} items are listed by the guessed listing pages, "
+        "following the next page links"
+    )
+    metrics.inc("listing_fallback_total")
+    return False
+
+
+def _get_listing_page(client: transport.Transport, url: str) -> _ListingPage:
+    with metrics.timer("listing_fetch_seconds"):
+        content = client.get(url).content
+    return _parse_listing_page(content, ITEM_LINK_PATTERN)
+
+
+def _get_item_page(client: transport.Transport, url: str) -> tuple[str, bytes]:
+    with metrics.timer("item_fetch_seconds"):
+        content: bytes = client.get(url).content
+    return url, content
+
+
+def _archive_page(writer: Optional[archive.Writer], url: str, content: bytes) -> bytes:
+    if writer is not None:
+        writer.add(get_aID_from_url(url), url, content)
+    return content
+
+
+def iter_selling_urls(
+    cookies: dict[str, str],
+    timeout: int = 60,
+    client: Optional[transport.Transport] = None
+) -> Iterator[str]:
+    """
+    Crawl the listing pages of the selling items, yielding the item URLs of each page as soon as it is fetched.
+
+    The total number of the items is read from the first page, and the other pages are fetched concurrently.
+    The next page links are followed one by one when the URLs of the pages cannot be determined,
+    or when the pages fetched concurrently list fewer items than the total.
+    The URLs of the same aID are yielded only once even if the item moves between the pages.
+
+    Parameters
+    ----------
+    cookies : dict[str, str]
+        Cookies of the seller.
+    timeout : int
+        Timeout of each request in seconds.
+    client : transport.Transport, optional
+        Transport sending the requests, whose pool size is the number of the concurrent requests.
+        A transport with `cookies` and `timeout` is used if not given.
+
+    Yields
+    ------
+    str
+        URL of a selling item.
+    """
+    with contextlib.ExitStack() as stack:
+        if client is None:
+            client = stack.enter_context(transport.Transport(cookies, read_timeout=timeout))
+        aIDs: set[str] = set()
+        page = _get_listing_page(client, SELLING_URL)
+        yield from _unique_by_aID(page.urls, aIDs)
+        if page_urls := _get_page_urls(SELLING_URL, page):
+            logger.debug(f"fetching {len(page_urls)} listing pages concurrently")
+            executor = stack.enter_context(cf.ThreadPoolExecutor(client.pool_size))
+            futures = [executor.submit(_get_listing_page, client, url) for url in page_urls]
+            for fut in cf.as_completed(futures):
+                yield from _unique_by_aID(fut.result().urls, aIDs)
+            if _listed_all(page, aIDs):
+                return
+        while page.next_page_url:
+            page = _get_listing_page(client, page.next_page_url)
+            yield from _unique_by_aID(page.urls, aIDs)
+
+
+def get_selling_urls(
+    cookies: dict[str, str],
+    timeout: int = 60,
+    client: Optional[transport.Transport] = None
+) -> list[str]:
+    return list(iter_selling_urls(cookies, timeout=timeout, client=client))
+
+
+def iter_infos(
+    cookies: dict[str, str],
+    timeout: int = 60,
+    parse_workers: int = 0,
+    client: Optional[transport.Transport] = None,
+    parser: Optional[cf.Executor] = None,
+    archive_writer: Optional[archive.Writer] = None,
+    requeue: int = 3,
+    fast: bool = False,
+    validate: float = 0.0,
+    journal: Optional[journal.Journal] = None,
+    urls: Optional[Iterable[str]] = None
+) -> Iterator[SellingItemInfo]:
+    """
+    Fetch and parse the selling items, yielding each item as soon as its page is parsed.
+
+    The listing pages are followed in the background and each item is fetched as soon as its URL is listed.
+    Each response is handed to the parse stage when it arrives and is released once its page is parsed.
+    An item page failed with a transient error, after the retries of the transport, is put into a retry queue
+    and fetched again after its `Retry-After` or a jittered exponential backoff, up to `requeue` times.
+    An error raised while listing the URLs is raised once the pages already listed are yielded.
+    With the cache of `client`, the fields parsed from an item page are cached with its body, and the page is not
+    parsed again while the server answers 304.
+
+    Parameters
+    ----------
+    cookies : dict[str, str]
+        Cookies of the seller.
+    timeout : int
+        Timeout of each request in seconds.
+    parse_workers : int
+        Number of processes parsing the item pages. The pages are parsed in this process if 0.
+    client : transport.Transport, optional
+        Transport sending the requests, whose pool size is the number of the concurrent requests.
+        A transport with `cookies` and `timeout` is used if not given.
+    parser : concurrent.futures.Executor, optional
+        Executor parsing the item pages, which is kept open by the caller. `parse_workers` is ignored if given.
+    archive_writer : archive.Writer, optional
+        Archive where the raw bytes of each fetched item page are saved if given.
+    requeue : int
+        Number of the times an item page failed with a transient error is fetched again.
+    fast : bool
+        Whether to extract only `FAST_FIELDS` from the raw pages by `extract_counts`, without building a DOM.
+        A page whose fields are not all found is parsed in full.
+    validate : float
+        Ratio of the pages extracted by `fast` which are also parsed in full to compare, where any disagreement
+        is logged and counted in `fast_parse_mismatches_total`.
+    journal : journal.Journal, optional
+        Journal of the run where each item is appended before it is yielded if given.
+        The URLs already in the journal are not fetched, so that an interrupted run is resumed.
+    urls : Iterable[str], optional
+        URLs of the item pages to fetch instead of the selling items listed by `iter_selling_urls`.
+
+    Yields
+    ------
+    SellingItemInfo
+        Information of a selling item, in the order the pages are parsed.
+    """
+    done: queue.Queue[tuple[str, Any]] = queue.Queue()
+    retry_queue: list[tuple[float, str]] = []  # heap of the times to fetch again and the URLs
+    requeued: dict[str, int] = {}
+    fetching: dict[cf.Future[tuple[str, bytes]], str] = {}
+    parsing: dict[cf.Future[_Parsed], str] = {}
+    list_error: Optional[BaseException] = None
+    parse_key = f"{'fast' if fast else 'full'}.v{PARSER_VERSION}"
+    with contextlib.ExitStack() as stack:
+        if client is None:
+            client = stack.enter_context(transport.Transport(cookies, read_timeout=timeout))
+        lister = stack.enter_context(cf.ThreadPoolExecutor(1))
+        fetcher = stack.enter_context(cf.ThreadPoolExecutor(client.pool_size))
+        if parser is None and parse_workers > 0:
+            parser = stack.enter_context(cf.ProcessPoolExecutor(parse_workers))
+
+        def list_urls(client: transport.Transport) -> int:
+            count = 0
+            for url in iter_selling_urls(cookies, timeout=timeout, client=client) if urls is None else urls:
+                done.put(("url", url))
+                count += 1
+            return count
+
+        def fetch(client: transport.Transport, url: str) -> None:
+            fut = fetcher.submit(_get_item_page, client, url)
+            fetching[fut] = url
+            fut.add_done_callback(lambda fut: done.put(("fetch", fut)))
+
+        lister.submit(list_urls, client).add_done_callback(lambda fut: done.put(("list", fut)))
+        pending = 1
+        while pending:
+            try:
+                stage, fut = done.get(timeout=max(0.0, retry_queue[0][0] - time.monotonic()) if retry_queue else None)
+            except queue.Empty:
+                fetch(client, heapq.heappop(retry_queue)[1])
+                continue
+            if stage == "url":
+                if journal is not None and fut in journal.done:
+                    metrics.inc("resumed_total")
+                    continue
+                fetch(client, fut)
+                pending += 1
+                continue
+            pending -= 1
+            if stage == "list":
+                if err := fut.exception():
+                    list_error = err
+                elif urls is None:
+                    logger.info(f"{fut.result()} items are selling")
+                continue
+            url = fetching.pop(fut, "") or parsing.pop(fut, "")
+            if err := fut.exception():
+                attempt = requeued.get(url, 0)
+                if stage == "fetch" and attempt < requeue and transport.is_transient(err):
+                    delay = transport.retry_after(err) or random.uniform(0, REQUEUE_BACKOFF * 2 ** attempt)
+                    requeued[url] = attempt + 1
+                    heapq.heappush(retry_queue, (time.monotonic() + delay, url))
+                    pending += 1
+                    metrics.inc("requeued_total")
+                    logger.warning(f"Fetching {url} again in {delay:.3g} [sec] after {err!r}")
+                    continue
+                metrics.inc("errors_total", stage=stage)
+                logger.error(err, exc_info=True)
+                continue
+            cached = None
+            if stage == "fetch":
+                content = _archive_page(archive_writer, *fut.result())
+                cached = client.cache.parsed(url, parse_key, client.account) if client.cache is not None else None
+                if cached is None and parser is not None:
+                    parse_fut = parser.submit(_parse_item_page_timed, content, fast, validate)
+                    parsing[parse_fut] = url
+                    parse_fut.add_done_callback(lambda fut: done.put(("parse", fut)))
+                    pending += 1
+                    continue
+            if cached is not None:
+                info = SellingItemInfo.from_dict(cached)
+                metrics.inc("parse_reused_total")
+            else:
+                parsed = _parse_item_page_timed(content, fast, validate) if stage == "fetch" else fut.result()
+                info = _observe_parse(parsed)
+                if client.cache is not None and info.aID:
+                    client.cache.set_parsed(url, parse_key, info.to_dict(), client.account)
+            del fut
+            if info.aID:
+                if journal is not None:
+                    journal.add(url, info)
+                yield info
+        if list_error is not None:
+            raise list_error
+
+
+def get_infos(
+    cookies: dict[str, str],
+    timeout: int = 60,
+    parse_workers: int = 0,
+    client: Optional[transport.Transport] = None,
+    parser: Optional[cf.Executor] = None,
+    archive_writer: Optional[archive.Writer] = None,
+    requeue: int = 3,
+    fast: bool = False,
+    validate: float = 0.0,
+    journal: Optional[journal.Journal] = None,
+    urls: Optional[Iterable[str]] = None
+) -> list[SellingItemInfo]:
+    return list(iter_infos(
+        cookies,
+        timeout=timeout,
+        parse_workers=parse_workers,
+        client=client,
+        parser=parser,
+        archive_writer=archive_writer,
+        requeue=requeue,
+        fast=fast,
+        validate=validate,
+        journal=journal,
+        urls=urls
+    ))
+
+
+def get_infos_by_account(
+    accounts: dict[str, dict[str, str]],
+    client: transport.Transport,
+    parser: Optional[cf.Executor] = None,
+    archive_writers: Optional[dict[str, archive.Writer]] = None,
+    fast: bool = False,
+    validate: float = 0.0,
+    journals: Optional[dict[str, journal.Journal]] = None
+) -> dict[str, list[SellingItemInfo]]:
+    """
+    Fetch and parse the selling items of many sellers concurrently.
+
+    Each seller is collected in its own thread by `client.with_cookies`, so that all the sellers share
+    the connection pool and the rate limit of `client`, and the total time is bound by the rate limit
+    rather than by the number of the sellers. A seller whose collection fails is logged and left out.
+
+    Parameters
+    ----------
+    accounts : dict[str, dict[str, str]]
+        Cookies of each seller by the name of the seller.
+    client : transport.Transport
+        Transport whose connection pool and rate limit are shared by the sellers.
+    parser : concurrent.futures.Executor, optional
+        Executor parsing the item pages of all the sellers, or the pages are parsed in the thread of each seller.
+    archive_writers : dict[str, archive.Writer], optional
+        Archive of the raw item pages of each seller by the name of the seller.
+    fast : bool
+        Whether to extract only `FAST_FIELDS`, as in `iter_infos`.
+    validate : float
+        Ratio of the pages extracted by `fast` which are also parsed in full to compare, as in `iter_infos`.
+    journals : dict[str, journal.Journal], optional
+        Journal of the run of each seller by the name of the seller, as in `iter_infos`.
+
+    Returns
+    -------
+    dict[str, list[SellingItemInfo]]
+        Information of the selling items fetched in this run of each seller by the name of the seller.
+    """
+    archive_writers = archive_writers or {}
+    journals = journals or {}
+
+    def collect(name: str) -> list[SellingItemInfo]:
+        with client.with_cookies(accounts[name]) as account_client:
+            infos = get_infos(
+                accounts[name],
+                client=account_client,
+                parser=parser,
+                archive_writer=archive_writers.get(name),
+                fast=fast,
+                validate=validate,
+                journal=journals.get(name)
+            )
+        logger.info(f"{len(infos)} items of {name} are collected")
+        return infos
+
+    infos_by_account: dict[str, list[SellingItemInfo]] = {}
+    with cf.ThreadPoolExecutor(max(1, len(accounts))) as executor:
+        futures = {name: executor.submit(collect, name) for name in accounts}
+        for name, fut in futures.items():
+            if err := fut.exception():
+                metrics.inc("errors_total", stage="account")
+                logger.error(f"Failed to collect the items of {name}: {err!r}")
+                continue
+            infos_by_account[name] = fut.result()
+    return infos_by_account
+
+
+async def _iter_selling_urls_async(client: transport.AsyncTransport) -> AsyncIterator[str]:
+    async def get_listing_page(url: str) -> _ListingPage:
+        with metrics.timer("listing_fetch_seconds"):
+            content = await client.get(url)
+        return _parse_listing_page(content, ITEM_LINK_PATTERN)
+
+    aIDs: set[str] = set()
+    page = await get_listing_page(SELLING_URL)
+    for url in _unique_by_aID(page.urls, aIDs):
+        yield url
+    if page_urls := _get_page_urls(SELLING_URL, page):
+        logger.debug(f"fetching {len(page_urls)} listing pages concurrently")
+        tasks = [asyncio.ensure_future(get_listing_page(url)) for url in page_urls]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                for url in _unique_by_aID((await fut).urls, aIDs):
+                    yield url
+        finally:
+            for task in tasks:
+                task.cancel()
+        if _listed_all(page, aIDs):
+            return
+    while page.next_page_url:
+        page = await get_listing_page(page.next_page_url)
+        for url in _unique_by_aID(page.urls, aIDs):
+            yield url
+
+
+async def iter_infos_async(
+    cookies: dict[str, str],
+    timeout: int = 60,
+    parse_workers: int = 0,
+    client: Optional[transport.AsyncTransport] = None,
+    archive_writer: Optional[archive.Writer] = None,
+    requeue: int = 3,
+    fast: bool = False,
+    validate: float = 0.0,
+    journal: Optional[journal.Journal] = None
+) -> AsyncIterator[SellingItemInfo]:
+    """
+    Fetch and parse the selling items with asyncio, yielding each item as soon as its page is parsed.
+
+    This is the asyncio version of `iter_infos`, which needs the optional dependency `aiohttp`.
+    The item pages failed with a transient error are fetched again as in `iter_infos`.
+    The pages and their parses are not cached, since `transport.AsyncTransport` sends no conditional requests.
+
+    Parameters
+    ----------
+    cookies : dict[str, str]
+        Cookies of the seller.
+    timeout : int
+        Timeout of each request in seconds.
+    parse_workers : int
+        Number of processes parsing the item pages. The pages are parsed in the event loop if 0.
+    client : transport.AsyncTransport, optional
+        Entered transport sending the requests, which bounds the number of the in-flight requests.
+        A transport with `cookies` and `timeout` is used if not given.
+    archive_writer : archive.Writer, optional
+        Archive where the raw bytes of each fetched item page are saved if given.
+    requeue : int
+        Number of the times an item page failed with a transient error is fetched again, as in `iter_infos`.
+    fast : bool
+        Whether to extract only `FAST_FIELDS`, as in `iter_infos`.
+    validate : float
+        Ratio of the pages extracted by `fast` which are also parsed in full to compare, as in `iter_infos`.
+    journal : journal.Journal, optional
+        Journal of the run, as in `iter_infos`.
+
+    Yields
+    ------
+    SellingItemInfo
+        Information of a selling item, in the order the pages are parsed.
+    """
+    async with contextlib.AsyncExitStack() as stack:
+        if client is None:
+            client = await stack.enter_async_context(transport.AsyncTransport(cookies, read_timeout=timeout))
+        parser = stack.enter_context(cf.ProcessPoolExecutor(parse_workers)) if parse_workers > 0 else None
+        loop = asyncio.get_running_loop()
+        done: asyncio.Queue[asyncio.Future[Any]] = asyncio.Queue()
+        tasks: list[asyncio.Future[Any]] = []
+
+        def submit(coro: Coroutine[Any, Any, Any]) -> asyncio.Future[Any]:
+            task = asyncio.ensure_future(coro)
+            task.add_done_callback(done.put_nowait)
+            tasks.append(task)
+            return task
+
+        async def fetch(client: transport.AsyncTransport, url: str, attempt: int = 0) -> SellingItemInfo:
+            try:
+                with metrics.timer("item_fetch_seconds"):
+                    content = await client.get(url)
+            except Exception as err:
+                if attempt >= requeue or not client.is_transient(err):
+                    raise
+                delay = client.retry_after(err) or random.uniform(0, REQUEUE_BACKOFF * 2 ** attempt)
+                metrics.inc("requeued_total")
+                logger.warning(f"Fetching {url} again in {delay:.3g} [sec] after {err!r}")
+                await asyncio.sleep(delay)
+                return await fetch(client, url, attempt + 1)
+            _archive_page(archive_writer, url, content)
+            if parser is not None:
+                info = _observe_parse(
+                    await loop.run_in_executor(parser, _parse_item_page_timed, content, fast, validate)
+                )
+            else:
+                info = _observe_parse(_parse_item_page_timed(content, fast, validate))
+            if info.aID and journal is not None:
+                journal.add(url, info)
+            return info
+
+        async def list_urls(client: transport.AsyncTransport) -> int:
+            count = 0
+            async for url in _iter_selling_urls_async(client):
+                count += 1
+                if journal is not None and url in journal.done:
+                    metrics.inc("resumed_total")
+                    continue
+                submit(fetch(client, url))
+            return count
+
+        lister = submit(list_urls(client))
+        consumed = 0
+        try:
+            while consumed < len(tasks):
+                task = await done.get()
+                consumed += 1
+                if task is lister:
+                    logger.info(f"{task.result()} items are selling")
+                    continue
+                if err := task.exception():
+                    metrics.inc("errors_total", stage="fetch")
+                    logger.error(err, exc_info=True)
+                    continue
+                info: SellingItemInfo = task.result()
+                if info.aID:
+                    yield info
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def get_infos_async(
+    cookies: dict[str, str],
+    timeout: int = 60,
+    parse_workers: int = 0,
+    client: Optional[transport.AsyncTransport] = None,
+    archive_writer: Optional[archive.Writer] = None,
+    requeue: int = 3,
+    fast: bool = False,
+    validate: float = 0.0,
+    journal: Optional[journal.Journal] = None
+) -> list[SellingItemInfo]:
+    infos = iter_infos_async(
+        cookies,
+        timeout=timeout,
+        parse_workers=parse_workers,
+        client=client,
+        archive_writer=archive_writer,
+        requeue=requeue,
+        fast=fast,
+        validate=validate,
+        journal=journal
+    )
+    return [info async for info in infos]
 
 
 if __name__ == "__main__":  # pragma: no cover
     import pprint
     import json
-    import time
 
     with open("cookies.json") as f:
         cookies = {cookie["name"]: cookie["value"] for cookie in json.load(f)}